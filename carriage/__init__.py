@@ -2,16 +2,17 @@
 import warnings
 
 from .array import Array
+from .asyncstream import AsyncStream
 from .lambda_ import X, Xcall
 from .map import Map
 from .optional import (Err, ErrAttrError, Nothing, NothingAttrError, Ok,
                        OkAttrError, Optional, Result, Some)
-from .row import Row
+from .row import Row, Schema
 from .stream import Stream
 from .streamtable import StreamTable
 
-__all__ = ['Row', 'Map', 'Stream', 'Array', 'Xcall', 'X',
-           'Optional', 'Some', 'Nothing', 'StreamTable',
+__all__ = ['Row', 'Schema', 'Map', 'Stream', 'AsyncStream', 'Array',
+           'Xcall', 'X', 'Optional', 'Some', 'Nothing', 'StreamTable',
            'Ok', 'Err', 'Result', 'NothingAttrError', 'OkAttrError',
            'ErrAttrError'
            ]
@@ -0,0 +1,535 @@
+import builtins
+import copy
+import functools as fnt
+
+from .columnar import (RecordBatch, evaluate, max_column, min_column,
+                       sum_column)
+from .row import Row
+from .sketch import HeavyHitters, HyperLogLog, QuantileSketch
+
+
+class Aggregator:
+    '''Incrementally aggregate elements into a single value.
+
+    An aggregator doesn't hold any state itself. It creates an
+    accumulating state, adds elements into the state one by one, and gets
+    the result from the state at the end. States of the same aggregator
+    can be merged, so partial aggregations can be combined.
+
+    >>> agg = Sum()
+    >>> state = agg.create()
+    >>> for elem in [1, 2, 3]:
+    ...     state = agg.add(state, elem)
+    >>> agg.result(state)
+    6
+
+    Parameters
+    ----------
+    key : function
+        if given, aggregate ``key(elem)`` instead of elements
+    '''
+    __slots__ = 'key',
+
+    def __init__(self, key=None):
+        self.key = key
+
+    def create(self):
+        raise NotImplementedError()
+
+    def add(self, state, elem):
+        raise NotImplementedError()
+
+    def add_batch(self, state, elems):
+        '''Add a batch of elements, like a list or a RecordBatch, at once.
+        Elements are added one by one unless a subclass works on whole
+        columns.'''
+        for elem in elems:
+            state = self.add(state, elem)
+        return state
+
+    def _keys(self, elems):
+        '''Get the column of keys of a batch of elements, or the elements
+        if there's no key'''
+        if self.key is None:
+            return elems
+        if isinstance(elems, RecordBatch):
+            return evaluate(self.key, elems)
+        return list(map(self.key, elems))
+
+    def merge(self, state, other_state):
+        raise NotImplementedError()
+
+    def result(self, state):
+        return state
+
+    def __repr__(self):
+        if self.key is None:
+            return f'{type(self).__name__}()'
+        return f'{type(self).__name__}(key={self.key!r})'
+
+
+class Count(Aggregator):
+    '''Count elements
+
+    >>> aggregate([3, 4, 5], n=Count())
+    Row(n=3)
+    '''
+    __slots__ = ()
+
+    def create(self):
+        return 0
+
+    def add(self, state, elem):
+        return state + 1
+
+    def add_batch(self, state, elems):
+        return state + len(elems)
+
+    def merge(self, state, other_state):
+        return state + other_state
+
+
+class Sum(Aggregator):
+    '''Sum elements
+
+    >>> aggregate([3, 4, 5], total=Sum())
+    Row(total=12)
+    '''
+    __slots__ = ()
+
+    def create(self):
+        return 0
+
+    def add(self, state, elem):
+        if self.key is not None:
+            elem = self.key(elem)
+        return state + elem
+
+    def add_batch(self, state, elems):
+        values = self._keys(elems)
+        return state + sum_column(values)
+
+    def merge(self, state, other_state):
+        return state + other_state
+
+
+class Mean(Aggregator):
+    '''Average of elements. None if there's no element.
+
+    >>> aggregate([3, 4, 5], avg=Mean())
+    Row(avg=4.0)
+    '''
+    __slots__ = ()
+
+    def create(self):
+        return [0, 0]
+
+    def add(self, state, elem):
+        if self.key is not None:
+            elem = self.key(elem)
+        state[0] += 1
+        state[1] += elem
+        return state
+
+    def add_batch(self, state, elems):
+        values = self._keys(elems)
+        state[0] += len(values)
+        state[1] += sum_column(values)
+        return state
+
+    def merge(self, state, other_state):
+        return [state[0] + other_state[0], state[1] + other_state[1]]
+
+    def result(self, state):
+        count, total = state
+        if count == 0:
+            return None
+        return total / count
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return '<missing>'
+
+
+_missing = _Missing()
+
+
+class Min(Aggregator):
+    '''Minimum of elements. ``default`` if there's no element.
+
+    >>> aggregate([3, 4, 5], lo=Min())
+    Row(lo=3)
+    >>> aggregate(['a', 'bbb', 'cc'], shortest=Min(key=len))
+    Row(shortest=1)
+    '''
+    __slots__ = 'default',
+
+    def __init__(self, key=None, default=None):
+        super().__init__(key)
+        self.default = default
+
+    def create(self):
+        return _missing
+
+    def add(self, state, elem):
+        if self.key is not None:
+            elem = self.key(elem)
+        if state is _missing or elem < state:
+            return elem
+        return state
+
+    def add_batch(self, state, elems):
+        values = self._keys(elems)
+        if len(values) == 0:
+            return state
+        return self.merge(state, min_column(values))
+
+    def merge(self, state, other_state):
+        if other_state is _missing:
+            return state
+        if state is _missing or other_state < state:
+            return other_state
+        return state
+
+    def result(self, state):
+        return self.default if state is _missing else state
+
+
+class Max(Min):
+    '''Maximum of elements. ``default`` if there's no element.
+
+    >>> aggregate([3, 4, 5], hi=Max())
+    Row(hi=5)
+    '''
+    __slots__ = ()
+
+    def add(self, state, elem):
+        if self.key is not None:
+            elem = self.key(elem)
+        if state is _missing or elem > state:
+            return elem
+        return state
+
+    def add_batch(self, state, elems):
+        values = self._keys(elems)
+        if len(values) == 0:
+            return state
+        return self.merge(state, max_column(values))
+
+    def merge(self, state, other_state):
+        if other_state is _missing:
+            return state
+        if state is _missing or other_state > state:
+            return other_state
+        return state
+
+
+class CountDistinct(Aggregator):
+    '''Count distinct elements exactly. It takes memory proportional to
+    the number of distinct elements.
+
+    >>> aggregate([3, 4, 3], uniq=CountDistinct())
+    Row(uniq=2)
+    '''
+    __slots__ = ()
+
+    def create(self):
+        return set()
+
+    def add(self, state, elem):
+        if self.key is not None:
+            elem = self.key(elem)
+        state.add(elem)
+        return state
+
+    def add_batch(self, state, elems):
+        values = self._keys(elems)
+        state.update(values)
+        return state
+
+    def merge(self, state, other_state):
+        return state | other_state
+
+    def result(self, state):
+        return len(state)
+
+
+class Reduce(Aggregator):
+    '''Reduce elements with an associative function of two arguments,
+    starting from a copy of the initial value.
+
+    The initial value is only folded in by ``result``, so merging the
+    states of shards doesn't apply it more than once.
+
+    >>> aggregate([3, 4, 5], product=Reduce(lambda a, b: a * b, 1))
+    Row(product=60)
+    '''
+    __slots__ = 'func', 'initial'
+
+    def __init__(self, func, initial, key=None):
+        super().__init__(key)
+        self.func = func
+        self.initial = initial
+
+    def create(self):
+        return _missing
+
+    def add(self, state, elem):
+        if self.key is not None:
+            elem = self.key(elem)
+        if state is _missing:
+            return elem
+        return self.func(state, elem)
+
+    def add_batch(self, state, elems):
+        values = self._keys(elems)
+        if len(values) == 0:
+            return state
+        if state is _missing:
+            return fnt.reduce(self.func, values)
+        return fnt.reduce(self.func, values, state)
+
+    def merge(self, state, other_state):
+        if other_state is _missing:
+            return state
+        if state is _missing:
+            return other_state
+        return self.func(state, other_state)
+
+    def result(self, state):
+        initial = copy.deepcopy(self.initial)
+        if state is _missing:
+            return initial
+        return self.func(initial, state)
+
+    def __repr__(self):
+        return (f'{type(self).__name__}'
+                f'({self.func!r}, {self.initial!r})')
+
+
+class ApproxCountDistinct(Aggregator):
+    '''Estimate the number of distinct elements by a HyperLogLog of
+    ``2 ** precision`` bytes.
+
+    >>> aggregate(range(1000), uniq=ApproxCountDistinct(precision=10))
+    Row(uniq=970)
+    '''
+    __slots__ = 'precision',
+
+    def __init__(self, precision=14, key=None):
+        super().__init__(key)
+        self.precision = precision
+
+    def create(self):
+        return HyperLogLog(self.precision)
+
+    def add(self, state, elem):
+        if self.key is not None:
+            elem = self.key(elem)
+        return state.add(elem)
+
+    def add_batch(self, state, elems):
+        values = self._keys(elems)
+        return state.update(values)
+
+    def merge(self, state, other_state):
+        return state.merge(other_state)
+
+    def result(self, state):
+        return state.count()
+
+
+class ApproxValueCounts(Aggregator):
+    '''Estimate counts of the top_k most frequent elements by a Count-Min
+    sketch of ``width * depth`` counters. The result is a Map from the most
+    frequent element.
+
+    >>> aggregate('abracadabra', top=ApproxValueCounts(top_k=2))
+    Row(top=Map({'a': 5, 'b': 2}))
+    '''
+    __slots__ = 'top_k', 'width', 'depth'
+
+    def __init__(self, top_k=10, width=2048, depth=5, key=None):
+        super().__init__(key)
+        self.top_k = top_k
+        self.width = width
+        self.depth = depth
+
+    def create(self):
+        return HeavyHitters(self.top_k, self.width, self.depth)
+
+    def add(self, state, elem):
+        if self.key is not None:
+            elem = self.key(elem)
+        return state.add(elem)
+
+    def add_batch(self, state, elems):
+        values = self._keys(elems)
+        return state.update(values)
+
+    def merge(self, state, other_state):
+        return state.merge(other_state)
+
+    def result(self, state):
+        from .map import Map
+        return Map(state.most_common())
+
+
+class ApproxQuantiles(Aggregator):
+    '''Estimate quantiles by a KLL sketch keeping ``O(k)`` elements.
+    The result is a list of the estimated quantiles, or None if there's no
+    element.
+
+    >>> aggregate(range(1, 101), pcts=ApproxQuantiles([0.5, 0.9]))
+    Row(pcts=[50, 90])
+    >>> aggregate([], pcts=ApproxQuantiles([0.5, 0.9]))
+    Row(pcts=None)
+    '''
+    __slots__ = 'quantiles', 'k'
+
+    def __init__(self, quantiles, k=200, key=None):
+        super().__init__(key)
+        self.quantiles = quantiles
+        self.k = k
+
+    def create(self):
+        return QuantileSketch(self.k)
+
+    def add(self, state, elem):
+        if self.key is not None:
+            elem = self.key(elem)
+        return state.add(elem)
+
+    def add_batch(self, state, elems):
+        values = self._keys(elems)
+        return state.update(values)
+
+    def merge(self, state, other_state):
+        return state.merge(other_state)
+
+    def result(self, state):
+        if state.count == 0:
+            return None
+        return state.quantiles(self.quantiles)
+
+
+_builtin_aggregators = {
+    builtins.sum: Sum,
+    builtins.len: Count,
+    builtins.min: Min,
+    builtins.max: Max,
+}
+
+
+def to_aggregator(agg):
+    '''Get an Aggregator. The builtin sum, len, min and max are turned into
+    Sum, Count, Min and Max.'''
+    if isinstance(agg, Aggregator):
+        return agg
+    try:
+        return _builtin_aggregators[agg]()
+    except (KeyError, TypeError):
+        raise TypeError(f'{agg!r} is not an Aggregator') from None
+
+
+def aggregate(iterable, **aggregators):
+    '''Aggregate elements of an iterable by multiple aggregators in one
+    pass and get a Row of the results.
+
+    >>> aggregate([3, 4, 5], total=sum, n=len, hi=max, avg=Mean())
+    Row(total=12, n=3, hi=5, avg=4.0)
+    '''
+    names = list(aggregators)
+    aggs = [to_aggregator(agg) for agg in aggregators.values()]
+    states = [agg.create() for agg in aggs]
+    indexed_aggs = list(enumerate(aggs))
+
+    for elem in iterable:
+        for index, agg in indexed_aggs:
+            states[index] = agg.add(states[index], elem)
+
+    return Row.from_values(
+        (agg.result(state) for agg, state in zip(aggs, states)),
+        fields=names)
+
+
+def aggregate_columns(batches, **aggregators):
+    '''Aggregate RecordBatches by multiple aggregators in one pass and
+    get a Row of the results. Each aggregator adds a whole RecordBatch at
+    once by ``Aggregator.add_batch``.
+
+    >>> from carriage.columnar import RecordBatch
+    >>> batches = [RecordBatch.from_columns({'x': [3, 4]}),
+    ...            RecordBatch.from_columns({'x': [5]})]
+    >>> aggregate_columns(batches, n=len, hi=Max(key=lambda row: row.x))
+    Row(n=3, hi=5)
+    '''
+    names = list(aggregators)
+    aggs = [to_aggregator(agg) for agg in aggregators.values()]
+    states = [agg.create() for agg in aggs]
+    indexed_aggs = list(enumerate(aggs))
+
+    for batch in batches:
+        for index, agg in indexed_aggs:
+            states[index] = agg.add_batch(states[index], batch)
+
+    return Row.from_values(
+        (agg.result(state) for agg, state in zip(aggs, states)),
+        fields=names)
+
+
+def group_aggregate(iterable, key_func, **aggregators):
+    '''Group elements by the key function and aggregate each group by
+    multiple aggregators in one pass. Only a state per aggregator is kept
+    for each key, not the elements.
+
+    >>> group_aggregate(range(10), lambda n: n % 2, total=sum, n=len)
+    {0: Row(total=20, n=5), 1: Row(total=25, n=5)}
+
+    Returns
+    -------
+    dict of key to Row
+    '''
+    names = list(aggregators)
+    aggs = [to_aggregator(agg) for agg in aggregators.values()]
+    indexed_aggs = list(enumerate(aggs))
+
+    key_to_states = {}
+    for elem in iterable:
+        key = key_func(elem)
+        states = key_to_states.get(key)
+        if states is None:
+            states = key_to_states[key] = [agg.create() for agg in aggs]
+        for index, agg in indexed_aggs:
+            states[index] = agg.add(states[index], elem)
+
+    return {
+        key: Row.from_values(
+            (agg.result(state) for agg, state in zip(aggs, states)),
+            fields=names)
+        for key, states in key_to_states.items()}
+
+
+def reduce_by_key(iterable, key_func, zero, combine):
+    '''Group elements by the key function and fold each group with
+    ``combine(accumulator, elem)``, starting from a copy of zero.
+
+    >>> reduce_by_key(['a', 'bb', 'cc'], len, '', lambda acc, s: acc + s)
+    {1: 'a', 2: 'bbcc'}
+
+    Returns
+    -------
+    dict of key to accumulator
+    '''
+    key_to_acc = {}
+    for elem in iterable:
+        key = key_func(elem)
+        try:
+            acc = key_to_acc[key]
+        except KeyError:
+            acc = copy.deepcopy(zero)
+        key_to_acc[key] = combine(acc, elem)
+    return key_to_acc
@@ -630,6 +630,38 @@ class Array(Monad):
             key_to_grp[key(elem)].append(elem)
         return Map(key_to_grp)
 
+    def group_by_agg(self, key_func, **aggregators):
+        '''Group elements by the value of key function and aggregate each
+        group by aggregators in one pass, without building groups.
+
+        >>> Array([1, 2, 3, 4]).group_by_agg(lambda n: n % 2, total=sum)
+        Map({1: Row(total=4), 0: Row(total=6)})
+
+        Returns
+        -------
+        Map[key, Row]
+        '''
+        from .aggregator import group_aggregate
+        from .map import Map
+        return Map(group_aggregate(self._items, key_func, **aggregators))
+
+    def reduce_by_key(self, key_func, zero, combine):
+        '''Group elements by the value of key function and fold each
+        group with a function of two arguments, starting from a copy of
+        zero.
+
+        >>> Array([1, 2, 3, 4]).reduce_by_key(
+        ...     lambda n: n % 2, 1, lambda acc, n: acc * n)
+        Map({1: 3, 0: 8})
+
+        Returns
+        -------
+        Map[key, accumulator]
+        '''
+        from .aggregator import reduce_by_key
+        from .map import Map
+        return Map(reduce_by_key(self._items, key_func, zero, combine))
+
     def accumulate(self, func=None):
         '''Create a new Array of calling ``itertools.accumulate``'''
         return Array(itt.accumulate(self._items, func))
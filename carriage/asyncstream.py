@@ -0,0 +1,580 @@
+import asyncio
+import inspect
+import reprlib
+from collections import deque
+
+from .array import Array
+from .optional import Nothing, Some
+from .pipeline import Pipeline
+from .repr import short_repr
+from .row import KeyValues, Row, ValueIndex
+from .stream import as_stream
+
+
+async def _maybe_await(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+def _to_aiterable(iterable):
+    if hasattr(iterable, '__aiter__'):
+        return iterable
+
+    async def aiterable_gen():
+        for elem in iterable:
+            yield elem
+    return aiterable_gen()
+
+
+async def _aclose(aiterator):
+    aclose = getattr(aiterator, 'aclose', None)
+    if aclose is not None:
+        await aclose()
+
+
+async def _bounded_gather(aiterable, to_awaitable, concurrency):
+    '''Run ``to_awaitable(elem)`` concurrently for elements and yield
+    results in order, with at most concurrency pending tasks.'''
+    if concurrency < 1:
+        raise ValueError('concurrency should be at least 1')
+
+    pending = deque()
+    try:
+        async for elem in aiterable:
+            if len(pending) >= concurrency:
+                yield await pending.popleft()
+            pending.append(asyncio.ensure_future(to_awaitable(elem)))
+
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _map_aiterable(aiterable, func, concurrency):
+    if concurrency == 1:
+        async for elem in aiterable:
+            yield await _maybe_await(func(elem))
+    else:
+        results = _bounded_gather(
+            aiterable, lambda elem: _maybe_await(func(elem)), concurrency)
+        try:
+            async for result in results:
+                yield result
+        finally:
+            await results.aclose()
+
+
+class AsyncStream:
+    '''An asyncio counterpart of Stream for building a lazy-evaluating
+    transformation pipeline over async iterables.
+
+    AsyncStream is initiated by providing any async iterable, or any
+    iterable object.
+
+    >>> async def agen():
+    ...     for n in range(5):
+    ...         yield n
+    >>> astrm = AsyncStream(agen())
+    >>> astrm = AsyncStream(range(5))
+
+    Functions passed to transformations can be either normal functions or
+    coroutine functions. Actions are coroutines.
+
+    >>> async def double(n):
+    ...     return n * 2
+    >>> asyncio.run(AsyncStream(range(5)).map(double).to_list())
+    [0, 2, 4, 6, 8]
+
+    AsyncStream supports ``async for``.
+
+    >>> async def main():
+    ...     async for elem in AsyncStream(range(3)).map(double):
+    ...         print(elem)
+    >>> asyncio.run(main())
+    0
+    2
+    4
+    '''
+    __slots__ = '_iterable', '_pipeline'
+
+    def __init__(self, iterable, *, pipeline=None):
+        '''Create an AsyncStream from any async iterable or iterable object
+
+        Parameters
+        ----------
+        iterable : any async iterable or iterable
+            Input iterable object.
+        '''
+        self._iterable = iterable
+
+        if pipeline is None:
+            pipeline = Pipeline()
+
+        self._pipeline = pipeline
+
+    @classmethod
+    def range(cls, start, end=None, step=1):
+        '''Create an AsyncStream from range.
+
+        >>> asyncio.run(AsyncStream.range(2, 10, 2).to_list())
+        [2, 4, 6, 8]
+        '''
+        if end is None:
+            start, end = 0, start
+
+        return cls(range(start, end, step))
+
+    def __aiter__(self):
+        return self._pipeline.transform(
+            _to_aiterable(self._iterable)).__aiter__()
+
+    @reprlib.recursive_repr()
+    def __repr__(self):
+        if self._pipeline.is_empty():
+            return (f'{type(self).__name__}'
+                    f'({short_repr.repr(self._iterable)})')
+        else:
+            return (f'{type(self).__name__}'
+                    f'({short_repr.repr(self._iterable)}, {self._pipeline!r})')
+
+    @as_stream
+    def map(self, func, concurrency=1):
+        '''Create a new AsyncStream by applying function to each element
+
+        If function returns an awaitable, it will be awaited. At most
+        ``concurrency`` awaitables are evaluated concurrently, and the
+        results keep the order of source elements.
+
+        >>> async def fetch(n):
+        ...     await asyncio.sleep(0.01 * (3 - n))
+        ...     return n * 10
+        >>> asyncio.run(AsyncStream.range(3).map(fetch, concurrency=3).to_list())
+        [0, 10, 20]
+
+        Returns
+        -------
+        AsyncStream
+        '''  # noqa
+
+        def map_tr(aiterable):
+            return _map_aiterable(aiterable, func, concurrency)
+
+        return map_tr
+
+    def starmap(self, func, concurrency=1):
+        '''Create a new AsyncStream by evaluating function using argument
+        tuple from each element. i.e. ``func(*elem)``.
+
+        >>> asyncio.run(AsyncStream([(1, 2), (3, 4)]).starmap(lambda a, b: a + b).to_list())
+        [3, 7]
+        '''  # noqa
+        return self.map(lambda elem: func(*elem), concurrency=concurrency)
+
+    @as_stream
+    def flat_map(self, to_iterable_func, concurrency=1):
+        '''Apply function to each element, then flatten the result.
+
+        Function may return an iterable, an async iterable or an awaitable
+        of iterable.
+
+        >>> asyncio.run(AsyncStream([1, 2, 3]).flat_map(range).to_list())
+        [0, 0, 1, 0, 1, 2]
+
+        Returns
+        -------
+        AsyncStream
+        '''
+        async def flat_map_tr(aiterable):
+            iterables = _map_aiterable(aiterable, to_iterable_func,
+                                       concurrency)
+            async for iterable in iterables:
+                async for elem in _to_aiterable(iterable):
+                    yield elem
+
+        return flat_map_tr
+
+    @as_stream
+    def flatten(self):
+        '''flatten each element
+
+        >>> asyncio.run(AsyncStream([(1, 2), (3, 4)]).flatten().to_list())
+        [1, 2, 3, 4]
+        '''
+        async def flatten_tr(aiterable):
+            async for iterable in aiterable:
+                async for elem in _to_aiterable(iterable):
+                    yield elem
+
+        return flatten_tr
+
+    @as_stream
+    def filter(self, pred):
+        '''Create a new AsyncStream contains only elements passing
+        predicate. Predicate can be a coroutine function.
+
+        >>> asyncio.run(AsyncStream.range(10).filter(lambda n: n % 2 == 0).to_list())
+        [0, 2, 4, 6, 8]
+        '''  # noqa
+        async def filter_tr(aiterable):
+            async for elem in aiterable:
+                if await _maybe_await(pred(elem)):
+                    yield elem
+
+        return filter_tr
+
+    @as_stream
+    def filter_false(self, pred):
+        '''Create a new AsyncStream contains only elements not passing
+        predicate
+
+        >>> asyncio.run(AsyncStream.range(10).filter_false(lambda n: n % 2 == 0).to_list())
+        [1, 3, 5, 7, 9]
+        '''  # noqa
+        async def filter_false_tr(aiterable):
+            async for elem in aiterable:
+                if not await _maybe_await(pred(elem)):
+                    yield elem
+
+        return filter_false_tr
+
+    def pluck(self, key):
+        '''Create a new AsyncStream of values by evaluating ``elem[key]``
+        for each element.
+
+        >>> asyncio.run(AsyncStream([dict(x=3), dict(x=4)]).pluck('x').to_list())
+        [3, 4]
+        '''  # noqa
+        return self.map(lambda d: d[key])
+
+    def pluck_attr(self, attr):
+        '''Create a new AsyncStream of values by evaluating ``elem.attr``
+        of each element.
+
+        >>> asyncio.run(AsyncStream([Row(x=3), Row(x=4)]).pluck_attr('x').to_list())
+        [3, 4]
+        '''  # noqa
+        return self.map(lambda obj: getattr(obj, attr))
+
+    @as_stream
+    def tap(self, tag='', n=5, msg_format='{tag}:{index}: {elem}'):
+        '''A debugging tool. This method create a new AsyncStream with the
+        same elements. While evaluating, it print first n elements.
+
+        >>> asyncio.run(AsyncStream.range(2).tap('orig').to_list())
+        orig:0: 0
+        orig:1: 1
+        [0, 1]
+        '''
+        async def tap_tr(aiterable):
+            index = 0
+            async for elem in aiterable:
+                if index < n:
+                    print(msg_format.format(tag=tag, index=index, elem=elem))
+                index += 1
+                yield elem
+
+        return tap_tr
+
+    @as_stream
+    def slice(self, start, stop, step=None):
+        '''Create an AsyncStream from the slice of items.
+
+        >>> asyncio.run(AsyncStream.range(10).slice(5, 8).to_list())
+        [5, 6, 7]
+        '''
+        for index in (start, stop):
+            if index is not None and index < 0:
+                raise ValueError(
+                    'AsyncStream index should be greater than 0.')
+
+        start_ = 0 if start is None else start
+        step_ = 1 if step is None else step
+
+        async def slice_tr(aiterable):
+            if stop is not None and stop <= start_:
+                return
+            aiterator = aiterable.__aiter__()
+            try:
+                index = 0
+                async for elem in aiterator:
+                    if index >= start_ and (index - start_) % step_ == 0:
+                        yield elem
+                    index += 1
+                    if stop is not None and index >= stop:
+                        break
+            finally:
+                await _aclose(aiterator)
+
+        return slice_tr
+
+    def take(self, n):
+        '''Create a new AsyncStream contains only first n element
+
+        >>> asyncio.run(AsyncStream.range(10).take(3).to_list())
+        [0, 1, 2]
+        '''
+        return self.slice(None, n)
+
+    def drop(self, n):
+        '''Create a new AsyncStream with first n element dropped
+
+        >>> asyncio.run(AsyncStream.range(5).drop(3).to_list())
+        [3, 4]
+        '''
+        return self.slice(n, None)
+
+    @as_stream
+    def take_while(self, pred):
+        '''Create a new AsyncStream with successive elements as long as
+        predicate evaluates to true.
+
+        >>> asyncio.run(AsyncStream.range(10).take_while(lambda n: n < 3).to_list())
+        [0, 1, 2]
+        '''  # noqa
+        async def take_while_tr(aiterable):
+            aiterator = aiterable.__aiter__()
+            try:
+                async for elem in aiterator:
+                    if not await _maybe_await(pred(elem)):
+                        break
+                    yield elem
+            finally:
+                await _aclose(aiterator)
+
+        return take_while_tr
+
+    @as_stream
+    def drop_while(self, pred):
+        '''Create a new AsyncStream without elements as long as predicate
+        evaluates to true.
+
+        >>> asyncio.run(AsyncStream.range(5).drop_while(lambda n: n < 3).to_list())
+        [3, 4]
+        '''  # noqa
+        async def drop_while_tr(aiterable):
+            dropping = True
+            async for elem in aiterable:
+                if dropping and await _maybe_await(pred(elem)):
+                    continue
+                dropping = False
+                yield elem
+
+        return drop_while_tr
+
+    @as_stream
+    def chunk(self, n, strict=False):
+        '''divide elements into chunks of n elements
+
+        >>> asyncio.run(AsyncStream.range(5).chunk(2).to_list())
+        [Row(f0=0, f1=1), Row(f0=2, f1=3), Row(f0=4)]
+        >>> asyncio.run(AsyncStream.range(5).chunk(2, strict=True).to_list())
+        [Row(f0=0, f1=1), Row(f0=2, f1=3)]
+        '''
+        async def chunk_tr(aiterable):
+            chunk = []
+            async for elem in aiterable:
+                chunk.append(elem)
+                if len(chunk) == n:
+                    yield Row.from_values(chunk)
+                    chunk = []
+
+            if chunk and not strict:
+                yield Row.from_values(chunk)
+
+        return chunk_tr
+
+    @as_stream
+    def group_by_as_stream(self, key=None):
+        '''Create a new AsyncStream which sequentially groups elements as
+        long as the key function evaluates to the same value.
+
+        Unlike ``Stream.group_by_as_stream``, values of each group are
+        collected into an Array.
+
+        >>> (asyncio.run(AsyncStream.range(7)
+        ...  .group_by_as_stream(lambda n: n // 3).to_list()))
+        [Row(key=0, values=Array([0, 1, 2])), Row(key=1, values=Array([3, 4, 5])), Row(key=2, values=Array([6]))]
+        '''  # noqa
+        if key is None:
+            def key(elem): return elem
+
+        async def group_by_tr(aiterable):
+            group_key = None
+            group = None
+            async for elem in aiterable:
+                elem_key = await _maybe_await(key(elem))
+                if group is not None and elem_key == group_key:
+                    group.append(elem)
+                    continue
+
+                if group is not None:
+                    yield KeyValues(key=group_key, values=group)
+                group_key = elem_key
+                group = Array([elem])
+
+            if group is not None:
+                yield KeyValues(key=group_key, values=group)
+
+        return group_by_tr
+
+    @as_stream
+    def distincted(self, key_func=None):
+        '''Create a new AsyncStream with non-repeating elements.
+
+        >>> asyncio.run(AsyncStream([1, 3, 1, 2, 3]).distincted().to_list())
+        [1, 3, 2]
+        '''
+        if key_func is None:
+            def key_func(x): return x
+
+        async def distincted_tr(aiterable):
+            key_set = set()
+            async for elem in aiterable:
+                key_value = key_func(elem)
+                if key_value not in key_set:
+                    key_set.add(key_value)
+                    yield elem
+
+        return distincted_tr
+
+    @as_stream
+    def zip_index(self, start=0):
+        '''Create a new AsyncStream by zipping elements with index.
+
+        >>> asyncio.run(AsyncStream(['a', 'b']).zip_index().to_list())
+        [Row(value='a', index=0), Row(value='b', index=1)]
+        '''
+        async def zip_index_tr(aiterable):
+            index = start
+            async for elem in aiterable:
+                yield ValueIndex(elem, index)
+                index += 1
+
+        return zip_index_tr
+
+    async def to_list(self):
+        '''Convert to a list.
+
+        >>> asyncio.run(AsyncStream.range(3).to_list())
+        [0, 1, 2]
+
+        Returns
+        -------
+        list
+        '''
+        return [elem async for elem in self]
+
+    async def to_array(self):
+        '''Convert to an Array
+
+        Returns
+        -------
+        Array
+        '''
+        return Array(await self.to_list())
+
+    async def to_set(self):
+        '''Convert to a set
+
+        Returns
+        -------
+        set
+        '''
+        return {elem async for elem in self}
+
+    async def to_dict(self):
+        '''Convert to a dict
+
+        Returns
+        -------
+        dict
+        '''
+        return dict(await self.to_list())
+
+    async def len(self):
+        '''Get the length of the AsyncStream
+
+        >>> asyncio.run(AsyncStream.range(3).len())
+        3
+
+        Returns
+        -------
+        int
+        '''
+        length = 0
+        async for _ in self:
+            length += 1
+        return length
+
+    async def sum(self):
+        '''Get sum of elements
+
+        >>> asyncio.run(AsyncStream.range(4).sum())
+        6
+        '''
+        total = 0
+        async for elem in self:
+            total += elem
+        return total
+
+    async def reduce(self, func):
+        '''Apply a function of two arguments cumulatively to the elements
+        from left to right.
+
+        >>> asyncio.run(AsyncStream.range(1, 5).reduce(lambda a, b: a * b))
+        24
+        '''
+        sentinel = object()
+        result = sentinel
+        async for elem in self:
+            result = elem if result is sentinel else func(result, elem)
+
+        if result is sentinel:
+            raise TypeError('reduce() of empty AsyncStream with no initial '
+                            'value')
+        return result
+
+    async def first(self):
+        '''Get first element
+
+        >>> asyncio.run(AsyncStream.range(3, 6).first())
+        3
+        '''
+        first_opt = await self.first_opt()
+        if first_opt is Nothing:
+            raise IndexError('AsyncStream index out of range.')
+        return first_opt.some
+
+    async def first_opt(self):
+        '''Get first element as Some(element), or Nothing if not exists
+
+        >>> asyncio.run(AsyncStream([]).first_opt())
+        Nothing
+
+        Returns
+        -------
+        Optional[element]
+        '''
+        aiterator = self.__aiter__()
+        try:
+            async for elem in aiterator:
+                return Some(elem)
+        finally:
+            await _aclose(aiterator)
+
+        return Nothing
+
+    async def for_each(self, func):
+        '''Call function for each element. Function can be a coroutine
+        function.
+
+        >>> asyncio.run(AsyncStream.range(3).for_each(print))
+        0
+        1
+        2
+        '''
+        async for elem in self:
+            await _maybe_await(func(elem))
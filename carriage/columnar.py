@@ -0,0 +1,352 @@
+import array
+import itertools as itt
+import operator as op
+
+from .pipeline import FilterOp, FlatMapOp, MapOp
+from .repr import short_repr
+from .row import Row, Schema
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def is_ndarray(column):
+    return np is not None and isinstance(column, np.ndarray)
+
+
+def _to_python(value):
+    if np is not None and isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _like(column, values):
+    '''Make a list of values, or an array.array if column is one'''
+    if isinstance(column, array.array):
+        return array.array(column.typecode, values)
+    return list(values)
+
+
+def take_column(column, mask):
+    '''Keep values of a column where the mask is true
+
+    >>> take_column([1, 2, 3], [True, False, True])
+    [1, 3]
+    '''
+    if is_ndarray(column):
+        if is_ndarray(mask):
+            mask = mask.astype(bool, copy=False)
+        else:
+            mask = np.fromiter(map(bool, mask), dtype=bool,
+                               count=len(column))
+        return column[mask]
+    return _like(column, itt.compress(column, mask))
+
+
+def repeat_column(column, counts):
+    '''Repeat each value of a column by its count
+
+    >>> repeat_column(['a', 'b'], [2, 1])
+    ['a', 'a', 'b']
+    '''
+    if is_ndarray(column):
+        return np.repeat(column, counts)
+    return _like(column,
+                 itt.chain.from_iterable(map(itt.repeat, column, counts)))
+
+
+def concat_columns(columns):
+    '''Concatenate columns into a NumPy array if all of them are NumPy
+    arrays, otherwise a list'''
+    if columns and all(map(is_ndarray, columns)):
+        return np.concatenate(columns)
+    return list(itt.chain.from_iterable(columns))
+
+
+def equal_mask(column, value):
+    '''Get the mask of values of a column equal to value'''
+    if is_ndarray(column) and (value is None or np.isscalar(value)):
+        mask = column == value
+        if is_ndarray(mask) and mask.shape == column.shape:
+            return mask
+    return [elem == value for elem in column]
+
+
+def sum_column(column):
+    if is_ndarray(column):
+        return _to_python(column.sum())
+    return sum(column)
+
+
+def min_column(column):
+    '''Get the minimum of a non-empty column'''
+    if is_ndarray(column):
+        return _to_python(column.min())
+    return min(column)
+
+
+def max_column(column):
+    '''Get the maximum of a non-empty column'''
+    if is_ndarray(column):
+        return _to_python(column.max())
+    return max(column)
+
+
+class RecordBatch:
+    '''Rows of the same Schema stored as a column per field.
+
+    Columns can be lists, tuples, ``array.array`` or NumPy arrays of the
+    same length. Rows are only created when a RecordBatch is iterated.
+
+    >>> batch = RecordBatch.from_columns({'x': [1, 2, 3], 'y': [4, 5, 6]})
+    >>> batch
+    RecordBatch(x=[1, 2, 3], y=[4, 5, 6])
+    >>> list(batch)
+    [Row(x=1, y=4), Row(x=2, y=5), Row(x=3, y=6)]
+    >>> batch.filter([True, False, True]).column('y')
+    [4, 6]
+    '''
+    __slots__ = 'schema', 'columns', '_length', '_rows'
+
+    def __init__(self, schema, columns, length=None):
+        columns = list(columns)
+        if len(columns) != len(schema):
+            raise ValueError(
+                f'{len(columns)} columns are given for {schema!r}')
+        if length is None:
+            length = len(columns[0]) if columns else 0
+        for field, column in zip(schema, columns):
+            if len(column) != length:
+                raise ValueError(
+                    f'Column {field!r} should have {length} values, '
+                    f'not {len(column)}')
+
+        self.schema = schema
+        self.columns = columns
+        self._length = length
+        self._rows = None
+
+    @classmethod
+    def from_columns(cls, columns):
+        '''Create from a dict of field names to columns'''
+        return cls(Schema(columns), columns.values())
+
+    @classmethod
+    def from_rows(cls, rows):
+        '''Create from a list of Rows of the same Schema
+
+        >>> RecordBatch.from_rows([Row(x=1, y=2), Row(x=3, y=4)])
+        RecordBatch(x=(1, 3), y=(2, 4))
+        '''
+        schema = rows[0]._schema if rows else Schema(())
+        columns = list(zip(*rows)) if schema.fields else []
+        return cls(schema, columns, len(rows))
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        if self._rows is not None:
+            return iter(self._rows)
+
+        row_class = self.schema.row_class(Row)
+        if not self.columns:
+            return itt.repeat(tuple.__new__(row_class, ()), self._length)
+        return map(tuple.__new__, itt.repeat(row_class), zip(*self.columns))
+
+    def rows(self):
+        '''Get the list of Rows, which is created once and kept'''
+        if self._rows is None:
+            self._rows = list(self)
+        return self._rows
+
+    def column(self, field):
+        '''Get the column of a field'''
+        return self.columns[self.schema.index[field]]
+
+    def iter_batches(self, size):
+        '''Split into RecordBatches of at most size Rows by slicing the
+        columns'''
+        if self._length <= size:
+            yield self
+            return
+
+        for start in range(0, self._length, size):
+            stop = min(start + size, self._length)
+            yield RecordBatch(self.schema,
+                              [column[start:stop] for column in self.columns],
+                              stop - start)
+
+    def with_columns(self, columns):
+        '''Create a new RecordBatch by replacing or adding columns like
+        ``Row.evolve``'''
+        fields = list(self.schema.fields)
+        new_columns = list(self.columns)
+        for field, column in columns.items():
+            index = self.schema.index.get(field)
+            if index is None:
+                fields.append(field)
+                new_columns.append(column)
+            else:
+                new_columns[index] = column
+        return RecordBatch(Schema(fields), new_columns, self._length)
+
+    def project(self, fields):
+        '''Create a new RecordBatch keeping only specified fields in the
+        order of the Schema like ``Row.project``'''
+        fields = set(fields)
+        kept = [(field, column)
+                for field, column in zip(self.schema, self.columns)
+                if field in fields]
+        return RecordBatch(Schema(field for field, _ in kept),
+                           [column for _, column in kept], self._length)
+
+    def filter(self, mask):
+        '''Create a new RecordBatch keeping Rows where the mask is true'''
+        if not self.columns:
+            return RecordBatch(self.schema, [], sum(map(bool, mask)))
+        return RecordBatch(self.schema,
+                           [take_column(column, mask)
+                            for column in self.columns])
+
+    def __repr__(self):
+        columns_str = ', '.join(
+            f'{field}={short_repr.repr(column)}'
+            for field, column in zip(self.schema, self.columns))
+        return f'{type(self).__name__}({columns_str})'
+
+
+def iter_record_batches(batches):
+    '''Turn batches of Rows into RecordBatches. Lists of Rows are split
+    into RecordBatches of consecutive Rows of the same Schema.
+
+    >>> list(iter_record_batches([[Row(x=1), Row(x=2), Row(y=3)]]))
+    [RecordBatch(x=(1, 2)), RecordBatch(y=(3,))]
+    '''
+    for batch in batches:
+        if isinstance(batch, RecordBatch):
+            yield batch
+            continue
+
+        for _, rows in itt.groupby(batch, key=op.attrgetter('_schema')):
+            yield RecordBatch.from_rows(list(rows))
+
+
+def evaluate(func, batch):
+    '''Evaluate a function of Rows on a RecordBatch and get a column of
+    the results. A value which is not callable is repeated as a constant
+    column. Functions with an ``evaluate_column`` method, like ``X``
+    expressions, are evaluated on whole columns by the method.
+
+    >>> from carriage import X
+    >>> batch = RecordBatch.from_columns({'x': [1, 2]})
+    >>> evaluate(lambda row: row.x * 10, batch)
+    [10, 20]
+    >>> evaluate(X.x * 10, batch)
+    [10, 20]
+    >>> evaluate(0, batch)
+    [0, 0]
+    '''
+    if not callable(func):
+        return [func] * len(batch)
+    evaluate_column = getattr(func, 'evaluate_column', None)
+    if evaluate_column is not None:
+        return evaluate_column(batch)
+    return [func(row) for row in batch.rows()]
+
+
+class MapFieldsOp(MapOp):
+    '''Add or replace fields of Rows with the values of functions of the
+    Rows, then keep only the ``keep`` fields if given.
+
+    In batch mode, each new field is evaluated as a column of a
+    RecordBatch.
+    '''
+    __slots__ = 'field_funcs', 'keep'
+
+    def __init__(self, field_funcs, keep=None):
+        super().__init__(self._map_row)
+        self.field_funcs = field_funcs
+        self.keep = keep
+
+    def _map_row(self, row):
+        row = row.evolve(**{field: func(row) if callable(func) else func
+                            for field, func in self.field_funcs.items()})
+        if self.keep is not None:
+            row = row.project(*self.keep)
+        return row
+
+    def transform_batches(self, batches, size):
+        for batch in iter_record_batches(batches):
+            batch = batch.with_columns(
+                {field: evaluate(func, batch)
+                 for field, func in self.field_funcs.items()})
+            if self.keep is not None:
+                batch = batch.project(self.keep)
+            yield batch
+
+
+class WhereOp(FilterOp):
+    '''Keep Rows passing all conditions and having all fields equal to
+    the given values.
+
+    In batch mode, each condition is evaluated as a mask of a RecordBatch,
+    on Rows passing the previous conditions only.
+    '''
+    __slots__ = 'conds', 'kwconds'
+
+    def __init__(self, conds, kwconds):
+        super().__init__(self._match_row)
+        self.conds = conds
+        self.kwconds = kwconds
+
+    def _match_row(self, row):
+        return (all(cond(row) for cond in self.conds) and
+                all(getattr(row, field) == value
+                    for field, value in self.kwconds.items()))
+
+    def transform_batches(self, batches, size):
+        for batch in iter_record_batches(batches):
+            for cond in self.conds:
+                batch = batch.filter(evaluate(cond, batch))
+            for field, value in self.kwconds.items():
+                if field in batch.schema.index:
+                    column = batch.column(field)
+                else:
+                    # Raises AttributeError like Rows unless batch is empty
+                    column = [getattr(row, field) for row in batch.rows()]
+                batch = batch.filter(equal_mask(column, value))
+            if len(batch) > 0:
+                yield batch
+
+
+class ExplodeOp(FlatMapOp):
+    '''Expand each Row into a Row for each element of a field.
+
+    In batch mode, other columns of a RecordBatch are repeated by the
+    numbers of elements.
+    '''
+    __slots__ = 'field',
+
+    def __init__(self, field):
+        super().__init__(self._explode_row)
+        self.field = field
+
+    def _explode_row(self, row):
+        field = self.field
+        for field_elem in getattr(row, field):
+            yield row.evolve(**{field: field_elem})
+
+    def transform_batches(self, batches, size):
+        for batch in iter_record_batches(batches):
+            index = batch.schema.index[self.field]
+            parts = [list(elems) for elems in batch.columns[index]]
+            counts = list(map(len, parts))
+            columns = [repeat_column(column, counts)
+                       for column in batch.columns]
+            columns[index] = list(itt.chain.from_iterable(parts))
+            length = sum(counts)
+            if length > 0:
+                yield RecordBatch(batch.schema, columns, length)
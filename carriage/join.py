@@ -0,0 +1,127 @@
+import itertools as itt
+from collections import defaultdict
+
+JOIN_HOWS = ('inner', 'left', 'right', 'outer')
+JOIN_METHODS = ('hash', 'merge')
+
+
+def _keep_sides(how):
+    if how not in JOIN_HOWS:
+        raise ValueError(f'how should be one of {JOIN_HOWS}, not {how!r}')
+    return how in ('left', 'outer'), how in ('right', 'outer')
+
+
+def hash_join(left, right, left_key, right_key, how='inner', build='right',
+              fillvalue=None):
+    '''Join two iterables by building a hash table of one side and
+    streaming the other side through it. Yield ``(key, left, right)``
+    tuples, with fillvalue for the missing side of unmatched elements.
+
+    Output follows the order of the streamed side. Unmatched elements of
+    the built side come last.
+
+    >>> list(hash_join([1, 2, 3], [3, 4, 1], abs, abs, how='left'))
+    [(1, 1, 1), (2, 2, None), (3, 3, 3)]
+    >>> list(hash_join([1, 2], [2, 3], abs, abs, how='outer', build='left'))
+    [(2, 2, 2), (3, None, 3), (1, 1, None)]
+
+    Parameters
+    ----------
+    build : 'left' or 'right'
+        the side to build the hash table, which should be the smaller one
+    '''
+    keep_left, keep_right = _keep_sides(how)
+    if build == 'left':
+        for key, right_elem, left_elem in _hash_join(
+                right, left, right_key, left_key,
+                keep_right, keep_left, fillvalue):
+            yield key, left_elem, right_elem
+    elif build == 'right':
+        yield from _hash_join(left, right, left_key, right_key,
+                              keep_left, keep_right, fillvalue)
+    else:
+        raise ValueError(f"build should be 'left' or 'right', not {build!r}")
+
+
+def _hash_join(probe, build, probe_key, build_key, keep_probe, keep_build,
+               fillvalue):
+    table = defaultdict(list)
+    for elem in build:
+        table[build_key(elem)].append(elem)
+
+    matched_keys = set()
+    for elem in probe:
+        key = probe_key(elem)
+        matches = table.get(key)
+        if matches:
+            if keep_build:
+                matched_keys.add(key)
+            for match in matches:
+                yield key, elem, match
+        elif keep_probe:
+            yield key, elem, fillvalue
+
+    if keep_build:
+        for key, elems in table.items():
+            if key not in matched_keys:
+                for elem in elems:
+                    yield key, fillvalue, elem
+
+
+def _sorted_groups(iterable, key, side):
+    prev_key = None
+    for index, (group_key, group) in enumerate(itt.groupby(iterable, key)):
+        if index > 0 and not prev_key < group_key:
+            raise ValueError(f'{side} side is not sorted by the key')
+        prev_key = group_key
+        yield group_key, group
+
+
+def merge_join(left, right, left_key, right_key, how='inner',
+               fillvalue=None):
+    '''Join two iterables both sorted by their keys in ascending order.
+    Yield ``(key, left, right)`` tuples in the order of keys, with
+    fillvalue for the missing side of unmatched elements.
+
+    Only elements of the same key on the right side are kept in memory.
+    ValueError is raised if a side turns out to be not sorted.
+
+    >>> list(merge_join([1, 2, 4], [2, 3, 4], abs, abs, how='outer'))
+    [(1, 1, None), (2, 2, 2), (3, None, 3), (4, 4, 4)]
+    '''
+    keep_left, keep_right = _keep_sides(how)
+    left_groups = _sorted_groups(left, left_key, 'left')
+    right_groups = _sorted_groups(right, right_key, 'right')
+    left_group = next(left_groups, None)
+    right_group = next(right_groups, None)
+
+    while left_group is not None and right_group is not None:
+        left_group_key, left_elems = left_group
+        right_group_key, right_elems = right_group
+        if left_group_key < right_group_key:
+            if keep_left:
+                for left_elem in left_elems:
+                    yield left_group_key, left_elem, fillvalue
+            left_group = next(left_groups, None)
+        elif right_group_key < left_group_key:
+            if keep_right:
+                for right_elem in right_elems:
+                    yield right_group_key, fillvalue, right_elem
+            right_group = next(right_groups, None)
+        else:
+            right_elems = list(right_elems)
+            for left_elem in left_elems:
+                for right_elem in right_elems:
+                    yield left_group_key, left_elem, right_elem
+            left_group = next(left_groups, None)
+            right_group = next(right_groups, None)
+
+    if keep_left and left_group is not None:
+        for group_key, left_elems in itt.chain([left_group], left_groups):
+            for left_elem in left_elems:
+                yield group_key, left_elem, fillvalue
+
+    if keep_right and right_group is not None:
+        for group_key, right_elems in itt.chain([right_group], right_groups):
+            for right_elem in right_elems:
+                yield group_key, fillvalue, right_elem
@@ -1,7 +1,9 @@
 
 import functools as fnt
+import itertools as itt
 import operator as op
 
+from .columnar import RecordBatch, is_ndarray, np
 from .pipeline import Pipeline, Transformer
 from .repr import repr_args
 
@@ -61,13 +63,237 @@ class Xcall:
         return X._then(Transformer(f'{self.f.__name__}({args_str})', func))
 
 
+def _elems(values):
+    if isinstance(values, RecordBatch):
+        return values.rows()
+    return values
+
+
+def _is_in(elem, container):
+    return elem in container
+
+
+class Expr:
+    '''A node of the expression tree of a Lambda.
+
+    An Expr is called on an element like a function, and
+    ``evaluate_column`` evaluates it on a column of elements at once. A
+    column is a list, a NumPy array, or a RecordBatch for a column of
+    Rows.
+    '''
+    __slots__ = ()
+
+    def __call__(self, elem):
+        raise NotImplementedError()
+
+    def evaluate_column(self, values):
+        return [self(elem) for elem in _elems(values)]
+
+
+class GetAttr(Expr):
+    '''Get an attribute. Fields of a RecordBatch are taken as columns
+    directly without creating Rows.'''
+    __slots__ = 'name',
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, elem):
+        return getattr(elem, self.name)
+
+    def evaluate_column(self, values):
+        if (isinstance(values, RecordBatch) and
+                self.name in values.schema.index):
+            return values.column(self.name)
+        return list(map(op.attrgetter(self.name), _elems(values)))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name!r})'
+
+
+class GetItem(Expr):
+    '''Get an item. Integer keys of a RecordBatch are taken as columns
+    directly without creating Rows.'''
+    __slots__ = 'key',
+
+    def __init__(self, key):
+        self.key = key
+
+    def __call__(self, elem):
+        return elem[self.key]
+
+    def evaluate_column(self, values):
+        if isinstance(values, RecordBatch) and isinstance(self.key, int):
+            return values.columns[self.key]
+        return list(map(op.itemgetter(self.key), _elems(values)))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.key!r})'
+
+
+class UnaryOp(Expr):
+    '''Apply an operator function of one operand. NumPy arrays are
+    computed by the corresponding ufunc.'''
+    __slots__ = 'func',
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, elem):
+        return self.func(elem)
+
+    def evaluate_column(self, values):
+        if is_ndarray(values):
+            if self.func is op.not_:
+                return np.logical_not(values)
+            return self.func(values)
+        return list(map(self.func, _elems(values)))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.func.__name__})'
+
+
+_UFUNC_OPS = frozenset([
+    op.add, op.sub, op.mul, op.truediv, op.floordiv, op.mod, pow,
+    op.eq, op.ne, op.gt, op.ge, op.lt, op.le])
+
+
+class BinaryOp(Expr):
+    '''Apply an operator function of two operands. An operand is the
+    element itself if it's ``X``, the result of a Lambda on the element, or
+    a constant.
+
+    Arithmetic and comparisons of NumPy arrays and scalars are computed by
+    ufuncs, which follow the NumPy semantics like fixed width integers.
+    Other columns are computed in one ``map`` call.
+
+    >>> from carriage import Row
+    >>> from carriage.columnar import RecordBatch
+    >>> expr = BinaryOp(op.add, X.x, X.y)
+    >>> expr(Row(x=1, y=2))
+    3
+    >>> expr.evaluate_column(RecordBatch.from_columns({'x': [1, 2],
+    ...                                                'y': [3, 4]}))
+    [4, 6]
+    '''
+    __slots__ = 'func', 'left', 'right', '_left_kind', '_right_kind'
+
+    def __new__(cls, func, left, right):
+        if cls is BinaryOp:
+            kinds = (cls._operand_kind(left), cls._operand_kind(right))
+            cls = _binary_op_classes.get(kinds, cls)
+        return object.__new__(cls)
+
+    def __init__(self, func, left, right):
+        self.func = func
+        self.left = left
+        self.right = right
+        self._left_kind = self._operand_kind(left)
+        self._right_kind = self._operand_kind(right)
+
+    @staticmethod
+    def _operand_kind(operand):
+        if not isinstance(operand, Lambda):
+            return 'constant'
+        if operand._pipeline.is_empty():
+            return 'elem'
+        return 'lambda'
+
+    def __call__(self, elem):
+        left, right = self.left, self.right
+        if self._left_kind == 'elem':
+            left = elem
+        elif self._left_kind == 'lambda':
+            left = left(elem)
+        if self._right_kind == 'elem':
+            right = elem
+        elif self._right_kind == 'lambda':
+            right = right(elem)
+        return self.func(left, right)
+
+    @staticmethod
+    def _operand_column(operand, kind, values):
+        if kind == 'elem':
+            return values if is_ndarray(values) else _elems(values)
+        return operand.evaluate_column(values)
+
+    def evaluate_column(self, values):
+        left, right = self.left, self.right
+        if self._left_kind != 'constant':
+            left = self._operand_column(left, self._left_kind, values)
+        if self._right_kind != 'constant':
+            right = self._operand_column(right, self._right_kind, values)
+
+        if self.func in _UFUNC_OPS and self._ufunc_operands(left, right):
+            try:
+                result = self.func(left, right)
+            except (TypeError, ValueError):
+                # e.g. negative powers of integers
+                result = None
+            if is_ndarray(result) and result.shape == (len(values),):
+                return result
+            # compute on NumPy scalars like Rows do instead, so results
+            # and errors are the same as in row mode
+
+        if self._left_kind == 'constant':
+            return list(map(self.func, itt.repeat(left), right))
+        if self._right_kind == 'constant':
+            return list(map(self.func, left, itt.repeat(right)))
+        return list(map(self.func, left, right))
+
+    def _ufunc_operands(self, left, right):
+        '''Whether operands are NumPy arrays or scalars with at least one
+        array'''
+        if not (is_ndarray(left) or is_ndarray(right)):
+            return False
+        if self._left_kind == 'constant':
+            return np.isscalar(left) and is_ndarray(right)
+        if self._right_kind == 'constant':
+            return is_ndarray(left) and np.isscalar(right)
+        return is_ndarray(left) and is_ndarray(right)
+
+    def __repr__(self):
+        name = getattr(self.func, '__name__', repr(self.func))
+        return f'BinaryOp({name}, {self.left!r}, {self.right!r})'
+
+
+class _ElemConstantOp(BinaryOp):
+    __slots__ = ()
+
+    def __call__(self, elem):
+        return self.func(elem, self.right)
+
+
+class _ConstantElemOp(BinaryOp):
+    __slots__ = ()
+
+    def __call__(self, elem):
+        return self.func(self.left, elem)
+
+
+class _LambdasOp(BinaryOp):
+    __slots__ = ()
+
+    def __call__(self, elem):
+        return self.func(self.left(elem), self.right(elem))
+
+
+# specialized calls of BinaryOp by the kinds of operands
+_binary_op_classes = {
+    ('elem', 'constant'): _ElemConstantOp,
+    ('constant', 'elem'): _ConstantElemOp,
+    ('lambda', 'lambda'): _LambdasOp,
+}
+
+
 class Lambda:
-    __slots__ = '_pipeline',
+    __slots__ = '_pipeline', '_funcs'
 
     def __init__(self, *, pipeline=None):
         if pipeline is None:
             pipeline = Pipeline()
         self._pipeline = pipeline
+        self._funcs = None
 
     def _then(self, trfmr):
         return type(self)(pipeline=self._pipeline.then(trfmr))
@@ -78,7 +304,44 @@ class Lambda:
         return Transformer(f'X({args_str})', lambda func: func(*args, **kwargs))
 
     def __call__(self, elem):
-        return self._pipeline.transform(elem)
+        funcs = self._funcs
+        if funcs is None:
+            funcs = self._funcs = tuple(
+                trfmr.func for trfmr in self._pipeline.transformers)
+        for func in funcs:
+            elem = func(elem)
+        return elem
+
+    def evaluate_column(self, values):
+        '''Evaluate on a column of elements at once and get a column of
+        the results.
+
+        Each step of the expression tree is computed on a whole column,
+        e.g. ``X.x + X.y`` on a RecordBatch adds its x and y columns. NumPy
+        array columns are computed by ufuncs. Functions which aren't an
+        Expr are called on each element.
+
+        >>> from carriage.columnar import RecordBatch
+        >>> batch = RecordBatch.from_columns({'x': [1, 2, 3]})
+        >>> (X.x * 2 > 3).evaluate_column(batch)
+        [False, True, True]
+
+        Parameters
+        ----------
+        values : list, NumPy array or RecordBatch
+            the column of elements
+
+        Returns
+        -------
+        list or NumPy array
+        '''
+        for trfmr in self._pipeline.transformers:
+            func = trfmr.func
+            if isinstance(func, Expr):
+                values = func.evaluate_column(values)
+            else:
+                values = list(map(func, _elems(values)))
+        return _elems(values)
 
     def __repr__(self):
         return f'<{type(self).__name__} {self._pipeline!r}>'
@@ -90,11 +353,11 @@ class Lambda:
     def __getattr__(self, name):
         if name.startswith('__') and name.endswith('__'):
             raise AttributeError
-        return Transformer(f'X.{name}', op.attrgetter(name))
+        return Transformer(f'X.{name}', GetAttr(name))
 
     @lambda_then
     def __getitem__(self, key):
-        return Transformer(f'X[{key!r}]', op.itemgetter(key))
+        return Transformer(f'X[{key!r}]', GetItem(key))
 
     def __bool__(self):
         return False
@@ -102,211 +365,211 @@ class Lambda:
     @property
     @lambda_then
     def not_(self):
-        return Transformer(f'not X', op.not_)
+        return Transformer(f'not X', UnaryOp(op.not_))
 
     @lambda_then
     def in_(self, other):
-        return Transformer(f'X in {other!r}', lambda elem: elem in other)
+        return Transformer(f'X in {other!r}', BinaryOp(_is_in, X, other))
 
     @in_.other_lambda
     def in_(self, other):
-        return Transformer(f'X in {other!r}', lambda elem: self(elem) in other(elem))
+        return Transformer(f'X in {other!r}', BinaryOp(_is_in, self, other))
 
     @lambda_then
     def has(self, other):
-        return Transformer(f'{other!r} in X', lambda elem: other in elem)
+        return Transformer(f'{other!r} in X', BinaryOp(_is_in, other, X))
 
     @has.other_lambda
     def has(self, other):
-        return Transformer(f'{other!r} in X', lambda elem: other(elem) in self(elem))
+        return Transformer(f'{other!r} in X', BinaryOp(_is_in, other, self))
 
     @lambda_then
     def __pos__(self):
-        return Transformer(f'+X', op.pos)
+        return Transformer(f'+X', UnaryOp(op.pos))
 
     @lambda_then
     def __neg__(self):
-        return Transformer(f'-X', op.neg)
+        return Transformer(f'-X', UnaryOp(op.neg))
 
     @lambda_then
     def __abs__(self):
-        return Transformer(f'abs(X)', op.abs)
+        return Transformer(f'abs(X)', UnaryOp(op.abs))
 
     @lambda_then
     def __add__(self, other):
-        return Transformer(f'X + {other!r}', lambda elem: elem + other)
+        return Transformer(f'X + {other!r}', BinaryOp(op.add, X, other))
 
     @__add__.other_lambda
     def __add__(self, other):
-        return Transformer(f'X + {other!r}', lambda elem: self(elem) + other(elem))
+        return Transformer(f'X + {other!r}', BinaryOp(op.add, self, other))
 
     @lambda_then
     def __sub__(self, other):
-        return Transformer(f'X - {other!r}', lambda elem: elem - other)
+        return Transformer(f'X - {other!r}', BinaryOp(op.sub, X, other))
 
     @__sub__.other_lambda
     def __sub__(self, other):
-        return Transformer(f'X - {other!r}', lambda elem: self(elem) - other(elem))
+        return Transformer(f'X - {other!r}', BinaryOp(op.sub, self, other))
 
     @lambda_then
     def __mul__(self, other):
-        return Transformer(f'X * {other!r}', lambda elem: elem * other)
+        return Transformer(f'X * {other!r}', BinaryOp(op.mul, X, other))
 
     @__mul__.other_lambda
     def __mul__(self, other):
-        return Transformer(f'X * {other!r}', lambda elem: self(elem) * other(elem))
+        return Transformer(f'X * {other!r}', BinaryOp(op.mul, self, other))
 
     @lambda_then
     def __truediv__(self, other):
-        return Transformer(f'X / {other!r}', lambda elem: elem / other)
+        return Transformer(f'X / {other!r}', BinaryOp(op.truediv, X, other))
 
     @__truediv__.other_lambda
     def __truediv__(self, other):
-        return Transformer(f'X / {other!r}', lambda elem: self(elem) / other(elem))
+        return Transformer(f'X / {other!r}', BinaryOp(op.truediv, self, other))
 
     @lambda_then
     def __floordiv__(self, other):
-        return Transformer(f'X // {other!r}', lambda elem: elem // other)
+        return Transformer(f'X // {other!r}', BinaryOp(op.floordiv, X, other))
 
     @__floordiv__.other_lambda
     def __floordiv__(self, other):
-        return Transformer(f'X // {other!r}', lambda elem: self(elem) // other(elem))
+        return Transformer(f'X // {other!r}', BinaryOp(op.floordiv, self, other))
 
     @lambda_then
     def __mod__(self, other):
-        return Transformer(f'X % {other!r}', lambda elem: elem % other)
+        return Transformer(f'X % {other!r}', BinaryOp(op.mod, X, other))
 
     @__mod__.other_lambda
     def __mod__(self, other):
-        return Transformer(f'X % {other!r}', lambda elem: self(elem) % other(elem))
+        return Transformer(f'X % {other!r}', BinaryOp(op.mod, self, other))
 
     @lambda_then
     def __divmod__(self, other):
-        return Transformer(f'divmod(X, {other!r})', lambda elem: divmod(elem, other))
+        return Transformer(f'divmod(X, {other!r})', BinaryOp(divmod, X, other))
 
     @__divmod__.other_lambda
     def __divmod__(self, other):
-        return Transformer(f'divmod(X % {other!r})', lambda elem: divmod(self(elem), other(elem)))
+        return Transformer(f'divmod(X % {other!r})', BinaryOp(divmod, self, other))
 
     @lambda_then
     def __pow__(self, other):
-        return Transformer(f'pow(X % {other!r})', lambda elem: pow(elem, other))
+        return Transformer(f'pow(X % {other!r})', BinaryOp(pow, X, other))
 
     @__pow__.other_lambda
     def __pow__(self, other):
-        return Transformer(f'pow(X % {other!r})', lambda elem: pow(self(elem), other(elem)))
+        return Transformer(f'pow(X % {other!r})', BinaryOp(pow, self, other))
 
     @lambda_then
     def __radd__(self, other):
-        return Transformer(f'{other!r} + X', lambda elem: other + elem)
+        return Transformer(f'{other!r} + X', BinaryOp(op.add, other, X))
 
     @__radd__.other_lambda
     def __radd__(self, other):
-        return Transformer(f'{other!r} + X', lambda elem: other(elem) + self(elem))
+        return Transformer(f'{other!r} + X', BinaryOp(op.add, other, self))
 
     @lambda_then
     def __rsub__(self, other):
-        return Transformer(f'{other!r} - X', lambda elem: other - elem)
+        return Transformer(f'{other!r} - X', BinaryOp(op.sub, other, X))
 
     @__rsub__.other_lambda
     def __rsub__(self, other):
-        return Transformer(f'{other!r} - X', lambda elem: other(elem) - self(elem))
+        return Transformer(f'{other!r} - X', BinaryOp(op.sub, other, self))
 
     @lambda_then
     def __rmul__(self, other):
-        return Transformer(f'{other!r} * X', lambda elem: other * elem)
+        return Transformer(f'{other!r} * X', BinaryOp(op.mul, other, X))
 
     @__rmul__.other_lambda
     def __rmul__(self, other):
-        return Transformer(f'{other!r} * X', lambda elem: other(elem) * self(elem))
+        return Transformer(f'{other!r} * X', BinaryOp(op.mul, other, self))
 
     @lambda_then
     def __rtruediv__(self, other):
-        return Transformer(f'{other!r} / X', lambda elem: other / elem)
+        return Transformer(f'{other!r} / X', BinaryOp(op.truediv, other, X))
 
     @__rtruediv__.other_lambda
     def __rtruediv__(self, other):
-        return Transformer(f'{other!r} / X', lambda elem: other(elem) / self(elem))
+        return Transformer(f'{other!r} / X', BinaryOp(op.truediv, other, self))
 
     @lambda_then
     def __rfloordiv__(self, other):
-        return Transformer(f'{other!r} // X', lambda elem: other // elem)
+        return Transformer(f'{other!r} // X', BinaryOp(op.floordiv, other, X))
 
     @__rfloordiv__.other_lambda
     def __rfloordiv__(self, other):
-        return Transformer(f'{other!r} // X', lambda elem: other(elem) // self(elem))
+        return Transformer(f'{other!r} // X', BinaryOp(op.floordiv, other, self))
 
     @lambda_then
     def __rmod__(self, other):
-        return Transformer(f'{other!r} % X', lambda elem: other % elem)
+        return Transformer(f'{other!r} % X', BinaryOp(op.mod, other, X))
 
     @__rmod__.other_lambda
     def __rmod__(self, other):
-        return Transformer(f'{other!r} % X', lambda elem: other(elem) % self(elem))
+        return Transformer(f'{other!r} % X', BinaryOp(op.mod, other, self))
 
     @lambda_then
     def __rdivmod__(self, other):
-        return Transformer(f'divmod({other!r}, X)', lambda elem: divmod(other, elem))
+        return Transformer(f'divmod({other!r}, X)', BinaryOp(divmod, other, X))
 
     @__rdivmod__.other_lambda
     def __rdivmod__(self, other):
-        return Transformer(f'divmod({other!r}, X)', lambda elem: divmod(other(elem), self(elem)))
+        return Transformer(f'divmod({other!r}, X)', BinaryOp(divmod, other, self))
 
     @lambda_then
     def __rpow__(self, other):
-        return Transformer(f'pow({other!r}, X)', lambda elem: pow(other, elem))
+        return Transformer(f'pow({other!r}, X)', BinaryOp(pow, other, X))
 
     @__rpow__.other_lambda
     def __rpow__(self, other):
-        return Transformer(f'pow({other!r}, X)', lambda elem: pow(other(elem), self(elem)))
+        return Transformer(f'pow({other!r}, X)', BinaryOp(pow, other, self))
 
     @lambda_then
     def __eq__(self, other):
-        return Transformer(f' == {other!r}', lambda elem: elem == other)
+        return Transformer(f' == {other!r}', BinaryOp(op.eq, X, other))
 
     @__eq__.other_lambda
     def __eq__(self, other):
-        return Transformer(f' == {other!r}', lambda elem: self(elem) == other(elem))
+        return Transformer(f' == {other!r}', BinaryOp(op.eq, self, other))
 
     @lambda_then
     def __ne__(self, other):
-        return Transformer(f' != {other!r}', lambda elem: elem != other)
+        return Transformer(f' != {other!r}', BinaryOp(op.ne, X, other))
 
     @__ne__.other_lambda
     def __ne__(self, other):
-        return Transformer(f' != {other!r}', lambda elem: self(elem) != other(elem))
+        return Transformer(f' != {other!r}', BinaryOp(op.ne, self, other))
 
     @lambda_then
     def __gt__(self, other):
-        return Transformer(f' > {other!r}', lambda elem: elem > other)
+        return Transformer(f' > {other!r}', BinaryOp(op.gt, X, other))
 
     @__gt__.other_lambda
     def __gt__(self, other):
-        return Transformer(f' > {other!r}', lambda elem: self(elem) > other(elem))
+        return Transformer(f' > {other!r}', BinaryOp(op.gt, self, other))
 
     @lambda_then
     def __ge__(self, other):
-        return Transformer(f' >= {other!r}', lambda elem: elem >= other)
+        return Transformer(f' >= {other!r}', BinaryOp(op.ge, X, other))
 
     @__ge__.other_lambda
     def __ge__(self, other):
-        return Transformer(f' >= {other!r}', lambda elem: self(elem) >= other(elem))
+        return Transformer(f' >= {other!r}', BinaryOp(op.ge, self, other))
 
     @lambda_then
     def __lt__(self, other):
-        return Transformer(f' < {other!r}', lambda elem: elem < other)
+        return Transformer(f' < {other!r}', BinaryOp(op.lt, X, other))
 
     @__lt__.other_lambda
     def __lt__(self, other):
-        return Transformer(f' < {other!r}', lambda elem: self(elem) < other(elem))
+        return Transformer(f' < {other!r}', BinaryOp(op.lt, self, other))
 
     @lambda_then
     def __le__(self, other):
-        return Transformer(f' <= {other!r}', lambda elem: elem <= other)
+        return Transformer(f' <= {other!r}', BinaryOp(op.le, X, other))
 
     @__le__.other_lambda
     def __le__(self, other):
-        return Transformer(f' <= {other!r}', lambda elem: self(elem) <= other(elem))
+        return Transformer(f' <= {other!r}', BinaryOp(op.le, self, other))
 
 
 X = Lambda()
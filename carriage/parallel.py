@@ -0,0 +1,183 @@
+import concurrent.futures as cf
+import itertools as itt
+import os
+import queue
+import threading
+from collections import deque
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def default_thread_workers():
+    # the same default as ThreadPoolExecutor
+    return min(32, default_workers() + 4)
+
+
+def iter_chunks(iterable, size):
+    '''Lazily split an iterable into lists of size elements
+
+    >>> list(iter_chunks(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    '''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itt.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def map_chunk(func, chunk):
+    return [func(elem) for elem in chunk]
+
+
+def flat_map_chunk(func, chunk):
+    return [result for elem in chunk for result in func(elem)]
+
+
+def bounded_submit(executor, func, args_iterable, max_in_flight,
+                   ordered=True):
+    '''Lazily submit ``func(*args)`` for each args and yield the results.
+
+    At most ``max_in_flight`` futures are pending at any time, so
+    ``args_iterable`` is consumed only as fast as results are consumed.
+    Results are yielded in submitting order if ordered is True,
+    otherwise in completion order.
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> with ThreadPoolExecutor(2) as executor:
+    ...     list(bounded_submit(executor, pow, [(2, 3), (3, 2)], 1))
+    [8, 9]
+    '''
+    if max_in_flight < 1:
+        raise ValueError('max_in_flight should be at least 1')
+
+    if ordered:
+        pending = deque()
+        try:
+            for args in args_iterable:
+                if len(pending) >= max_in_flight:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(func, *args))
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+    else:
+        pending = set()
+        try:
+            for args in args_iterable:
+                if len(pending) >= max_in_flight:
+                    done, pending = cf.wait(
+                        pending, return_when=cf.FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                pending.add(executor.submit(func, *args))
+
+            while pending:
+                done, pending = cf.wait(
+                    pending, return_when=cf.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def executor_chunk_map(executor_factory, chunk_func, func, iterable,
+                       chunksize, max_in_flight, ordered=True):
+    '''Apply ``chunk_func(func, chunk)`` to chunks of iterable in an
+    executor and yield elements of the resulting lists.
+
+    The executor is shut down when the iteration finishes or the
+    generator is closed.
+    '''
+    with executor_factory() as executor:
+        chunk_results = bounded_submit(
+            executor, chunk_func,
+            ((func, chunk) for chunk in iter_chunks(iterable, chunksize)),
+            max_in_flight, ordered)
+        try:
+            for chunk_result in chunk_results:
+                yield from chunk_result
+        finally:
+            chunk_results.close()
+
+
+def executor_map(executor_factory, func, iterable, max_in_flight,
+                 ordered=True):
+    '''Apply func to each element of iterable in an executor and yield
+    the results, with at most max_in_flight pending calls.
+
+    The executor is shut down when the iteration finishes or the
+    generator is closed.
+    '''
+    with executor_factory() as executor:
+        results = bounded_submit(
+            executor, func, ((elem,) for elem in iterable),
+            max_in_flight, ordered)
+        try:
+            yield from results
+        finally:
+            results.close()
+
+
+_end_of_chunks = object()
+
+
+def _run_sink(sink, chunk_queue, finished, wrap):
+    ended = False
+
+    def elems():
+        nonlocal ended
+        for chunk in iter(chunk_queue.get, _end_of_chunks):
+            yield from chunk
+        ended = True
+
+    try:
+        return sink(wrap(elems()))
+    finally:
+        finished.set()
+        if not ended:
+            # keep consuming so that the feeder never blocks on a sink
+            # which stopped early
+            deque(iter(chunk_queue.get, _end_of_chunks), 0)
+
+
+def broadcast(chunks, sinks, max_chunks_in_flight, wrap=iter):
+    '''Feed every chunk to all sinks running in their own threads and
+    return a tuple of the results of sinks.
+
+    Each sink is called with ``wrap(iterator)`` of the elements. A sink
+    is fed through a ``queue.Queue(maxsize=max_chunks_in_flight)``, and
+    reading chunks waits while the queue of any running sink is full, so
+    sinks can run ahead of each other by at most that many chunks.
+    Chunks are not read any more when all sinks returned.
+
+    >>> broadcast([[1, 2], [3]], [sum, list], 1)
+    (6, [1, 2, 3])
+    '''
+    if max_chunks_in_flight < 1:
+        raise ValueError('max_chunks_in_flight should be at least 1')
+
+    queues = [queue.Queue(max_chunks_in_flight) for _ in sinks]
+    finished = [threading.Event() for _ in sinks]
+    with cf.ThreadPoolExecutor(max(len(sinks), 1)) as executor:
+        futures = [executor.submit(_run_sink, sink, chunk_queue, fin, wrap)
+                   for sink, chunk_queue, fin in zip(sinks, queues, finished)]
+        try:
+            for chunk in chunks:
+                if all(fin.is_set() for fin in finished):
+                    break
+                for chunk_queue, fin in zip(queues, finished):
+                    if not fin.is_set():
+                        chunk_queue.put(chunk)
+        finally:
+            for chunk_queue in queues:
+                chunk_queue.put(_end_of_chunks)
+
+        return tuple(future.result() for future in futures)
@@ -1,5 +1,354 @@
+import functools as fnt
+import heapq
+import itertools as itt
+import types
+
+from .array import Array
+from .parallel import iter_chunks
+from .spill import external_sorted
+
+DEFAULT_BATCH_SIZE = 1024
+
+
+class ElemOp:
+    '''A per-element operation.
+
+    Transformers built from an ElemOp can be fused with their neighbours
+    into a single loop instead of chaining one iterator per stage.
+    '''
+    __slots__ = 'func',
+    kind = None
+    one_to_one = False
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, iterable):
+        raise NotImplementedError()
+
+    def runner(self):
+        '''Get a function of ``iterable -> iterable`` doing the same as
+        calling the op, preferably a ``functools.partial`` of a builtin
+        which is cheaper to call'''
+        return self
+
+    def transform_batches(self, batches, size):
+        for batch in batches:
+            batch = list(self(batch))
+            if batch:
+                yield batch
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.func!r}>'
+
+
+class MapOp(ElemOp):
+    __slots__ = ()
+    kind = 'map'
+    one_to_one = True
+
+    def __call__(self, iterable):
+        return map(self.func, iterable)
+
+    def runner(self):
+        return fnt.partial(map, self.func)
+
+
+class StarmapOp(ElemOp):
+    __slots__ = ()
+    kind = 'starmap'
+    one_to_one = True
+
+    def __call__(self, iterable):
+        return itt.starmap(self.func, iterable)
+
+    def runner(self):
+        return fnt.partial(itt.starmap, self.func)
+
+
+class FilterOp(ElemOp):
+    __slots__ = ()
+    kind = 'filter'
+
+    def __call__(self, iterable):
+        return filter(self.func, iterable)
+
+    def runner(self):
+        return fnt.partial(filter, self.func)
+
+
+class FilterFalseOp(ElemOp):
+    __slots__ = ()
+    kind = 'filter_false'
+
+    def __call__(self, iterable):
+        return itt.filterfalse(self.func, iterable)
+
+    def runner(self):
+        return fnt.partial(itt.filterfalse, self.func)
+
+
+class FlatMapOp(ElemOp):
+    __slots__ = ()
+    kind = 'flat_map'
+
+    def __call__(self, iterable):
+        return itt.chain.from_iterable(map(self.func, iterable))
+
+
+class FlattenOp(ElemOp):
+    __slots__ = ()
+    kind = 'flatten'
+
+    def __init__(self):
+        super().__init__(None)
+
+    def __call__(self, iterable):
+        return itt.chain.from_iterable(iterable)
+
+
+class BatchMapOp:
+    '''Apply a function to lists of elements.
+
+    The function takes a list of elements and returns a sequence of
+    results, e.g. a list or a NumPy array.
+    '''
+    __slots__ = 'func', 'size'
+
+    def __init__(self, func, size=None):
+        self.func = func
+        self.size = size
+
+    def __call__(self, iterable):
+        for batch in iter_chunks(iterable, self.size or DEFAULT_BATCH_SIZE):
+            yield from self.func(batch)
+
+    def transform_batches(self, batches, size):
+        if self.size is not None and self.size != size:
+            batches = iter_chunks(itt.chain.from_iterable(batches),
+                                  self.size)
+        for batch in batches:
+            result = self.func(batch)
+            if len(result) > 0:
+                yield result
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.func!r}>'
+
+
+class SliceOp:
+    '''Take a slice of elements'''
+    __slots__ = 'start', 'stop', 'step'
+
+    def __init__(self, start, stop, step=None):
+        self.start = start
+        self.stop = stop
+        self.step = step
+
+    def __call__(self, iterable):
+        return itt.islice(iterable, self.start, self.stop, self.step)
+
+    def to_slice(self):
+        return slice(self.start, self.stop, self.step)
+
+
+class SortedOp:
+    '''Sort elements, in runs spilled to disk if max_memory is given'''
+    __slots__ = 'key', 'reverse', 'max_memory'
+
+    def __init__(self, key=None, reverse=False, max_memory=None):
+        self.key = key
+        self.reverse = reverse
+        self.max_memory = max_memory
+
+    def __call__(self, iterable):
+        if self.max_memory is not None:
+            return external_sorted(iterable, key=self.key,
+                                   reverse=self.reverse,
+                                   max_memory=self.max_memory)
+        return sorted(iterable, key=self.key, reverse=self.reverse)
+
+    def top(self, n):
+        '''Create a function getting the first n elements in the sorted
+        order with a heap, which is equivalent to ``sorted(...)[:n]``'''
+        select = heapq.nlargest if self.reverse else heapq.nsmallest
+        key = self.key
+        return lambda iterable: select(n, iterable, key=key)
+
+
+def is_indexable(source):
+    return isinstance(source, (list, tuple, range, Array))
+
+
+def iter_source_batches(source, size):
+    '''Split a source into batches of size elements. A source having an
+    ``iter_batches`` method, like a RecordBatch, splits itself.'''
+    iter_batches = getattr(source, 'iter_batches', None)
+    if iter_batches is not None:
+        return iter_batches(size)
+    return iter_chunks(source, size)
+
+
+_elem_op_stmts = {
+    'map': ['x = f{i}(x)'],
+    'starmap': ['x = f{i}(*x)'],
+    'filter': ['if not f{i}(x):', '    continue'],
+    'filter_false': ['if f{i}(x):', '    continue'],
+    'flat_map': ['for x in f{i}(x):'],
+    'flatten': ['for x in x:'],
+}
+
+_nesting_kinds = {'flat_map', 'flatten'}
+
+
+def _loop_lines(kinds, start, indent):
+    '''Source lines of one loop running ElemOp kinds over ``iterable``
+    and yielding the results. ``f{start}``, ``f{start+1}``... are the
+    functions of each op.'''
+    lines = [' ' * indent + 'for x in iterable:']
+    indent += 4
+    for i, kind in enumerate(kinds, start):
+        lines.extend(' ' * indent + stmt.format(i=i)
+                     for stmt in _elem_op_stmts[kind])
+        if kind in _nesting_kinds:
+            indent += 4
+    lines.append(' ' * indent + 'yield x')
+    return lines
+
+
+def _exec_func(lines, name):
+    namespace = {}
+    exec('\n'.join(lines), namespace)
+    return namespace[name]
+
+
+@fnt.lru_cache(maxsize=None)
+def _fused_loop(kinds):
+    '''Generate a generator function running a sequence of ElemOp kinds
+    in one loop. Generated functions are cached by the kinds sequence.'''
+    params = ''.join(f'f{i}, ' for i in range(len(kinds)))
+    lines = [f'def fused({params}iterable):']
+    lines.extend(_loop_lines(kinds, 0, 4))
+    return _exec_func(lines, 'fused')
+
+
+@fnt.lru_cache(maxsize=None)
+def _compiled_plan(kinds):
+    '''Generate a generator function running a whole pipeline.
+
+    ``kinds`` holds the ElemOp kind of each transformer, or None for
+    transformers that can't be inlined. Runs of inlinable transformers
+    become loops, and the others are called on the whole iterable.
+    '''
+    params = ''.join(f', f{i}' for i in range(len(kinds)))
+    lines = [f'def compiled(iterable{params}):']
+
+    segments = [(inlined, [i for i, _ in grp])
+                for inlined, grp in itt.groupby(
+                    enumerate(kinds), key=lambda i_k: i_k[1] is not None)]
+    for seg_idx, (inlined, indices) in enumerate(segments):
+        is_last = seg_idx == len(segments) - 1
+        if inlined and is_last:
+            lines.extend(_loop_lines(
+                [kinds[i] for i in indices], indices[0], 4))
+            break
+        elif inlined:
+            lines.append(f'    def segment_{seg_idx}(iterable):')
+            lines.extend(_loop_lines(
+                [kinds[i] for i in indices], indices[0], 8))
+            lines.append(f'    iterable = segment_{seg_idx}(iterable)')
+        else:
+            lines.extend(f'    iterable = f{i}(iterable)' for i in indices)
+    else:
+        lines.append('    yield from iterable')
+
+    return _exec_func(lines, 'compiled')
+
+
+def _op_func(op):
+    if op.func is None and op.kind in ('filter', 'filter_false'):
+        return bool
+    return op.func
+
+
+def fuse_elem_ops(ops):
+    '''Fuse a sequence of ElemOp into one function of
+    ``iterable -> iterable``
+
+    >>> fused = fuse_elem_ops([MapOp(lambda x: x * 2),
+    ...                        FilterOp(lambda x: x % 3 == 0),
+    ...                        MapOp(str)])
+    >>> list(fused(range(10)))
+    ['0', '6', '12', '18']
+    '''
+    loop = _fused_loop(tuple(op.kind for op in ops))
+    return fnt.partial(loop, *map(_op_func, ops))
+
+
+_fusable_kinds = {'map', 'starmap', 'filter', 'filter_false'}
+
+
+def _is_fusable(transformer):
+    return (transformer.is_elementwise() and
+            transformer.func.kind in _fusable_kinds and
+            isinstance(transformer.func.func, types.FunctionType))
+
+
+def fuse_transformers(transformers):
+    '''Group transformers into a tuple of functions of
+    ``iterable -> iterable`` to be run one after another.
+
+    Only consecutive maps and filters of Python functions are fused into
+    one loop, which saves calling through an iterator per stage. Other
+    transformers, and maps and filters of builtin functions like ``abs``,
+    are faster by the ``map`` and ``filter`` in C, so they are kept as
+    they are.
+
+    >>> runners = fuse_transformers([
+    ...     Transformer('abs', MapOp(abs)),
+    ...     Transformer('add_1', MapOp(lambda x: x + 1)),
+    ...     Transformer('is_odd', FilterOp(lambda x: x % 2))])
+    >>> len(runners)
+    2
+    >>> list(runners[1](runners[0]([-2, 3])))
+    [3]
+    '''
+    runners = []
+    for fusable, group in itt.groupby(transformers, key=_is_fusable):
+        group = list(group)
+        if fusable and len(group) > 1:
+            runners.append(fuse_elem_ops([trfmr.func for trfmr in group]))
+        else:
+            runners.extend(trfmr.func.runner() if trfmr.is_elementwise()
+                           else trfmr.transform for trfmr in group)
+    return tuple(runners)
+
+
+def compile_transformers(transformers):
+    '''Compile transformers into one function of ``iterable -> iterable``
+
+    >>> compiled = compile_transformers([
+    ...     Transformer('flat_map', FlatMapOp(range)),
+    ...     Transformer('sorted', sorted),
+    ...     Transformer('map', MapOp(lambda x: x * 2))])
+    >>> list(compiled([1, 3]))
+    [0, 0, 2, 4]
+    '''
+    kinds = tuple(trfmr.func.kind if trfmr.is_elementwise() else None
+                  for trfmr in transformers)
+    plan = _compiled_plan(kinds)
+    funcs = [_op_func(trfmr.func) if trfmr.is_elementwise()
+             else trfmr.transform
+             for trfmr in transformers]
+    return lambda iterable: plan(iterable, *funcs)
+
 
 class Transformer:
+    '''A stage of Pipeline.
+
+    The name can be a string or a zero parameter function building the
+    string, which is called only when the name is needed.
+    '''
     __slots__ = '_name', '_func'
 
     def __init__(self, name, func):
@@ -9,51 +358,293 @@ class Transformer:
     def transform(self, data):
         return self._func(data)
 
+    def transform_batches(self, batches, size):
+        '''Transform an iterable of lists of elements.
+
+        Functions without a batch implementation are run on the flattened
+        elements, and the results are split into batches again.
+        '''
+        transform_batches = getattr(self._func, 'transform_batches', None)
+        if transform_batches is not None:
+            return transform_batches(batches, size)
+
+        return iter_chunks(self._func(itt.chain.from_iterable(batches)), size)
+
     @property
     def name(self):
+        if not isinstance(self._name, str):
+            self._name = self._name()
         return self._name
 
+    @property
+    def func(self):
+        return self._func
+
+    def is_elementwise(self):
+        return isinstance(self._func, ElemOp)
+
+    def is_one_to_one(self):
+        '''Whether it maps each element to exactly one element in the same
+        order without depending on element positions'''
+        return getattr(self._func, 'one_to_one', False)
+
     def __repr__(self):
-        return f'<{type(self).__name__} {self._name}>'
+        return f'<{type(self).__name__} {self.name}>'
+
+
+class _Stage:
+    '''A node of the persistent linked list of transformers.
+    Pipelines sharing a prefix share the nodes of the prefix.'''
+    __slots__ = 'transformer', 'prev', 'length'
+
+    def __init__(self, transformer, prev):
+        self.transformer = transformer
+        self.prev = prev
+        self.length = 1 if prev is None else prev.length + 1
+
 
+def _append_stages(last_stage, transformers):
+    for transformer in transformers:
+        last_stage = _Stage(transformer, last_stage)
+    return last_stage
 
 
 class Pipeline:
-    __slots__ = '_transformers',
+    '''A sequence of transformers.
 
-    def __init__(self, transformers=None):
+    Pipeline is immutable. Transformers are stored in a persistent linked
+    list, so ``then`` creates a new Pipeline in ``O(1)``.
+    '''
+    __slots__ = ('_last_stage', '_batch_size', '_transformers', '_runners',
+                 '_plans')
+
+    def __init__(self, transformers=None, batch_size=None):
         if transformers is None:
             transformers = []
 
-        self._transformers = transformers
+        self._last_stage = _append_stages(None, transformers)
+        self._batch_size = batch_size
+        self._transformers = None
+        self._runners = None
+        self._plans = None
+
+    @classmethod
+    def _from_stage(cls, last_stage, batch_size):
+        pipeline = cls.__new__(cls)
+        pipeline._last_stage = last_stage
+        pipeline._batch_size = batch_size
+        pipeline._transformers = None
+        pipeline._runners = None
+        pipeline._plans = None
+        return pipeline
 
     def transform(self, data):
-        for transformer in self._transformers:
-            data = transformer.transform(data)
+        '''Run data through all transformers.
+
+        Consecutive maps and filters of Python functions are fused into a
+        single loop by ``fuse_transformers``, which is done once for the
+        Pipeline. In batch mode, lists of elements are passed between
+        transformers.
+        '''
+        if self._batch_size is not None:
+            return itt.chain.from_iterable(
+                self.transform_batches(
+                    iter_source_batches(data, self._batch_size)))
+
+        if self._runners is None:
+            self._runners = fuse_transformers(self.transformers)
+        for run in self._runners:
+            data = run(data)
         return data
 
+    def plan(self, source):
+        '''Rewrite the pipeline for evaluating on the source.
+
+        A slice following only one-to-one transformers is applied on the
+        source directly if the source is indexable. A slice after
+        ``sorted`` and one-to-one transformers turns the sorting into a
+        heap-based top-n selection.
+
+        The rewriting is worked out once for indexable sources and once
+        for others. The Pipeline itself is returned if nothing is
+        rewritten.
+
+        >>> double = Transformer('double', MapOp(lambda x: x * 2))
+        >>> take_2 = Transformer('take_2', SliceOp(None, 2))
+        >>> source, pipeline = Pipeline([double, take_2]).plan([3, 4, 5])
+        >>> source, pipeline
+        ([3, 4], <Pipeline [<Transformer double>]>)
+        >>> pipeline = Pipeline([double, take_2])
+        >>> pipeline.plan(iter([3, 4, 5]))[1] is pipeline
+        True
+
+        Returns
+        -------
+        Tuple[iterable, Pipeline]
+            the source and the pipeline to be evaluated
+        '''
+        plans = self._plans
+        if plans is None:
+            plans = self._plans = self._make_plans()
+        if not plans:
+            return source, self
+
+        source_slices, pipeline = plans[is_indexable(source)]
+        for source_slice in source_slices:
+            source = source[source_slice]
+        return source, pipeline
+
+    def _make_plans(self):
+        '''Get a dict from whether the source is indexable to the slices
+        to apply on the source and the rewritten pipeline, or an empty
+        dict if there's no slice to rewrite'''
+        if not any(isinstance(trfmr.func, SliceOp)
+                   for trfmr in self.transformers):
+            return {}
+        return {indexable: self._rewrite(indexable)
+                for indexable in (True, False)}
+
+    def _rewrite(self, indexable):
+        transformers = list(self.transformers)
+        source_slices = []
+        rewritten = False
+        index = 0
+        while index < len(transformers):
+            slice_op = transformers[index].func
+            if not isinstance(slice_op, SliceOp):
+                index += 1
+                continue
+
+            prev_index = index - 1
+            while prev_index >= 0 and transformers[prev_index].is_one_to_one():
+                prev_index -= 1
+
+            if prev_index < 0 and indexable:
+                source_slices.append(slice_op.to_slice())
+                del transformers[index]
+                rewritten = True
+                continue
+
+            prev_op = None if prev_index < 0 else transformers[prev_index].func
+            if isinstance(prev_op, SortedOp) and slice_op.stop is not None:
+                sorted_trfmr = transformers[prev_index]
+                transformers[prev_index] = Transformer(
+                    lambda trfmr=sorted_trfmr, n=slice_op.stop:
+                    f'{trfmr.name} top {n}',
+                    prev_op.top(slice_op.stop))
+                rewritten = True
+            index += 1
+
+        if not rewritten:
+            return (), self
+        return (tuple(source_slices),
+                type(self)(transformers, self._batch_size))
+
+    def transform_batches(self, batches):
+        '''Run an iterable of lists of elements through all transformers'''
+        size = self._batch_size or DEFAULT_BATCH_SIZE
+        for transformer in self.transformers:
+            batches = transformer.transform_batches(batches, size)
+        return batches
+
     @property
     def transformers(self):
+        if self._transformers is None:
+            transformers = []
+            stage = self._last_stage
+            while stage is not None:
+                transformers.append(stage.transformer)
+                stage = stage.prev
+            transformers.reverse()
+            self._transformers = tuple(transformers)
+
         return self._transformers
 
+    def is_one_to_one(self):
+        '''Whether all transformers are one-to-one, so that the pipeline
+        preserves length and position of elements'''
+        return all(trfmr.is_one_to_one() for trfmr in self.transformers)
+
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    def with_batch_size(self, batch_size):
+        '''Create a Pipeline in batch mode, or in element mode if batch_size
+        is None'''
+        return type(self)._from_stage(self._last_stage, batch_size)
 
     def then(self, transformer):
-        return type(self)(self._transformers + [transformer])
+        return type(self)._from_stage(
+            _Stage(transformer, self._last_stage), self._batch_size)
 
     def extended(self, other):
-        return type(self)(self._transformers + other._transformers)
+        return type(self)._from_stage(
+            _append_stages(self._last_stage, other.transformers),
+            self._batch_size)
+
+    def compile(self):
+        '''Create a CompiledPipeline running all transformers in a single
+        generated function'''
+        return CompiledPipeline(self.transformers, self._batch_size)
 
     def __repr__(self):
-        return f'<{type(self).__name__} {self._transformers!r}>'
+        return f'<{type(self).__name__} {list(self.transformers)!r}>'
 
     def is_empty(self):
-        return len(self._transformers) == 0
+        return self._last_stage is None
 
     def __len__(self):
-        return len(self._transformers)
+        return 0 if self._last_stage is None else self._last_stage.length
 
     def __str__(self):
         return (
             # f'{type(self).__name__}\n -> ' +
-            '\n'.join(f' -> {trfmr.name}' for trfmr in self._transformers)
+            '\n'.join(f' -> {trfmr.name}' for trfmr in self.transformers)
         )
+
+
+class CompiledPipeline(Pipeline):
+    '''A Pipeline which runs all its transformers in one generated
+    generator function.
+
+    Element-wise transformers are inlined as local operations in loops,
+    others are called on the whole iterable in between. The generated code
+    is cached by the shape of the pipeline, so compiling another pipeline
+    of the same shape only binds the functions.
+
+    Pipelines in batch mode run the same as uncompiled ones. Extending a
+    CompiledPipeline gives another CompiledPipeline, which is compiled
+    when it's first run.
+
+    >>> add_1 = Transformer('add_1', MapOp(lambda x: x + 1))
+    >>> pipeline = Pipeline().then(add_1)
+    >>> compiled = pipeline.compile()
+    >>> list(compiled.transform([1, 2, 3]))
+    [2, 3, 4]
+    >>> list(compiled.transform(range(2)))
+    [1, 2]
+    >>> list(compiled.then(add_1).transform([1, 2, 3]))
+    [3, 4, 5]
+    '''
+    __slots__ = '_compiled',
+
+    def __init__(self, transformers=None, batch_size=None):
+        super().__init__(transformers, batch_size)
+        self._compiled = compile_transformers(self.transformers)
+
+    @classmethod
+    def _from_stage(cls, last_stage, batch_size):
+        pipeline = super()._from_stage(last_stage, batch_size)
+        pipeline._compiled = None
+        return pipeline
+
+    def transform(self, data):
+        if self._batch_size is not None:
+            return super().transform(data)
+        if self._compiled is None:
+            self._compiled = compile_transformers(self.transformers)
+        return self._compiled(data)
+
+    def compile(self):
+        return self
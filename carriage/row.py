@@ -1,7 +1,190 @@
+import functools as fnt
 import itertools as itt
+import operator as op
+import weakref
 
 from .repr import short_repr
 
+try:
+    from _collections import _tuplegetter
+except ImportError:
+    def _tuplegetter(index, doc):
+        return property(op.itemgetter(index), doc=doc)
+
+
+class Schema:
+    '''Field names of Rows with a map from names to indexes.
+
+    Schemas are interned. All Rows with the same fields share one Schema
+    object, so a Row only stores its values and a pointer to its Schema.
+    The intern table only holds weak references, so a Schema is freed
+    when no Row or cache uses it anymore.
+
+    >>> schema = Schema(['x', 'y'])
+    >>> schema
+    Schema('x', 'y')
+    >>> schema is Row(x=1, y=2)._schema
+    True
+    >>> schema.index['y']
+    1
+    '''
+    __slots__ = 'fields', 'index', '_row_classes', '__weakref__'
+    # fields -> weak reference of the Schema
+    _interned = {}
+
+    def __new__(cls, fields):
+        fields = tuple(fields)
+        ref = cls._interned.get(fields)
+        if ref is not None:
+            schema = ref()
+            if schema is not None:
+                return schema
+
+        schema = object.__new__(cls)
+        schema.fields = fields
+        schema.index = {field: index for index, field in enumerate(fields)}
+        if len(schema.index) != len(fields):
+            raise ValueError(f'Duplicated field names: {fields!r}')
+        schema._row_classes = {}
+        cls._interned[fields] = weakref.ref(
+            schema, fnt.partial(_forget_schema, fields))
+        return schema
+
+    def row_class(self, base):
+        '''Get the subclass of a Row class for Rows of this Schema, which
+        has a descriptor for each field like namedtuple.
+
+        Fields named like public attributes of the Row class, e.g.
+        ``count``, are looked up before the attributes instead. Other
+        fields which can't be descriptors, like dunder names, are looked up
+        only if there's no such attribute. Row classes are kept by the
+        Schema, so they are freed along with the Schema.
+
+        >>> row_class = Schema(['x', 'y']).row_class(Row)
+        >>> issubclass(row_class, Row)
+        True
+        >>> type(Row(x=1, y=2)) is row_class
+        True
+        '''
+        try:
+            return self._row_classes[base]
+        except KeyError:
+            pass
+        if '_schema' in base.__dict__:
+            # base is a Row class of a Schema
+            return self.row_class(base.__bases__[0])
+
+        namespace = {}
+        shadowing = {}
+        for index, field in enumerate(self.fields):
+            if hasattr(base, field):
+                if not field.startswith('_'):
+                    shadowing[field] = index
+            elif (field.isidentifier() and field != '_schema' and
+                  not (field.startswith('__') and field.endswith('__'))):
+                namespace[field] = _tuplegetter(
+                    index, f'Alias for field number {index}')
+        if shadowing:
+            namespace['__getattribute__'] = _shadowing_getattribute(shadowing)
+        namespace.update(__slots__=(), _schema=self,
+                         __module__=base.__module__)
+        row_class = type(base.__name__, (base,), namespace)
+        return self._row_classes.setdefault(base, row_class)
+
+    def __reduce__(self):
+        return (Schema, (self.fields,))
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __contains__(self, field):
+        return field in self.index
+
+    def __repr__(self):
+        return f'Schema({", ".join(map(repr, self.fields))})'
+
+
+def _forget_schema(fields, ref):
+    if Schema._interned.get(fields) is ref:
+        del Schema._interned[fields]
+
+
+def _shadowing_getattribute(field_to_index):
+    '''Create a __getattribute__ looking up the fields before
+    attributes'''
+    def __getattribute__(self, name):
+        index = field_to_index.get(name)
+        if index is not None:
+            return tuple.__getitem__(self, index)
+        return tuple.__getattribute__(self, name)
+
+    return __getattribute__
+
+
+@fnt.lru_cache(maxsize=256)
+def positional_schema(length):
+    '''Get the Schema of fields f0, f1, ... of the length'''
+    return Schema(f'f{index}' for index in range(length))
+
+
+class _Plan:
+    '''Create Rows of an output Schema by gathering values from the
+    values of input Rows by indexes'''
+    __slots__ = 'row_class', 'gather'
+
+    def __init__(self, field_to_index):
+        self.row_class = Schema(field_to_index).row_class(Row)
+        indexes = list(field_to_index.values())
+        if len(indexes) == 0:
+            self.gather = lambda values: ()
+        elif len(indexes) == 1:
+            index, = indexes
+            self.gather = lambda values: (values[index],)
+        else:
+            self.gather = op.itemgetter(*indexes)
+
+    def __call__(self, values):
+        return tuple.__new__(self.row_class, self.gather(values))
+
+
+_PLAN_CACHE_SIZE = 4096
+
+
+@fnt.lru_cache(maxsize=_PLAN_CACHE_SIZE)
+def _evolve_plan(schema, new_fields):
+    field_to_index = schema.index.copy()
+    for offset, field in enumerate(new_fields, len(schema)):
+        field_to_index[field] = offset
+    return _Plan(field_to_index)
+
+
+@fnt.lru_cache(maxsize=_PLAN_CACHE_SIZE)
+def _project_plan(schema, fields, keep):
+    fields = set(fields)
+    return _Plan({field: index for field, index in schema.index.items()
+                  if (field in fields) == keep})
+
+
+@fnt.lru_cache(maxsize=_PLAN_CACHE_SIZE)
+def _merge_plan(schemas):
+    field_to_index = {}
+    offset = 0
+    for schema in schemas:
+        for field, index in schema.index.items():
+            field_to_index[field] = offset + index
+        offset += len(schema)
+    return _Plan(field_to_index)
+
+
+@fnt.lru_cache(maxsize=_PLAN_CACHE_SIZE)
+def _rename_plan(schema, renames):
+    renames = dict(renames)
+    return _Plan({renames.get(field, field): index
+                  for field, index in schema.index.items()})
+
 
 class Row(tuple):
     '''A named tuple like type without the need of declaring field names
@@ -51,7 +234,13 @@ class Row(tuple):
     >>> age
     30
 
+    Field names are kept in a ``Schema`` shared by all Rows with the same
+    fields. A Row itself only holds the values. Rows of a Schema are
+    instances of a subclass of Row generated for the Schema, which reads
+    fields by index like namedtuple.
     '''
+    __slots__ = ()
+
     @classmethod
     def from_values(cls, values, fields=None):
         '''Create Row from values
@@ -60,12 +249,26 @@ class Row(tuple):
         Row(f0=1, f1=2, f2=3)
         >>> Row.from_values([1, 2, 3], fields=['x', 'y', 'z'])
         Row(x=1, y=2, z=3)
+        >>> Row.from_values([1, 2, 3], fields=['x', 'y', 'x'])
+        Row(x=3, y=2)
 
         '''
+        values = tuple(values)
         if fields is None:
-            return cls(**{f'f{i}': v for i, v in enumerate(values)})
-        else:
-            return cls(**{f: v for f, v in zip(fields, values)})
+            return cls._from_schema(positional_schema(len(values)), values)
+
+        fields = tuple(fields)
+        try:
+            schema = Schema(fields)
+        except ValueError:
+            # Like keyword arguments, the last value of a duplicated field
+            # is kept
+            return cls.from_dict(dict(zip(fields, values)))
+        if len(schema) != len(values):
+            length = min(len(schema), len(values))
+            schema = Schema(schema.fields[:length])
+            values = values[:length]
+        return cls._from_schema(schema, values)
 
     @classmethod
     def from_dict(cls, adict, fields=None):
@@ -75,38 +278,26 @@ class Row(tuple):
         Row(name='Joe', age=30)
         '''
         if fields is None:
-            return cls(**adict)
+            return cls._from_schema(Schema(adict), adict.values())
         else:
-            return cls(**{f: adict[f] for f in fields})
+            return cls.from_values([adict[f] for f in fields], fields)
+
+    @classmethod
+    def _from_schema(cls, schema, values):
+        '''Create Row of a Schema from values in the order of its fields'''
+        return tuple.__new__(schema.row_class(cls), values)
 
-    def __new__(self, **kwargs):
+    def __new__(cls, **kwargs):
         '''Create Row by field names and values
 
         >>> Row(name='Joe', age=30, height=170)
         Row(name='Joe', age=30, height=170)
 
         '''
-        row = tuple.__new__(self, kwargs.values())
-        row._dict = kwargs
-
-        return row
-
-    def __getnewargs_ex__(self):
-        return ((), self._dict)
-
-    def __getattribute__(self, name):
-        if name in tuple.__getattribute__(self, '_dict'):
-            # Accessing Row fields has higher priority
-            # than accessing tuple methods
-            return tuple.__getattribute__(self, '_dict')[name]
-        else:
-            return tuple.__getattribute__(self, name)
+        return tuple.__new__(Schema(kwargs).row_class(cls), kwargs.values())
 
-    # def __getattr__(self, name):
-    #     if name in self._dict:
-    #         return self._dict[name]
-    #     else:
-    #         raise AttributeError(f'{self!r} has no attribute {name!r}')
+    def __reduce__(self):
+        return (Row.from_values, (tuple(self), self._schema.fields))
 
     def get_opt(self, field):
         '''Get field in Optional type
@@ -129,8 +320,9 @@ class Row(tuple):
 
         '''
         from .optional import Some, Nothing
-        if field in self._dict:
-            return Some(getattr(self, field))
+        index = self._schema.index.get(field)
+        if index is not None:
+            return Some(self[index])
 
         return Nothing
 
@@ -142,8 +334,9 @@ class Row(tuple):
         >>> Row(x=3, y=4).get('z', 0)
         0
         '''
-        if field in self._dict:
-            return getattr(self, field)
+        index = self._schema.index.get(field)
+        if index is not None:
+            return self[index]
 
         return fillvalue
 
@@ -154,16 +347,29 @@ class Row(tuple):
         True
 
         '''
-        return field in self._dict
+        return field in self._schema.index
+
+    def __getattr__(self, name):
+        # fields without descriptors, e.g. with names not identifiers
+        index = type(self)._schema.index.get(name)
+        if index is None:
+            raise AttributeError(
+                f"'Row' object has no attribute {name!r}")
+        return self[index]
 
     def __setattr__(self, name, value):
-        if name != '_dict':
-            raise TypeError("'Row' object does not support item assignment")
-        else:
-            super().__setattr__(name, value)
+        raise TypeError("'Row' object does not support item assignment")
 
     def fields(self):
-        return self._dict.keys()
+        '''Get field names
+
+        >>> Row(x=3, y=4).fields()
+        dict_keys(['x', 'y'])
+        '''
+        return self._schema.index.keys()
+
+    def _items(self):
+        return zip(self._schema.fields, self)
 
     def evolve(self, **kwargs):
         '''Create a new Row by replacing or adding other fields
@@ -174,9 +380,8 @@ class Row(tuple):
         >>> row.evolve(z=3)
         Row(x=23, y=9, z=3)
         '''
-        d = self._dict.copy()
-        d.update(kwargs)
-        return Row(**d)
+        plan = _evolve_plan(self._schema, tuple(kwargs))
+        return plan(self + tuple(kwargs.values()))
 
     def project(self, *fields):
         '''Create a new Row by keeping only specified fields
@@ -185,10 +390,7 @@ class Row(tuple):
         >>> row.project('x', 'y')
         Row(x=2, y=3)
         '''
-        fields = set(fields)
-        return Row(**{field: value
-                      for field, value in self._dict.items()
-                      if field in fields})
+        return _project_plan(self._schema, fields, True)(self)
 
     def without(self, *fields):
         '''Create a new Row by removing only specified fields
@@ -197,10 +399,7 @@ class Row(tuple):
         >>> row.without('z')
         Row(x=2, y=3)
         '''
-        fields = set(fields)
-        return Row(**{field: value
-                      for field, value in self._dict.items()
-                      if field not in fields})
+        return _project_plan(self._schema, fields, False)(self)
 
     def merge(self, *rows):
         '''Create a new merged Row.
@@ -211,10 +410,9 @@ class Row(tuple):
         Row(x=2, y=4, z=6, u=7)
 
         '''
-
-        field_value_pairs = itt.chain.from_iterable(row._dict.items()
-                                                    for row in (self,) + rows)
-        return Row(**{k: v for k, v in field_value_pairs})
+        rows = (self,) + rows
+        plan = _merge_plan(tuple(row._schema for row in rows))
+        return plan(tuple(itt.chain.from_iterable(rows)))
 
     def rename_fields(self, **kwargs):
         '''Create a new Row that field names renamed.
@@ -224,16 +422,15 @@ class Row(tuple):
         Row(x=2, y=3, c=4)
 
         '''
-        return Row(**{kwargs.get(k, k): v for k, v in self._dict.items()})
+        return _rename_plan(self._schema, tuple(kwargs.items()))(self)
 
     def transform(self, **kwargs):
-        d = self._dict.copy()
-        d.update({k: f(getattr(self, k))for k, f in kwargs.items()})
-        return Row(**d)
+        return self.evolve(**{k: f(getattr(self, k))
+                              for k, f in kwargs.items()})
 
     def to_dict(self):
         '''Convert to dict'''
-        return self._dict.copy()
+        return dict(self._items())
 
     def to_map(self):
         '''Convert to Map'''
@@ -250,7 +447,7 @@ class Row(tuple):
         >>> Row(x=3, y=4).to_fields()
         [Row(field='x', value=3), Row(field='y', value=4)]
         '''
-        return [Row(field=k, value=v) for k, v in self._dict.items()]
+        return [Row(field=k, value=v) for k, v in self._items()]
 
     def iter_fields(self):
         '''Convert to rows
@@ -258,7 +455,7 @@ class Row(tuple):
         >>> list(Row(x=3, y=4).iter_fields())
         [Row(field='x', value=3), Row(field='y', value=4)]
         '''
-        return (Row(field=k, value=v) for k, v in self._dict.items())
+        return (Row(field=k, value=v) for k, v in self._items())
 
     def to_list(self):
         '''Convert to list'''
@@ -266,7 +463,7 @@ class Row(tuple):
 
     def __repr__(self):
         kwargs_str = ', '.join(
-            f'{k}={short_repr.repr(v)}' for k, v in self._dict.items())
+            f'{k}={short_repr.repr(v)}' for k, v in self._items())
         return f'Row({kwargs_str})'
 
 
@@ -274,6 +471,7 @@ class namedrow:
 
     def __init__(self, *fields):
         self._fields = fields
+        self._schema = Schema(dict.fromkeys(fields))
 
     def __call__(self, *args, **kwargs):
         if args and kwargs:
@@ -281,11 +479,12 @@ class namedrow:
                 'Cannot use both args and kwargs to create {type(self)}')
 
         if args:
-            return Row(**{field: value
-                          for field, value in zip(self._fields, args)})
+            return Row.from_values(args, self._fields)
 
         if kwargs:
-            return Row(**{field: kwargs[field] for field in self._fields})
+            return Row._from_schema(
+                self._schema,
+                [kwargs[field] for field in self._schema.fields])
 
 
 CurrPrev = namedrow('curr', 'prev')
@@ -293,3 +492,4 @@ CurrNext = namedrow('curr', 'prev')
 ValueIndex = namedrow('value', 'index')
 KeyValues = namedrow('key', 'values')
 KeyValue = namedrow('key', 'value')
+KeyLeftRight = namedrow('key', 'left', 'right')
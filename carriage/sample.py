@@ -0,0 +1,110 @@
+import itertools as itt
+import math
+
+_missing = object()
+
+
+def _log_random(rng):
+    # random() may return 0.0 but never 1.0
+    return math.log(1.0 - rng.random())
+
+
+def _skip_length(rng, n, weight):
+    return int(_log_random(rng) / math.log(1.0 - weight))
+
+
+def reservoir_sample(iterable, n, rng):
+    '''Get a list of n elements sampled uniformly from an iterable in one
+    pass, by the Algorithm L. Random numbers are drawn only when an
+    element is taken, about ``n * log(N / n)`` times for N elements.
+
+    >>> import random
+    >>> sorted(reservoir_sample(range(3), 5, random.Random(0)))
+    [0, 1, 2]
+    >>> len(set(reservoir_sample(range(1000), 5, random.Random(0))))
+    5
+    '''
+    iterator = iter(iterable)
+    reservoir = list(itt.islice(iterator, n))
+    if len(reservoir) < n or n == 0:
+        return reservoir
+
+    weight = math.exp(_log_random(rng) / n)
+    while True:
+        skip = _skip_length(rng, n, weight)
+        elem = next(itt.islice(iterator, skip, None), _missing)
+        if elem is _missing:
+            return reservoir
+        reservoir[rng.randrange(n)] = elem
+        weight *= math.exp(_log_random(rng) / n)
+
+
+def bernoulli_sample(iterable, p, rng):
+    '''Lazily take each element with probability p. Gaps between taken
+    elements are drawn from the geometric distribution, so random numbers
+    are drawn only once per taken element.
+
+    >>> import random
+    >>> list(bernoulli_sample(range(5), 1, random.Random(0)))
+    [0, 1, 2, 3, 4]
+    '''
+    if not 0 <= p <= 1:
+        raise ValueError('p should be between 0 and 1')
+    if p == 0:
+        return
+    if p == 1:
+        yield from iterable
+        return
+
+    iterator = iter(iterable)
+    log_q = math.log(1.0 - p)
+    while True:
+        skip = int(_log_random(rng) / log_q)
+        elem = next(itt.islice(iterator, skip, None), _missing)
+        if elem is _missing:
+            return
+        yield elem
+
+
+class _GroupReservoir:
+    __slots__ = 'elems', 'seen', 'weight', 'next_index'
+
+    def __init__(self):
+        self.elems = []
+        self.seen = 0
+        self.weight = 1.0
+        self.next_index = None
+
+
+def grouped_reservoir_sample(iterable, key_func, n, rng):
+    '''Get a dict of key to a list of n elements sampled uniformly from
+    elements of the key in one pass, by the Algorithm L for each key.
+
+    >>> import random
+    >>> samples = grouped_reservoir_sample(
+    ...     range(100), lambda x: x % 2, 3, random.Random(0))
+    >>> {key: len(elems) for key, elems in samples.items()}
+    {0: 3, 1: 3}
+    '''
+    reservoirs = {}
+    for elem in iterable:
+        key = key_func(elem)
+        reservoir = reservoirs.get(key)
+        if reservoir is None:
+            reservoir = reservoirs[key] = _GroupReservoir()
+
+        reservoir.seen += 1
+        if len(reservoir.elems) < n:
+            reservoir.elems.append(elem)
+            if len(reservoir.elems) == n:
+                reservoir.weight = math.exp(_log_random(rng) / n)
+                reservoir.next_index = (
+                    reservoir.seen + 1 +
+                    _skip_length(rng, n, reservoir.weight))
+        elif reservoir.seen == reservoir.next_index:
+            reservoir.elems[rng.randrange(n)] = elem
+            reservoir.weight *= math.exp(_log_random(rng) / n)
+            reservoir.next_index = (
+                reservoir.seen + 1 + _skip_length(rng, n, reservoir.weight))
+
+    return {key: reservoir.elems for key, reservoir in reservoirs.items()}
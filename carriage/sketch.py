@@ -0,0 +1,494 @@
+import bisect
+import hashlib
+import heapq
+import itertools as itt
+import math
+import numbers
+import pickle
+import random
+from array import array
+from decimal import Decimal
+
+# Fixed, so pickles of elements don't change with the default protocol
+_PICKLE_PROTOCOL = 4
+
+
+def _framed(elem):
+    encoded = _to_bytes(elem)
+    return len(encoded).to_bytes(8, 'little') + encoded
+
+
+def _number_to_bytes(num):
+    if not isinstance(num, numbers.Real) and isinstance(num, complex):
+        if num.imag != 0:
+            return b'c' + _framed(num.real) + _framed(num.imag)
+        num = num.real
+    if isinstance(num, numbers.Integral):
+        return b'i' + str(int(num)).encode()
+
+    try:
+        numerator, denominator = num.as_integer_ratio()
+    except (OverflowError, ValueError):
+        # inf and nan
+        return b'r' + repr(float(num)).encode()
+    if denominator == 1:
+        return b'i' + str(numerator).encode()
+    return b'q' + f'{numerator}/{denominator}'.encode()
+
+
+def _to_bytes(elem):
+    '''Encode an element into bytes, which are the same for equal
+    elements of different types, e.g. 1, 1.0 and True'''
+    if isinstance(elem, str):
+        return b's' + elem.encode('utf-8', 'surrogatepass')
+    if isinstance(elem, (bytes, bytearray)):
+        return b'b' + bytes(elem)
+    if elem is None:
+        return b'n'
+    if isinstance(elem, (numbers.Number, Decimal)):
+        return _number_to_bytes(elem)
+    if isinstance(elem, tuple):
+        return b't' + b''.join(map(_framed, elem))
+    if isinstance(elem, frozenset):
+        return b'f' + b''.join(sorted(map(_framed, elem)))
+    return b'p' + _pickle_to_bytes(elem)
+
+
+def _pickle_to_bytes(elem):
+    elem_type = type(elem)
+    if elem_type.__hash__ is None or elem_type.__eq__ is object.__eq__:
+        # Unhashable, or compared by identity which differs across
+        # processes
+        raise TypeError(
+            f'stable_hash does not support {elem_type.__name__!r} objects')
+    try:
+        return pickle.dumps(elem, _PICKLE_PROTOCOL)
+    except Exception as exc:
+        raise TypeError(
+            f'stable_hash does not support {elem_type.__name__!r} objects '
+            f'which cannot be pickled') from exc
+
+
+def stable_hash(elem, digest_size=8):
+    '''Hash an element into an unsigned integer of digest_size bytes.
+
+    Unlike the builtin ``hash``, it's the same across processes, so
+    sketches built in different processes can be merged. Equal numbers
+    have the same hash regardless of their types.
+
+    Other hashable objects, like dates, are hashed by their pickle, which
+    should be the same for equal objects. TypeError is raised for
+    unhashable objects, objects compared by identity, and objects which
+    can't be pickled.
+
+    >>> stable_hash('carriage') == stable_hash('carriage')
+    True
+    >>> stable_hash(1) == stable_hash(1.0) == stable_hash(True)
+    True
+    >>> from datetime import date
+    >>> stable_hash(date(2019, 1, 1)) == stable_hash(date(2019, 1, 1))
+    True
+    >>> stable_hash(object())
+    Traceback (most recent call last):
+    ...
+    TypeError: stable_hash does not support 'object' objects
+    '''
+    return int.from_bytes(
+        hashlib.blake2b(_to_bytes(elem), digest_size=digest_size).digest(),
+        'little')
+
+
+class HyperLogLog:
+    '''Estimate the number of distinct elements with ``2 ** precision``
+    bytes of memory. The relative standard error is about
+    ``1.04 / sqrt(2 ** precision)``, i.e. 0.8% for the default precision.
+
+    >>> hll = HyperLogLog().update(range(10000))
+    >>> abs(hll.count() - 10000) < 200
+    True
+
+    Sketches of the same precision can be merged as if they were built
+    from all elements of both.
+
+    >>> hll2 = HyperLogLog().update(range(5000, 15000))
+    >>> abs(hll.merge(hll2).count() - 15000) < 300
+    True
+    '''
+    __slots__ = 'precision', 'registers'
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError('precision should be between 4 and 18')
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, elem):
+        '''Add an element'''
+        precision = self.precision
+        hashed = stable_hash(elem)
+        index = hashed >> (64 - precision)
+        rest_width = 64 - precision
+        rest = hashed & ((1 << rest_width) - 1)
+        rank = rest_width - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+        return self
+
+    def update(self, iterable):
+        '''Add all elements of an iterable'''
+        for elem in iterable:
+            self.add(elem)
+        return self
+
+    def merge(self, other):
+        '''Create a new sketch of elements of both sketches'''
+        if self.precision != other.precision:
+            raise ValueError('Cannot merge HyperLogLogs of different '
+                             'precisions')
+        merged = type(self)(self.precision)
+        merged.registers = bytearray(map(max, self.registers,
+                                         other.registers))
+        return merged
+
+    def count(self):
+        '''Get the estimated number of distinct elements'''
+        size = len(self.registers)
+        if size >= 128:
+            alpha = 0.7213 / (1 + 1.079 / size)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[size]
+
+        estimate = alpha * size * size / sum(
+            2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+    def __repr__(self):
+        return f'HyperLogLog(precision={self.precision})'
+
+
+class CountMinSketch:
+    '''Estimate counts of elements in ``width * depth`` counters.
+
+    An estimated count is never less than the real count. It exceeds the
+    real count by at most ``2 / width`` of the total count with
+    probability ``1 - 0.5 ** depth``.
+
+    >>> cms = CountMinSketch().update('abracadabra')
+    >>> cms['a'], cms['b'], cms['z']
+    (5, 2, 0)
+    '''
+    __slots__ = 'width', 'depth', 'total', 'counters'
+
+    def __init__(self, width=2048, depth=5):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.counters = [array('Q', bytes(8 * width)) for _ in range(depth)]
+
+    def _indexes(self, elem):
+        hashed = stable_hash(elem, digest_size=16)
+        first, second = hashed >> 64, hashed & ((1 << 64) - 1)
+        width = self.width
+        return [(first + row * second) % width for row in range(self.depth)]
+
+    def add(self, elem, count=1):
+        '''Add an element count times and get its estimated count'''
+        self.total += count
+        estimate = None
+        for row, index in zip(self.counters, self._indexes(elem)):
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def update(self, iterable):
+        '''Add all elements of an iterable'''
+        for elem in iterable:
+            self.add(elem)
+        return self
+
+    def __getitem__(self, elem):
+        return min(row[index]
+                   for row, index in zip(self.counters, self._indexes(elem)))
+
+    def merge(self, other):
+        '''Create a new sketch of elements of both sketches'''
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError('Cannot merge CountMinSketches of different '
+                             'shapes')
+        merged = type(self)(self.width, self.depth)
+        merged.total = self.total + other.total
+        merged.counters = [array('Q', map(sum, zip(row, other_row)))
+                           for row, other_row in zip(self.counters,
+                                                     other.counters)]
+        return merged
+
+    def __repr__(self):
+        return f'CountMinSketch(width={self.width}, depth={self.depth})'
+
+
+class HeavyHitters:
+    '''Track the top_k most frequent elements with a CountMinSketch.
+    Only the candidates and the sketch are kept in memory.
+
+    >>> hitters = HeavyHitters(top_k=2).update('abracadabra')
+    >>> hitters.most_common()
+    [('a', 5), ('b', 2)]
+    '''
+    __slots__ = 'top_k', 'sketch', 'candidates', '_min_count'
+
+    def __init__(self, top_k=10, width=2048, depth=5):
+        self.top_k = top_k
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {}
+        self._min_count = 0
+
+    def add(self, elem):
+        '''Add an element'''
+        count = self.sketch.add(elem)
+        candidates = self.candidates
+        if elem in candidates:
+            prev_count = candidates[elem]
+            candidates[elem] = count
+            if prev_count == self._min_count:
+                self._min_count = min(candidates.values())
+        elif len(candidates) < self.top_k:
+            candidates[elem] = count
+            self._min_count = min(candidates.values())
+        elif count > self._min_count:
+            del candidates[min(candidates, key=candidates.get)]
+            candidates[elem] = count
+            self._min_count = min(candidates.values())
+        return self
+
+    def update(self, iterable):
+        '''Add all elements of an iterable'''
+        for elem in iterable:
+            self.add(elem)
+        return self
+
+    def merge(self, other):
+        '''Create a new tracker of elements of both trackers'''
+        merged = type(self)(self.top_k, self.sketch.width, self.sketch.depth)
+        merged.sketch = self.sketch.merge(other.sketch)
+        counts = {elem: merged.sketch[elem]
+                  for elem in {**self.candidates, **other.candidates}}
+        merged.candidates = dict(heapq.nlargest(
+            self.top_k, counts.items(), key=lambda item: item[1]))
+        merged._min_count = min(merged.candidates.values(), default=0)
+        return merged
+
+    def most_common(self):
+        '''Get a list of (element, estimated count) from the most frequent
+        one'''
+        return sorted(self.candidates.items(),
+                      key=lambda item: item[1], reverse=True)
+
+    def __repr__(self):
+        return (f'HeavyHitters(top_k={self.top_k}, '
+                f'width={self.sketch.width}, depth={self.sketch.depth})')
+
+
+class QuantileSketch:
+    '''Estimate quantiles of comparable elements by a KLL sketch, which
+    keeps ``O(k)`` elements. The rank error is about ``1.7 / k`` of the
+    number of elements, e.g. 1% for the default k. Quantiles are exact
+    before the sketch is full.
+
+    >>> sketch = QuantileSketch().update(range(101))
+    >>> sketch.quantiles([0, 0.5, 0.9, 1])
+    [0, 50, 90, 100]
+
+    Sketches of the same k can be merged as if they were built from all
+    elements of both.
+
+    >>> sketch.merge(QuantileSketch().update(range(101, 150))).quantile(0.5)
+    74
+
+    Parameters
+    ----------
+    k : int
+        size of the top level compactor, which controls the accuracy
+    seed : int
+        seed of the random choices made while compacting
+    '''
+    __slots__ = 'k', 'count', 'compactors', '_random', '_capacity'
+    _shrink_rate = 2 / 3
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.count = 0
+        self.compactors = [[]]
+        self._random = random.Random(seed)
+        self._capacity = self._level_capacity(0)
+
+    def _level_capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self._shrink_rate ** depth * self.k)) + 1
+
+    def _size(self):
+        return sum(map(len, self.compactors))
+
+    def add(self, elem):
+        '''Add an element'''
+        self.compactors[0].append(elem)
+        self.count += 1
+        if len(self.compactors[0]) >= self._capacity:
+            self._compress()
+        return self
+
+    def update(self, iterable):
+        '''Add all elements of an iterable'''
+        for elem in iterable:
+            self.add(elem)
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            compactor = self.compactors[level]
+            if len(compactor) >= self._level_capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                compactor.sort()
+                # keep the odd one out at this level
+                odd = [compactor.pop()] if len(compactor) % 2 else []
+                offset = self._random.randrange(2)
+                self.compactors[level + 1].extend(compactor[offset::2])
+                self.compactors[level] = odd
+            level += 1
+        self._capacity = self._level_capacity(0)
+
+    def merge(self, other):
+        '''Create a new sketch of elements of both sketches'''
+        if self.k != other.k:
+            raise ValueError('Cannot merge QuantileSketches of different k')
+        merged = type(self)(self.k)
+        merged._random = random.Random(self._random.random())
+        merged.count = self.count + other.count
+        merged.compactors = [
+            list(itt.chain(*levels)) for levels in itt.zip_longest(
+                self.compactors, other.compactors, fillvalue=())]
+        merged._capacity = merged._level_capacity(0)
+        merged._compress()
+        return merged
+
+    def _weighted_elems(self):
+        weighted = sorted(
+            (elem, 1 << level)
+            for level, compactor in enumerate(self.compactors)
+            for elem in compactor)
+        elems = [elem for elem, _ in weighted]
+        cum_weights = list(itt.accumulate(weight for _, weight in weighted))
+        return elems, cum_weights
+
+    def quantiles(self, qs):
+        '''Get the estimated quantiles of a list of fractions from 0 to 1'''
+        elems, cum_weights = self._weighted_elems()
+        if not elems:
+            raise ValueError('Cannot get quantiles of an empty sketch')
+        total = cum_weights[-1]
+        results = []
+        for q in qs:
+            if not 0 <= q <= 1:
+                raise ValueError('quantile should be between 0 and 1')
+            index = bisect.bisect_left(cum_weights, q * total)
+            results.append(elems[min(index, len(elems) - 1)])
+        return results
+
+    def quantile(self, q):
+        '''Get the estimated quantile of a fraction from 0 to 1'''
+        return self.quantiles([q])[0]
+
+    def rank(self, value):
+        '''Get the estimated number of elements less than or equal to
+        the value'''
+        elems, cum_weights = self._weighted_elems()
+        index = bisect.bisect_right(elems, value)
+        estimate = cum_weights[index - 1] if index else 0
+        if cum_weights:
+            estimate = estimate * self.count / cum_weights[-1]
+        return round(estimate)
+
+    def __repr__(self):
+        return f'QuantileSketch(k={self.k})'
+
+
+class Histogram:
+    '''Count elements in bins separated by sorted edges. A bin includes
+    its low edge, and the last bin includes its high edge too. Elements
+    out of the edges are counted as ``under`` and ``over``.
+
+    >>> hist = Histogram([0, 5, 10]).update([1, 5, 7, 10, 11])
+    >>> hist.counts, hist.over
+    ([1, 3], 1)
+
+    Histograms of the same edges can be merged.
+    '''
+    __slots__ = 'edges', 'counts', 'under', 'over'
+
+    def __init__(self, edges):
+        self.edges = list(edges)
+        if len(self.edges) < 2:
+            raise ValueError('There should be at least 2 edges')
+        if any(low >= high for low, high in zip(self.edges, self.edges[1:])):
+            raise ValueError('Edges should be strictly increasing')
+        self.counts = [0] * (len(self.edges) - 1)
+        self.under = 0
+        self.over = 0
+
+    @classmethod
+    def equal_width(cls, low, high, bins):
+        '''Create a Histogram of bins of the same width from low to high.
+        If low equals high, the range is widened by 0.5 on both sides.
+
+        >>> Histogram.equal_width(0, 1, 4).edges
+        [0.0, 0.25, 0.5, 0.75, 1.0]
+        >>> Histogram.equal_width(3, 3, 2).edges
+        [2.5, 3.0, 3.5]
+        '''
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        width = (high - low) / bins
+        return cls([low + width * index for index in range(bins)] +
+                   [float(high)])
+
+    def add(self, elem, count=1):
+        '''Add an element'''
+        edges = self.edges
+        if elem < edges[0]:
+            self.under += count
+        elif elem > edges[-1]:
+            self.over += count
+        elif elem == edges[-1]:
+            self.counts[-1] += count
+        else:
+            self.counts[bisect.bisect_right(edges, elem) - 1] += count
+        return self
+
+    def update(self, iterable):
+        '''Add all elements of an iterable'''
+        for elem in iterable:
+            self.add(elem)
+        return self
+
+    def merge(self, other):
+        '''Create a new Histogram of elements of both Histograms'''
+        if self.edges != other.edges:
+            raise ValueError('Cannot merge Histograms of different edges')
+        merged = type(self)(self.edges)
+        merged.counts = [count + other_count for count, other_count
+                         in zip(self.counts, other.counts)]
+        merged.under = self.under + other.under
+        merged.over = self.over + other.over
+        return merged
+
+    def bins(self):
+        '''Get a list of ``(low, high, count)`` of each bin'''
+        return list(zip(self.edges, self.edges[1:], self.counts))
+
+    def __repr__(self):
+        return f'Histogram({self.edges!r})'
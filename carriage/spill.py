@@ -0,0 +1,260 @@
+import heapq
+import itertools as itt
+import os
+import pickle
+import sys
+import tempfile
+import weakref
+
+PICKLE_CHUNK_SIZE = 1024
+MERGE_FAN_IN = 64
+_SIZE_SAMPLE = 256
+
+
+def write_pickled(file, iterable, chunksize=PICKLE_CHUNK_SIZE):
+    '''Write elements into a binary file as consecutive pickled lists of
+    at most chunksize elements. Return the number of elements written.'''
+    count = 0
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itt.islice(iterator, chunksize))
+        if not chunk:
+            return count
+        pickle.dump(chunk, file, pickle.HIGHEST_PROTOCOL)
+        count += len(chunk)
+
+
+def read_pickled(file):
+    '''Lazily read elements written by ``write_pickled`` from the current
+    position of the file.'''
+    while True:
+        try:
+            chunk = pickle.load(file)
+        except EOFError:
+            return
+        yield from chunk
+
+
+def hash_partitioned(iterable, key_func, partitions):
+    '''Split elements into temporary files by the hash of their keys and
+    yield an iterator of elements of each partition in turn.
+
+    Elements with the same key are always in the same partition, and
+    keep their order in it. An iterator should be consumed before getting
+    the next one, as its file is closed by then.
+
+    >>> [sorted(part) for part in hash_partitioned(range(6), abs, 3)]
+    [[0, 3], [1, 4], [2, 5]]
+    '''
+    if partitions < 1:
+        raise ValueError('partitions should be at least 1')
+
+    files = [tempfile.TemporaryFile() for _ in range(partitions)]
+    try:
+        buffers = [[] for _ in range(partitions)]
+        for elem in iterable:
+            index = hash(key_func(elem)) % partitions
+            buffer = buffers[index]
+            buffer.append(elem)
+            if len(buffer) >= PICKLE_CHUNK_SIZE:
+                pickle.dump(buffer, files[index], pickle.HIGHEST_PROTOCOL)
+                buffer.clear()
+
+        for file, buffer in zip(files, buffers):
+            if buffer:
+                pickle.dump(buffer, file, pickle.HIGHEST_PROTOCOL)
+            file.seek(0)
+        del buffers
+
+        for file in files:
+            yield read_pickled(file)
+            file.close()
+    finally:
+        for file in files:
+            file.close()
+
+
+def estimate_size(obj):
+    '''Roughly estimate memory used by an object in bytes, including its
+    direct items if it's a tuple, list, set or dict.
+
+    >>> estimate_size((1, 'a')) > estimate_size(1)
+    True
+    '''
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list, set, frozenset)):
+        size += sum(map(sys.getsizeof, obj))
+    elif isinstance(obj, dict):
+        size += sum(map(sys.getsizeof, obj.keys()))
+        size += sum(map(sys.getsizeof, obj.values()))
+    return size
+
+
+def take_within_memory(iterator, max_memory):
+    '''Take elements from an iterator into a list until their estimated
+    size reaches max_memory bytes. At least one element is taken unless
+    the iterator is exhausted.
+
+    The size per element is estimated from the first elements taken.
+
+    >>> itr = iter(range(1000))
+    >>> first = take_within_memory(itr, 20000)
+    >>> 1 <= len(first) < 1000
+    True
+    >>> len(first) + len(list(itr))
+    1000
+    '''
+    elems = []
+    used = 0
+    for elem in itt.islice(iterator, _SIZE_SAMPLE):
+        elems.append(elem)
+        # list slots are 8 bytes per element
+        used += estimate_size(elem) + 8
+        if used >= max_memory:
+            return elems
+
+    if not elems:
+        return elems
+
+    capacity = int(max_memory * len(elems) / used)
+    elems.extend(itt.islice(iterator, max(capacity - len(elems), 0)))
+    return elems
+
+
+def _write_run(directory, elems, chunksize):
+    fd, path = tempfile.mkstemp(suffix='.carriage-run', dir=directory)
+    with os.fdopen(fd, 'wb') as file:
+        write_pickled(file, elems, chunksize)
+    return path
+
+
+def _read_run(path):
+    with open(path, 'rb') as file:
+        yield from read_pickled(file)
+
+
+def external_sorted(iterable, key=None, reverse=False, max_memory=None,
+                    fan_in=MERGE_FAN_IN):
+    '''Lazily sort elements with about max_memory bytes of memory.
+
+    Elements are sorted in runs fitting in memory. Runs are spilled into
+    files of a temporary directory, and then merged lazily by
+    ``heapq.merge``. If all elements fit in one run, nothing is written to
+    disk. The sorting is stable as the builtin ``sorted``.
+
+    At most fan_in runs are open and merged at a time. If there are more,
+    groups of fan_in consecutive runs are merged into longer runs first,
+    in as many passes as needed. Runs are written in chunks of about
+    ``max_memory / fan_in`` bytes, which is how much of each run is read
+    ahead, so merging also takes about max_memory bytes.
+
+    >>> list(external_sorted([5, 3, 4, 1, 2], max_memory=1, fan_in=2))
+    [1, 2, 3, 4, 5]
+    '''
+    if fan_in < 2:
+        raise ValueError('fan_in should be at least 2')
+
+    iterator = iter(iterable)
+    run = take_within_memory(iterator, max_memory)
+    run.sort(key=key, reverse=reverse)
+    for peeked in iterator:
+        iterator = itt.chain([peeked], iterator)
+        break
+    else:
+        yield from run
+        return
+
+    chunksize = max(1, min(PICKLE_CHUNK_SIZE, len(run) // fan_in))
+    with tempfile.TemporaryDirectory(prefix='carriage-sort-') as directory:
+        paths = []
+        while run:
+            paths.append(_write_run(directory, run, chunksize))
+            run = []
+            run = take_within_memory(iterator, max_memory)
+            run.sort(key=key, reverse=reverse)
+
+        while len(paths) > fan_in:
+            merged = []
+            for start in range(0, len(paths), fan_in):
+                group = paths[start:start + fan_in]
+                if len(group) == 1:
+                    merged.extend(group)
+                    continue
+                merged.append(_write_run(
+                    directory,
+                    heapq.merge(*map(_read_run, group),
+                                key=key, reverse=reverse),
+                    chunksize))
+                for path in group:
+                    os.remove(path)
+            paths = merged
+
+        runs = [_read_run(path) for path in paths]
+        try:
+            yield from heapq.merge(*runs, key=key, reverse=reverse)
+        finally:
+            for run in runs:
+                run.close()
+
+
+class SpillCache:
+    '''A re-iterable cache of elements. The first elements within
+    max_memory bytes are kept in memory, the rest are spilled into a
+    segment file and read sequentially on each iteration.
+
+    >>> cache = SpillCache(range(1000), max_memory=1000)
+    >>> cache.spilled_count > 0
+    True
+    >>> sum(cache) == sum(cache) == sum(range(1000))
+    True
+
+    Parameters
+    ----------
+    iterable : iterable
+        elements to cache. They should be picklable if spilled.
+    max_memory : int
+        rough memory budget in bytes for the elements kept in memory.
+        All elements are spilled if it's 0.
+    path : str or Path
+        path of the segment file. A temporary file is used if not given,
+        which is removed when the cache is garbage collected.
+    '''
+
+    def __init__(self, iterable, max_memory, path=None):
+        iterator = iter(iterable)
+        if max_memory > 0:
+            self._memory = take_within_memory(iterator, max_memory)
+        else:
+            self._memory = []
+        self._path = None
+        self.spilled_count = 0
+
+        for peeked in iterator:
+            iterator = itt.chain([peeked], iterator)
+            break
+        else:
+            return
+
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.carriage-cache')
+            file = os.fdopen(fd, 'wb')
+            weakref.finalize(self, os.remove, path)
+        else:
+            file = open(path, 'wb')
+
+        with file:
+            self.spilled_count = write_pickled(file, iterator)
+        self._path = path
+
+    def __len__(self):
+        return len(self._memory) + self.spilled_count
+
+    def __iter__(self):
+        yield from self._memory
+        if self._path is not None:
+            with open(self._path, 'rb') as file:
+                yield from read_pickled(file)
+
+    def __repr__(self):
+        return (f'{type(self).__name__}(in_memory={len(self._memory)}, '
+                f'spilled={self.spilled_count})')
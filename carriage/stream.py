@@ -4,26 +4,42 @@ import functools as fnt
 import heapq
 import io
 import itertools as itt
+import operator as op
+import random
 import reprlib
+import time
 from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
 from tabulate import tabulate, tabulate_formats
 
+from . import parallel
+from .aggregator import aggregate, group_aggregate, reduce_by_key
 from .array import Array
+from .join import JOIN_HOWS, JOIN_METHODS, hash_join, merge_join
 from .monad import Monad
 from .optional import Nothing, Some
-from .pipeline import Pipeline, Transformer
+from .parallel import iter_chunks
+from .pipeline import (DEFAULT_BATCH_SIZE, BatchMapOp, FilterFalseOp, FilterOp,
+                       FlatMapOp, FlattenOp, MapOp, Pipeline, SliceOp,
+                       SortedOp, StarmapOp, Transformer, is_indexable,
+                       iter_source_batches)
 from .repr import repr_args, short_repr
-from .row import CurrNext, CurrPrev, KeyValues, Row, ValueIndex
+from .row import (CurrNext, CurrPrev, KeyLeftRight, KeyValue, KeyValues,
+                  Row, Schema, ValueIndex)
+from .sample import (bernoulli_sample, grouped_reservoir_sample,
+                     reservoir_sample)
+from .sketch import HeavyHitters, Histogram, HyperLogLog, QuantileSketch
+from .spill import SpillCache, hash_partitioned
 
 
 def as_stream(f):
     @fnt.wraps(f)
     def wraped(self, *args, **kwargs):
-        args_str = repr_args(*args, **kwargs)
-        trfmr = Transformer(name=f'{f.__name__}({args_str})',
-                            func=f(self, *args, **kwargs))
+        trfmr = Transformer(
+            name=lambda: f'{f.__name__}({repr_args(*args, **kwargs)})',
+            func=f(self, *args, **kwargs))
 
         return type(self)(
             iterable=self._iterable,
@@ -34,6 +50,19 @@ def as_stream(f):
     return wraped
 
 
+def identity(_): return _
+
+
+def _partitioned_tr(transform, key_func, partitions):
+    '''Create a transformer function applying transform to each hash
+    partition of the elements, which are spilled to disk.'''
+    def partitioned_tr(items):
+        for partition in hash_partitioned(items, key_func, partitions):
+            yield from transform(partition)
+
+    return partitioned_tr
+
+
 class Stream(Monad):
     '''An iterable wrapper for building a lazy-evaluating sequence
     transformation pipeline.
@@ -126,6 +155,135 @@ class Stream(Monad):
             for index, elem in enumerate(elems):
                 print(f'    [{index}] {elem!r}')
 
+    def profile(self):
+        '''Evaluate the Stream and report elements counts and time spent
+        in the source and each stage.
+
+        Stages are run one by one without fusion in element mode, so the
+        total time is somewhat longer than a normal evaluation.
+
+        >>> report = Stream.range(10).map(abs).filter(bool).profile()
+        >>> report.select('stage', 'elems_in', 'elems_out', 'selectivity').show()
+        | stage                        |   elems_in |   elems_out |   selectivity |
+        |------------------------------+------------+-------------+---------------|
+        | range(0, 10)                 |            |          10 |               |
+        | map(<built-in function abs>) |         10 |          10 |           1   |
+        | filter(<class 'bool'>)       |         10 |           9 |           0.9 |
+
+        Returns
+        -------
+        StreamTable
+            A Row for the source and each stage, with fields
+            ``stage``, ``elems_in``, ``elems_out``, ``selectivity``,
+            ``seconds`` (time spent in the stage itself) and
+            ``seconds_per_elem`` (per input element)
+        '''  # noqa
+        from .streamtable import StreamTable
+
+        timer = _StageTimer()
+        profiled = [_ProfiledIterator(iter(self._iterable), timer)]
+        for trfmr in self._pipeline.transformers:
+            start = timer.enter()
+            try:
+                output = iter(trfmr.transform(profiled[-1]))
+            finally:
+                elapsed = timer.exit(start)
+            profiled.append(_ProfiledIterator(output, timer, elapsed))
+
+        deque(profiled[-1], 0)
+
+        names = ([short_repr.repr(self._iterable)] +
+                 [trfmr.name for trfmr in self._pipeline.transformers])
+        rows = []
+        prev = None
+        for name, curr in zip(names, profiled):
+            if prev is None:
+                elems_in = selectivity = seconds_per_elem = None
+            else:
+                elems_in = prev.count
+                selectivity = curr.count / elems_in if elems_in else None
+                seconds_per_elem = (curr.elapsed / elems_in
+                                    if elems_in else None)
+
+            rows.append(Row(stage=name,
+                            elems_in=elems_in,
+                            elems_out=curr.count,
+                            selectivity=selectivity,
+                            seconds=curr.elapsed,
+                            seconds_per_elem=seconds_per_elem))
+            prev = curr
+
+        return StreamTable(rows)
+
+    def compile(self):
+        '''Create a new Stream which runs the whole pipeline in a single
+        generated function.
+
+        Element-wise stages like ``map`` and ``filter`` are inlined into
+        loops. The generated code is cached by the shape of the pipeline,
+        so compiling a freshly built pipeline of the same shape is cheap.
+
+        >>> def build(nums):
+        ...     return (Stream(nums)
+        ...             .map(lambda x: x * 2)
+        ...             .filter(lambda x: x > 2)
+        ...             .compile())
+        >>> build([1, 2, 3]).to_list()
+        [4, 6]
+        >>> build(range(5)).to_list()
+        [4, 6, 8]
+
+        Returns
+        -------
+        Stream
+        '''
+        return type(self)(
+            iterable=self._iterable,
+            pipeline=self._pipeline.compile())
+
+    def in_batches(self, size=DEFAULT_BATCH_SIZE):
+        '''Create a new Stream evaluated in batch mode.
+
+        In batch mode, lists of ``size`` elements instead of single
+        elements are passed between stages. Element-wise stages like
+        ``map``, ``filter`` and ``pluck`` and ``map_batches`` process a
+        whole batch per call. Other stages are adapted automatically. The
+        ``sum``, ``value_counts`` and ``write_txt`` actions also consume
+        whole batches.
+
+        >>> (Stream.range(10)
+        ...  .in_batches(4)
+        ...  .map(lambda x: x * 2)
+        ...  .filter(lambda x: x % 3 == 0)
+        ...  .to_list())
+        [0, 6, 12, 18]
+
+        Parameters
+        ----------
+        size : int or None
+            number of elements in a batch. Set to None to switch back to
+            element mode.
+
+        Returns
+        -------
+        Stream
+        '''
+        if size is not None and size < 1:
+            raise ValueError('batch size should be at least 1')
+
+        return type(self)(
+            iterable=self._iterable,
+            pipeline=self._pipeline.with_batch_size(size))
+
+    def _iter_elems(self):
+        if self._pipeline.batch_size is not None:
+            return itt.chain.from_iterable(self._iter_batches())
+        return iter(self)
+
+    def _iter_batches(self):
+        return self._pipeline.transform_batches(
+            iter_source_batches(self._iterable, self._pipeline.batch_size))
+
     @classmethod
     def range(cls, start, end=None, step=1):
         '''Create a Stream from range.
@@ -254,7 +412,11 @@ class Stream(Monad):
                 self._write_txt_file(f, sep)
 
     def _write_txt_file(self, f, sep='\n'):
-        self.for_each(lambda line: f.write(str(line) + sep))
+        if self._pipeline.batch_size is not None:
+            for batch in self._iter_batches():
+                f.write(sep.join(map(str, batch)) + sep)
+        else:
+            self.for_each(lambda line: f.write(str(line) + sep))
 
     @property
     def _base_type(self):
@@ -362,7 +524,18 @@ class Stream(Monad):
         >>> Stream([(1, 2), (3, 4)]).tuple_as_row(['x', 'y']).to_list()
         [Row(x=1, y=2), Row(x=3, y=4)]
         '''
-        return fnt.partial(map, lambda tpl: Row.from_values(tpl, fields=fields))
+        fields = tuple(fields)
+        if len(set(fields)) != len(fields):
+            return MapOp(lambda tpl: Row.from_values(tpl, fields=fields))
+
+        schema = Schema(fields)
+
+        def tuple_to_row(tpl):
+            if len(tpl) == len(schema):
+                return Row._from_schema(schema, tpl)
+            return Row.from_values(tpl, fields=fields)
+
+        return MapOp(tuple_to_row)
 
     @as_stream
     def dict_as_row(self, fields=None):
@@ -375,7 +548,12 @@ class Stream(Monad):
         >>> stm.dict_as_row(['age', 'name']).to_list()
         [Row(age=35, name='John'), Row(age=28, name='Frank')]
         '''
-        return fnt.partial(map, lambda d: Row.from_dict(d, fields=fields))
+        if fields is None:
+            return MapOp(Row.from_dict)
+
+        fields = tuple(dict.fromkeys(fields))
+        schema = Schema(fields)
+        return MapOp(lambda d: Row._from_schema(schema, [d[f] for f in fields]))
 
     @as_stream
     def map(self, func):
@@ -388,7 +566,32 @@ class Stream(Monad):
         -------
         Stream
         '''
-        return fnt.partial(map, func)
+        return MapOp(func)
+
+    @as_stream
+    def map_batches(self, func, size=None):
+        '''Create a new Stream by applying a batch function to lists of
+        elements. The function should return a sequence of results, like
+        a list or a NumPy array.
+
+        >>> def double_all(nums):
+        ...     return [n * 2 for n in nums]
+        >>> Stream.range(5, 8).map_batches(double_all).to_list()
+        [10, 12, 14]
+
+        Parameters
+        ----------
+        func : function of type ``list -> sequence``
+            batch function
+        size : int
+            number of elements in a batch. Defaults to the batch size of
+            the Stream in batch mode, or 1024.
+
+        Returns
+        -------
+        Stream
+        '''
+        return BatchMapOp(func, size)
 
     @as_stream
     def starmap(self, func):
@@ -403,7 +606,7 @@ class Stream(Monad):
         >>> Stream([(1, 2), (3, 4)]).map(lambda a_b: a_b[0]+a_b[1]).to_list()
         [3, 7]
         '''
-        return fnt.partial(itt.starmap, func)
+        return StarmapOp(func)
 
     @as_stream
     def flatten(self):
@@ -416,7 +619,7 @@ class Stream(Monad):
         -------
         Stream
         '''
-        return itt.chain.from_iterable
+        return FlattenOp()
 
     @as_stream
     def flat_map(self, to_iterable_func):
@@ -429,10 +632,189 @@ class Stream(Monad):
         -------
         Stream
         '''
+        return FlatMapOp(to_iterable_func)
+
+    @as_stream
+    def par_map(self, func, workers=None, chunksize=64, ordered=True,
+                max_chunks_in_flight=None):
+        '''Create a new Stream by applying function to each element in
+        a pool of worker processes.
+
+        Elements are sent to workers in chunks. The Stream is still
+        lazy-evaluating, at most ``max_chunks_in_flight`` chunks are
+        submitted but not yet consumed at any time.
+
+        >>> Stream.range(-3, 3).par_map(abs, workers=2, chunksize=2).to_list()
+        [3, 2, 1, 0, 1, 2]
+
+        Parameters
+        ----------
+        func : picklable function
+            function applied to each element in worker processes
+        workers : int
+            number of worker processes. defaults to the number of CPUs
+        chunksize : int
+            number of elements sent to a worker at a time
+        ordered : bool
+            keep the order of source elements. If False, elements of the
+            chunk finished first are yielded first.
+        max_chunks_in_flight : int
+            defaults to twice the number of workers
+
+        Returns
+        -------
+        Stream
+        '''
+        return self._par_chunk_map_tr(parallel.map_chunk, func, workers,
+                                      chunksize, ordered,
+                                      max_chunks_in_flight)
+
+    @as_stream
+    def par_flat_map(self, to_iterable_func, workers=None, chunksize=64,
+                     ordered=True, max_chunks_in_flight=None):
+        '''Apply function to each element in a pool of worker processes,
+        then flatten the result.
+
+        >>> Stream([1, 2, 3]).par_flat_map(range, workers=2).to_list()
+        [0, 0, 1, 0, 1, 2]
+
+        See ``par_map`` for the parameters.
+
+        Returns
+        -------
+        Stream
+        '''
+        return self._par_chunk_map_tr(parallel.flat_map_chunk,
+                                      to_iterable_func, workers,
+                                      chunksize, ordered,
+                                      max_chunks_in_flight)
+
+    @as_stream
+    def map_threaded(self, func, max_workers=None, max_in_flight=None,
+                     ordered=True):
+        '''Create a new Stream by applying function to each element in
+        a pool of threads. It's suitable for functions blocking on I/O.
+
+        The Stream is still lazy-evaluating. At most ``max_in_flight``
+        calls are submitted but not yet consumed at any time, so it works
+        on infinite Streams too.
+
+        >>> Stream.count(1).map_threaded(lambda n: n * 2, max_workers=4).take(5).to_list()
+        [2, 4, 6, 8, 10]
+
+        Parameters
+        ----------
+        func : function
+            function applied to each element
+        max_workers : int
+            number of threads. defaults to the same as ThreadPoolExecutor
+        max_in_flight : int
+            defaults to twice the number of threads
+        ordered : bool
+            keep the order of source elements. If False, results are
+            yielded as soon as they are ready.
+
+        Returns
+        -------
+        Stream
+        '''  # noqa
+        if max_workers is None:
+            max_workers = parallel.default_thread_workers()
+        if max_in_flight is None:
+            max_in_flight = max_workers * 2
+
+        def map_threaded_tr(iterable):
+            return parallel.executor_map(
+                lambda: ThreadPoolExecutor(max_workers),
+                func, iterable, max_in_flight, ordered)
+        return map_threaded_tr
+
+    @staticmethod
+    def _par_chunk_map_tr(chunk_func, func, workers, chunksize, ordered,
+                          max_chunks_in_flight):
+        if workers is None:
+            workers = parallel.default_workers()
+        if max_chunks_in_flight is None:
+            max_chunks_in_flight = workers * 2
+
+        def par_chunk_map_tr(iterable):
+            return parallel.executor_chunk_map(
+                lambda: ProcessPoolExecutor(workers),
+                chunk_func, func, iterable,
+                chunksize, max_chunks_in_flight, ordered)
+        return par_chunk_map_tr
+
+    @as_stream
+    def sample(self, n, seed=None):
+        '''Create a new Stream of n elements sampled uniformly from all
+        elements in one pass, with memory for n elements only.
+
+        It's a reservoir sampling by the Algorithm L, which skips ahead
+        without drawing random numbers for each element.
+
+        >>> Stream.range(1000).sample(5, seed=3).len()
+        5
+        >>> Stream.range(3).sample(5).to_list()
+        [0, 1, 2]
+
+        Parameters
+        ----------
+        n : int
+            sample size
+        seed : int
+            the same seed gives the same sample of the same elements
+
+        Returns
+        -------
+        Stream
+        '''
+        def sample_tr(items):
+            return reservoir_sample(items, n, random.Random(seed))
+
+        return sample_tr
+
+    @as_stream
+    def sample_fraction(self, p, seed=None):
+        '''Create a new Stream lazily taking each element with probability
+        p, keeping the order of elements.
+
+        Gaps between taken elements are drawn from a geometric
+        distribution, so random numbers are not drawn for each element.
+
+        >>> 50 < Stream.range(1000).sample_fraction(0.1, seed=3).len() < 150
+        True
+
+        Returns
+        -------
+        Stream
+        '''
+        def sample_fraction_tr(items):
+            return bernoulli_sample(items, p, random.Random(seed))
+
+        return sample_fraction_tr
+
+    @as_stream
+    def sample_by(self, key_func, n, seed=None):
+        '''Create a new Stream of at most n elements sampled uniformly
+        from each group of the same key, in one pass. Groups come in the
+        order of their first elements.
+
+        >>> (Stream.range(100)
+        ...  .sample_by(lambda x: x % 3, 2, seed=3)
+        ...  .map(lambda x: x % 3)
+        ...  .to_list())
+        [0, 0, 1, 1, 2, 2]
+
+        Returns
+        -------
+        Stream
+        '''
+        def sample_by_tr(items):
+            samples = grouped_reservoir_sample(
+                items, key_func, n, random.Random(seed))
+            return itt.chain.from_iterable(samples.values())
 
-        def flat_map_tr(iterable):
-            return itt.chain.from_iterable(map(to_iterable_func, iterable))
-        return flat_map_tr
+        return sample_by_tr
 
     @as_stream
     def tap(self, tag='', n=5, msg_format='{tag}:{index}: {elem}'):
@@ -519,7 +901,8 @@ class Stream(Monad):
         pass
 
     def __iter__(self):
-        return iter(self._pipeline.transform(self._iterable))
+        source, pipeline = self._pipeline.plan(self._iterable)
+        return iter(pipeline.transform(source))
 
     @reprlib.recursive_repr()
     def __repr__(self):
@@ -538,12 +921,47 @@ class Stream(Monad):
     def len(self):
         '''Get the length of the Stream
 
+        If the source is a list, tuple, range, Array or a spilled cache and
+        all stages are one-to-one like ``map``, the length is got in
+        ``O(1)``.
+
+        >>> Stream(range(10**12)).map(lambda n: n * 2).len()
+        1000000000000
+        >>> Stream.range(10).filter(lambda n: n % 3 == 0).len()
+        4
+
         Returns
         -------
         int
         '''
+        length = self._known_len()
+        if length is not None:
+            return length
         return sum(1 for item in self)
 
+    def _known_len(self):
+        '''Get the length if it can be known without evaluation,
+        otherwise None'''
+        if not self._pipeline.is_one_to_one():
+            return None
+        source = self._iterable
+        if is_indexable(source) or isinstance(source, SpillCache):
+            return len(source)
+        return None
+
+    def _resolve_index(self, index):
+        '''Turn negative index into positive one if the length is known.
+        Raise IndexError if it is out of range.'''
+        if index >= 0:
+            return index
+
+        length = self._known_len()
+        if length is None:
+            return index
+        if index + length < 0:
+            raise IndexError('Stream index out of range.')
+        return index + length
+
     @classmethod
     def _check_index_range(cls, index):
         if index is not None and index < 0:
@@ -581,18 +999,25 @@ class Stream(Monad):
         >>> s[:3].to_list()
         [5, 6, 7]
 
+        If the source is a list, tuple, range or Array and all stages are
+        one-to-one like ``map``, only the indexed source element is
+        evaluated, and negative index is supported.
+
+        >>> s = Stream(range(5, 12)).map(lambda n: n * 2)
+        >>> s[-1]
+        22
+
         Parameters
         ----------
         index : int, slice
             index of target item or a slice object
         '''  # noqa
-        # TODO: support negative index
-
         if isinstance(index, slice):
             return self.slice(index.start, index.stop, index.step)
         else:
+            index = self._resolve_index(index)
             try:
-                return next(itt.islice(self, index, None))
+                return next(iter(self.slice(index, index + 1)))
             except StopIteration:
                 raise IndexError(
                     'Stream index out of range. '
@@ -609,17 +1034,24 @@ class Stream(Monad):
         True
         >>> s.get(10, 0)
         0
+        >>> s.get(-2)
+        10
+
+        Negative index is supported only if the source is a list, tuple,
+        range or Array and all stages are one-to-one like ``map``.
 
         Returns
         -------
         element
 
         '''
-        # TODO: support negative index
-        # dd = deque(aa, maxlen=1)
+        try:
+            index = self._resolve_index(index)
+        except IndexError:
+            return default
 
         self._check_index_range(index)
-        return next(itt.islice(self, index, None), default)
+        return next(iter(self.slice(index, index + 1)), default)
 
     def get_opt(self, index):
         '''Optionally get item of the index.
@@ -661,7 +1093,7 @@ class Stream(Monad):
         '''
         self._check_index_range(start)
         self._check_index_range(stop)
-        return lambda iterable: itt.islice(iterable, start, stop, step)
+        return SliceOp(start, stop, step)
 
     def first(self):
         '''Get first element
@@ -690,10 +1122,15 @@ class Stream(Monad):
     def last(self):
         '''Get last element
 
+        >>> Stream(range(10**12)).map(lambda n: n * 2).last()
+        1999999999998
+
         Returns
         -------
         element
         '''
+        if self._known_len() is not None:
+            return self[-1]
         return deque(self, 1)[-1]
 
     def first_opt(self):
@@ -721,6 +1158,8 @@ class Stream(Monad):
         -------
         Optional[element]
         '''
+        if self._known_len() is not None:
+            return self.get_opt(-1)
         dq = deque(self, 1)
         if len(dq) > 0:
             return Some(dq[-1])
@@ -876,7 +1315,7 @@ class Stream(Monad):
         Stream[``element[key]``]
 
         '''
-        return self.map(lambda d: d[key])
+        return self.map(op.itemgetter(key))
 
     def pluck_opt(self, key):
         '''Create a new Stream of Optional values by evaluating ``elem[key]``
@@ -913,7 +1352,7 @@ class Stream(Monad):
         --------
         Stream[type of ``element.attr``]
         '''
-        return self.map(lambda obj: getattr(obj, attr))
+        return self.map(op.attrgetter(attr))
 
     def without(self, *elems):
         '''Create a new Stream without specified elements.
@@ -942,7 +1381,7 @@ class Stream(Monad):
         [0, 2, 4, 6, 8]
 
         '''
-        return fnt.partial(filter, pred)
+        return FilterOp(pred)
 
     @as_stream
     def filter_false(self, pred):
@@ -953,15 +1392,22 @@ class Stream(Monad):
         [1, 3, 5, 7, 9]
 
         '''
-        return fnt.partial(itt.filterfalse, pred)
+        return FilterFalseOp(pred)
 
     @as_stream
-    def unique(self, key_func=None):
+    def unique(self, key_func=None, partitions=None):
         '''Create a new Stream of unique elements
 
         >>> Stream.range(10).unique(lambda x: x // 3).to_list()
         [0, 3, 6, 9]
 
+        With ``partitions``, elements are spilled into that many temporary
+        files by the hash of keys first, then each partition is
+        deduplicated in turn. Memory is bounded by the keys of the largest
+        partition, but the elements come in the order of partitions.
+
+        >>> sorted(Stream.range(10).unique(lambda x: x // 3, partitions=2))
+        [0, 3, 6, 9]
         '''
         if key_func is None:
             def key_func(x): return x
@@ -974,6 +1420,8 @@ class Stream(Monad):
                     visited_keys.add(key)
                     yield item
 
+        if partitions is not None:
+            return _partitioned_tr(unique_tr, key_func, partitions)
         return unique_tr
 
     @as_stream
@@ -1086,6 +1534,84 @@ class Stream(Monad):
         '''  # noqa
         return self.zip(itt.count(start)).starmap(ValueIndex)
 
+    @as_stream
+    def join(self, other, key=None, other_key=None, how='inner',
+             method='hash', fillvalue=None, build='right'):
+        '''Create a new Stream by joining elements with elements of another
+        iterable having the same key. Each pair of joined elements becomes
+        a ``Row(key, left, right)``.
+
+        >>> names = Stream([(1, 'joe'), (2, 'may'), (3, 'joy')])
+        >>> ages = [(1, 32), (3, 31), (4, 59)]
+        >>> names.join(ages, key=op.itemgetter(0), how='left').to_list()
+        [Row(key=1, left=(1, 'joe'), right=(1, 32)), Row(key=2, left=(2, 'may'), right=None), Row(key=3, left=(3, 'joy'), right=(3, 31))]
+
+        With ``method='hash'``, a hash table is built from ``other`` and
+        this Stream is streamed through it, so the output follows the order
+        of this Stream. Unmatched elements of ``other`` come last. With
+        ``build='left'``, the hash table is built from this Stream instead,
+        which takes less memory if it's the smaller side, and the output
+        follows the order of ``other``, with unmatched elements of this
+        Stream last.
+
+        >>> Stream([3, 1, 2]).join([2, 3, 4], how='outer').map(
+        ...     lambda row: row.key).to_list()
+        [3, 1, 2, 4]
+        >>> Stream([3, 1, 2]).join([2, 3, 4], how='outer', build='left').map(
+        ...     lambda row: row.key).to_list()
+        [2, 3, 4, 1]
+
+        With ``method='merge'``, both sides should be sorted by the keys in
+        ascending order. They are both streamed, and only right elements
+        of the current key are kept in memory.
+
+        >>> Stream.range(5).join(Stream.range(3, 8), how='outer',
+        ...                      method='merge').map(lambda row: row.key).to_list()
+        [0, 1, 2, 3, 4, 5, 6, 7]
+
+        Parameters
+        ----------
+        other : iterable
+        key : function
+            key function of elements. Elements are keys if not given.
+        other_key : function
+            key function of elements of other. Same as key if not given.
+        how : 'inner', 'left', 'right' or 'outer'
+            which unmatched elements are also kept, with fillvalue as the
+            missing side.
+        method : 'hash' or 'merge'
+        build : 'left' or 'right'
+            the side to build the hash table with ``method='hash'``
+
+        Returns
+        -------
+        Stream
+        '''  # noqa
+        if how not in JOIN_HOWS:
+            raise ValueError(
+                f'how should be one of {JOIN_HOWS}, not {how!r}')
+        if method not in JOIN_METHODS:
+            raise ValueError(
+                f'method should be one of {JOIN_METHODS}, not {method!r}')
+        if build not in ('left', 'right'):
+            raise ValueError(
+                f"build should be 'left' or 'right', not {build!r}")
+        if key is None:
+            key = identity
+        if other_key is None:
+            other_key = key
+
+        def join_tr(items):
+            if method == 'merge':
+                joined = merge_join(items, other, key, other_key, how,
+                                    fillvalue)
+            else:
+                joined = hash_join(items, other, key, other_key, how, build,
+                                   fillvalue)
+            return itt.starmap(KeyLeftRight, joined)
+
+        return join_tr
+
     @as_stream
     def reversed(self):
         '''Create a new reversed Stream.
@@ -1103,14 +1629,37 @@ class Stream(Monad):
         return reversed_tr
 
     @as_stream
-    def sorted(self, key=None, reverse=False):
+    def sorted(self, key=None, reverse=False, max_memory=None):
         '''Create a new sorted Stream.
 
-        '''
-        return fnt.partial(sorted, key=key, reverse=reverse)
+        If only first n elements are taken afterward, a heap-based
+        selection is used instead of sorting all elements.
+
+        >>> Stream([3, 1, 2]).sorted().to_list()
+        [1, 2, 3]
+        >>> Stream.range(1000).sorted(key=lambda n: -n).take(3).to_list()
+        [999, 998, 997]
+
+        With ``max_memory``, elements are sorted in runs of about that
+        many bytes, which are spilled to temporary files and lazily
+        merged. It can sort more elements than memory can hold.
+
+        >>> Stream.range(10000, 0, -1).sorted(max_memory=2**14).take(3).to_list()
+        [1, 2, 3]
+
+        Parameters
+        ----------
+        key : function
+        reverse : bool
+        max_memory : int
+            rough memory budget in bytes. Elements should be picklable.
+        '''  # noqa
+        return SortedOp(key=key, reverse=reverse, max_memory=max_memory)
 
     def sum(self):
         '''Get sum of elements'''
+        if self._pipeline.batch_size is not None:
+            return sum(sum(batch) for batch in self._iter_batches())
         return sum(self)
 
     def reduce(self, func):
@@ -1176,10 +1725,17 @@ class Stream(Monad):
         * Not Lazy-evaluating. Consume more memory while grouping.
           Yield a group as soon as possible.
 
+        If each group is aggregated right away, ``group_by_agg`` or
+        ``reduce_by_key`` uses memory only for a result per key.
+
         >>> Stream.range(10).group_by_as_map(key_func=lambda n: n % 3)
         Map({0: Array([0, 3, 6, 9]), 1: Array([1, 4, 7]), 2: Array([2, 5, 8])})
 
+        If groups don't fit in memory, use ``group_by_partitioned``.
 
+        Returns
+        -------
+        Map[key, Array]
         '''
 
         from .map import Map
@@ -1188,6 +1744,69 @@ class Stream(Monad):
             key_to_grp[key_func(elem)].append(elem)
         return Map(key_to_grp)
 
+    def group_by_agg(self, key_func, **aggregators):
+        '''Group elements by the value of key function and aggregate each
+        group by aggregators in one pass.
+
+        Unlike ``group_by_as_map``, elements are not kept in groups.
+        Memory is proportional to the number of keys.
+
+        >>> from carriage.aggregator import Mean
+        >>> Stream.range(10).group_by_agg(lambda n: n % 3, n=len, avg=Mean())
+        Map({0: Row(n=4, avg=4.5), 1: Row(n=3, avg=4.0), 2: Row(n=3, avg=5.0)})
+
+        See ``aggregate`` for aggregators.
+
+        Returns
+        -------
+        Map[key, Row]
+        '''
+        from .map import Map
+        return Map(group_aggregate(self._iter_elems(), key_func,
+                                   **aggregators))
+
+    def reduce_by_key(self, key_func, zero, combine):
+        '''Group elements by the value of key function and fold each
+        group with a function of two arguments, starting from zero.
+
+        A copy of zero is made for each key, so it can be mutable.
+
+        >>> Stream('apple avocado banana'.split()).reduce_by_key(
+        ...     lambda word: word[0], 0, lambda acc, word: acc + len(word))
+        Map({'a': 12, 'b': 6})
+
+        Returns
+        -------
+        Map[key, accumulator]
+        '''
+        from .map import Map
+        return Map(reduce_by_key(self._iter_elems(), key_func, zero,
+                                 combine))
+
+    @as_stream
+    def group_by_partitioned(self, key_func, partitions):
+        '''Create a new Stream of ``Row(key, values)`` grouping elements by
+        the value of key function like ``group_by_as_map``.
+
+        Elements are spilled into that many temporary files by the hash of
+        keys, then grouped partition by partition. Only the groups of one
+        partition are in memory at a time.
+
+        >>> sorted(Stream.range(5).group_by_partitioned(lambda n: n % 2, 2))
+        [Row(key=0, values=Array([0, 2, 4])), Row(key=1, values=Array([1, 3]))]
+
+        Returns
+        -------
+        Stream[Row(key, values)]
+        '''  # noqa
+        def group_by_tr(items):
+            key_to_grp = defaultdict(Array)
+            for elem in items:
+                key_to_grp[key_func(elem)].append(elem)
+            return itt.starmap(KeyValues, key_to_grp.items())
+
+        return _partitioned_tr(group_by_tr, key_func, partitions)
+
     def multi_group_by_as_map(self, key=None):
         from .map import Map
         key_to_grp = defaultdict(list)
@@ -1232,6 +1851,25 @@ class Stream(Monad):
         length, summation = deque(enumerate(itt.accumulate(self), 1), 1).pop()
         return summation / length
 
+    def aggregate(self, **aggregators):
+        '''Compute multiple aggregations in one pass over the Stream and
+        get a Row of the results named by the keyword arguments.
+
+        Aggregators are defined in ``carriage.aggregator``. The builtin
+        ``sum``, ``len``, ``min`` and ``max`` can be used directly.
+
+        >>> from carriage.aggregator import Mean, CountDistinct
+        >>> Stream([3, 5, 4, 3]).aggregate(
+        ...     total=sum, n=len, hi=max, lo=min,
+        ...     avg=Mean(), uniq=CountDistinct())
+        Row(total=15, n=4, hi=5, lo=3, avg=3.75, uniq=3)
+
+        Returns
+        -------
+        Row
+        '''
+        return aggregate(self._iter_elems(), **aggregators)
+
     @as_stream
     def accumulate(self, func=None):
         '''Create a new Stream of calling ``itertools.accumulate``'''
@@ -1240,13 +1878,165 @@ class Stream(Monad):
     def value_counts(self):
         '''Get a Counter instance of elements counts
 
+        >>> Stream('abca').value_counts()
+        Map({'a': 2, 'b': 1, 'c': 1})
+
+        If counts don't fit in memory, use ``value_counts_partitioned``.
+
         Returns
         -------
         Map[E, int]
         '''
         from carriage import Map
+        if self._pipeline.batch_size is not None:
+            counter = Counter()
+            for batch in self._iter_batches():
+                counter.update(batch)
+            return Map(counter)
         return Map(Counter(self))
 
+    def approx_count_distinct(self, precision=14):
+        '''Estimate the number of distinct elements by a HyperLogLog sketch
+        of ``2 ** precision`` bytes. The relative standard error is about
+        ``1.04 / sqrt(2 ** precision)``, i.e. 0.8% for the default precision.
+
+        >>> Stream.range(100000).map(lambda n: n % 5000).approx_count_distinct()
+        4996
+
+        Use ``carriage.sketch.HyperLogLog`` directly to merge the
+        estimations of multiple Streams.
+
+        Returns
+        -------
+        int
+        '''  # noqa
+        return HyperLogLog(precision).update(self._iter_elems()).count()
+
+    def approx_value_counts(self, top_k=10, width=2048, depth=5):
+        '''Estimate counts of the top_k most frequent elements by a
+        Count-Min sketch of ``width * depth`` counters. An estimated count
+        is never less than the real count.
+
+        >>> Stream('abracadabra').approx_value_counts(top_k=2)
+        Map({'a': 5, 'b': 2})
+
+        Use ``carriage.sketch.HeavyHitters`` directly to merge the
+        estimations of multiple Streams.
+
+        Returns
+        -------
+        Map[E, int]
+            from the most frequent element
+        '''
+        from .map import Map
+        hitters = HeavyHitters(top_k, width, depth)
+        return Map(hitters.update(self._iter_elems()).most_common())
+
+    def approx_quantiles(self, quantiles, k=200):
+        '''Estimate quantiles of elements in one pass by a KLL sketch
+        keeping ``O(k)`` elements. The rank error is about ``1.7 / k`` of
+        the number of elements.
+
+        >>> Stream.range(1, 101).approx_quantiles([0.5, 0.9, 0.99])
+        [50, 90, 99]
+
+        Use ``carriage.sketch.QuantileSketch`` directly to merge the
+        estimations of multiple Streams.
+
+        Parameters
+        ----------
+        quantiles : list of float
+            fractions from 0 to 1
+
+        Returns
+        -------
+        list or None
+            estimated quantiles in the same order, or None if there's no
+            element like ``ApproxQuantiles``
+        '''
+        sketch = QuantileSketch(k).update(self._iter_elems())
+        if sketch.count == 0:
+            return None
+        return sketch.quantiles(quantiles)
+
+    def histogram(self, bins=10, bounds=None, k=200):
+        '''Count elements in bins in one pass and get a StreamTable of
+        ``Row(low, high, count)`` for each bin.
+
+        ``bins`` can be a list of edges, or the number of bins of the same
+        width from the low bound to the high bound. Each bin includes its
+        low edge, and the last one includes its high edge too. The counts
+        are exact, and elements out of the edges are not counted.
+
+        >>> Stream([1, 2, 2, 3, 9]).histogram([0, 3, 10]).to_list()
+        [Row(low=0, high=3, count=3), Row(low=3, high=10, count=2)]
+
+        If bins is a number and bounds are not given, bounds are the
+        minimum and maximum elements, and the counts are estimated by a
+        QuantileSketch of k.
+
+        >>> Stream.range(100).histogram(bins=2).to_list()
+        [Row(low=0.0, high=49.5, count=50), Row(low=49.5, high=99.0, count=50)]
+
+        Parameters
+        ----------
+        bins : int or list of edges
+        bounds : (low, high)
+
+        Returns
+        -------
+        StreamTable
+        '''
+        from .streamtable import StreamTable
+        if isinstance(bins, int) and bounds is None:
+            sketch = QuantileSketch(k)
+            low = high = None
+            for elem in self._iter_elems():
+                sketch.add(elem)
+                if low is None or elem < low:
+                    low = elem
+                if high is None or elem > high:
+                    high = elem
+            if low is None:
+                return StreamTable([])
+
+            edges = Histogram.equal_width(low, high, bins).edges
+            ranks = [0] + [sketch.rank(edge) for edge in edges[1:-1]]
+            ranks.append(sketch.count)
+            return StreamTable([
+                Row(low=edge_low, high=edge_high, count=rank_high - rank_low)
+                for edge_low, edge_high, rank_low, rank_high in zip(
+                    edges, edges[1:], ranks, ranks[1:])])
+
+        if isinstance(bins, int):
+            hist = Histogram.equal_width(*bounds, bins)
+        else:
+            hist = Histogram(bins)
+        hist.update(self._iter_elems())
+        return StreamTable([Row(low=low, high=high, count=count)
+                            for low, high, count in hist.bins()])
+
+    @as_stream
+    def value_counts_partitioned(self, partitions):
+        '''Create a new Stream of ``Row(key, value)`` counting elements
+        like ``value_counts``.
+
+        Elements are spilled into that many temporary files by their
+        hashes, then counted partition by partition, without keeping all
+        counts in memory.
+
+        >>> sorted(Stream('abca').value_counts_partitioned(2))
+        [Row(key='a', value=2), Row(key='b', value=1), Row(key='c', value=1)]
+
+        Returns
+        -------
+        Stream[Row(key, value)]
+        '''
+        def value_counts_tr(items):
+            return itt.starmap(KeyValue, Counter(items).items())
+
+        return _partitioned_tr(value_counts_tr, identity, partitions)
+
     @as_stream
     def extended(self, iterable):
         '''Create a new Stream that extends source Stream with another
@@ -1263,12 +2053,14 @@ class Stream(Monad):
         return self.extended((elem,))
 
     @as_stream
-    def distincted(self, key_func=None):
+    def distincted(self, key_func=None, partitions=None):
         '''Create a new Stream with non-repeating elements. And elements are
         with the same order of first occurence in the source Stream.
 
         >>> Stream.range(10).distincted(lambda n: n//3).to_list()
         [0, 3, 6, 9]
+
+        See ``unique`` for ``partitions``.
         '''
         if key_func is None:
             def key_func(x): return x
@@ -1281,6 +2073,8 @@ class Stream(Monad):
                     key_set.add(key_value)
                     yield item
 
+        if partitions is not None:
+            return _partitioned_tr(distincted_tr, key_func, partitions)
         return distincted_tr
 
     @as_stream
@@ -1337,18 +2131,100 @@ class Stream(Monad):
         >>> s3.map(lambda x: x * 3).to_list()
         [18, 24, 30]
 
+        It's based on ``itertools.tee``, which buffers all elements one
+        copy has consumed but others haven't. Use ``broadcast`` to bound
+        the memory when copies are consumed together.
         '''
-        itrs = itt.tee(self, 2)
+        itrs = itt.tee(self, n)
         return tuple(map(type(self), itrs))
 
+    def broadcast(self, *sinks, chunksize=DEFAULT_BATCH_SIZE,
+                  max_chunks_in_flight=4):
+        '''Evaluate the Stream once and feed the elements to multiple sinks,
+        then get a tuple of the results of sinks.
+
+        A sink is a function taking a Stream of the elements, typically
+        calling an action on it. Sinks run in their own threads, each fed
+        through a ``queue.Queue(maxsize=max_chunks_in_flight)``. The source
+        waits while the queue of a slower sink is full, so sinks can run
+        ahead of each other by at most ``max_chunks_in_flight`` chunks.
+        Unlike ``tee``, memory is bounded by about
+        ``len(sinks) * max_chunks_in_flight`` chunks.
+
+        >>> Stream.range(10).broadcast(
+        ...     Stream.sum,
+        ...     lambda s: s.filter(lambda n: n % 3 == 0).to_list(),
+        ...     lambda s: s.first())
+        (45, [0, 3, 6, 9], 0)
+
+        A sink may stop before consuming all elements. The source is read
+        until all sinks finish.
+
+        Parameters
+        ----------
+        sinks : functions of type ``Stream -> result``
+        chunksize : int
+            number of elements passed to sinks at a time. In batch mode,
+            batches are passed as chunks and it's ignored.
+        max_chunks_in_flight : int
+            maximum number of chunks queued for each sink, i.e. how far
+            sinks can run ahead of each other
+
+        Returns
+        -------
+        tuple
+            results of sinks in the same order
+        '''
+        if self._pipeline.batch_size is not None:
+            chunks = self._iter_batches()
+        else:
+            chunks = iter_chunks(self, chunksize)
+        return parallel.broadcast(chunks, sinks, max_chunks_in_flight,
+                                  wrap=type(self))
+
     # def copy(self):
     #     return Array(copy(self._items))
 
-    def cache(self):
-        '''Cache result
+    def cache(self, max_memory=None, path=None):
+        '''Evaluate the Stream and create a new Stream of the cached
+        elements, so that multiple actions don't re-run the pipeline or
+        re-read the source.
+
+        >>> strm = Stream(iter(range(3))).map(lambda n: n * 2).cache()
+        >>> strm.to_list()
+        [0, 2, 4]
+        >>> strm.sum()
+        6
 
+        All elements are kept in memory by default. With ``max_memory``
+        or ``path``, elements beyond about ``max_memory`` bytes are spilled
+        into a segment file, which is read sequentially on each replay.
+
+        >>> strm = Stream.range(10000).cache(max_memory=2**14)
+        >>> strm.filter(lambda n: n % 1000 == 0).to_list()
+        [0, 1000, 2000, 3000, 4000, 5000, 6000, 7000, 8000, 9000]
+        >>> strm.len()
+        10000
+
+        Parameters
+        ----------
+        max_memory : int
+            rough memory budget in bytes for the in-memory part.
+            Spill all elements if it's 0.
+        path : str or Path
+            path of the segment file. It's a temporary file removed along
+            with the cache if not given.
+
+        Returns
+        -------
+        Stream
         '''
-        return type(self)(self.to_list())
+        if max_memory is None and path is None:
+            return type(self)(self.to_list())
+
+        if max_memory is None:
+            max_memory = 0
+        return type(self)(SpillCache(self, max_memory, path))
 
     @as_stream
     def chunk(self, n, strict=False):
@@ -1413,3 +2289,47 @@ class Stream(Monad):
         elems_str = elem_sep.join(elem_format.format(index=idx, elem=elem)
                                   for idx, elem in enumerate(self))
         return start + elems_str + end
+
+
+class _StageTimer:
+    '''Measure time of nested stage calls excluding time spent in the
+    stages they call'''
+    __slots__ = '_child_times',
+
+    def __init__(self):
+        self._child_times = []
+
+    def enter(self):
+        self._child_times.append(0.0)
+        return time.perf_counter()
+
+    def exit(self, start):
+        inclusive = time.perf_counter() - start
+        child_time = self._child_times.pop()
+        if self._child_times:
+            self._child_times[-1] += inclusive
+        return inclusive - child_time
+
+
+class _ProfiledIterator:
+    '''Iterator wrapper counting elements and accumulating the time spent
+    in the wrapped stage'''
+    __slots__ = 'iterator', 'timer', 'count', 'elapsed'
+
+    def __init__(self, iterator, timer, elapsed=0.0):
+        self.iterator = iterator
+        self.timer = timer
+        self.count = 0
+        self.elapsed = elapsed
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = self.timer.enter()
+        try:
+            elem = next(self.iterator)
+        finally:
+            self.elapsed += self.timer.exit(start)
+        self.count += 1
+        return elem
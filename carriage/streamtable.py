@@ -1,17 +1,33 @@
-import functools as fnt
 import io
 import itertools as itt
 import json
+import operator as op
 from pathlib import Path
 
 from tabulate import tabulate, tabulate_formats
 
+from .aggregator import aggregate_columns
+from .columnar import (ExplodeOp, MapFieldsOp, RecordBatch, WhereOp,
+                       concat_columns, iter_record_batches)
+from .pipeline import DEFAULT_BATCH_SIZE
 from .row import Row
 from .stream import Stream, as_stream
 
 
 class StreamTable(Stream):
     '''StreamTable is similar to Stream but designed to work on Rows only.
+
+    In batch mode, Rows are passed between stages as RecordBatches, which
+    store a column per field. ``where``, ``select``, ``map_fields``,
+    ``explode``, ``aggregate`` and ``to_dataframe`` work on whole columns,
+    and Rows are created only when the StreamTable is iterated. ``X``
+    expressions are evaluated column by column too, by NumPy ufuncs for
+    NumPy array columns.
+
+    >>> from carriage import X
+    >>> stb = StreamTable.from_columns({'x': [1, 2, 3], 'y': [4, 5, 6]})
+    >>> stb.where(y=5).select('x', z=X.x * 10).to_list()
+    [Row(x=2, z=20)]
     '''
 
     def __init__(self, iterable, *, pipeline=None):
@@ -158,6 +174,36 @@ class StreamTable(Stream):
 
         return cls(rows.to_list())
 
+    @classmethod
+    def from_columns(cls, columns, batch_size=DEFAULT_BATCH_SIZE):
+        '''Create a StreamTable in batch mode from columns
+
+        Columns can be lists, tuples, ``array.array`` or NumPy arrays.
+        They are sliced into RecordBatches of batch_size Rows without
+        creating any Row.
+
+        >>> import numpy as np
+        >>> stb = StreamTable.from_columns(
+        ...     {'name': ['a', 'b'], 'score': np.array([0.5, 1.5])})
+        >>> stb.show()
+        | name   |   score |
+        |--------+---------|
+        | a      |     0.5 |
+        | b      |     1.5 |
+
+        Parameters
+        ----------
+        columns : Map[str, sequence]
+            field names to columns of the same length
+        batch_size : int
+            number of Rows in a RecordBatch
+
+        Returns
+        -------
+        StreamTable
+        '''
+        return cls(RecordBatch.from_columns(columns)).in_batches(batch_size)
+
     @classmethod
     def from_tuples(cls, tuples, fields=None):
         '''Create from iterable of tuple
@@ -237,12 +283,28 @@ class StreamTable(Stream):
     def to_dataframe(self):
         '''Convert to Pandas DataFrame
 
+        In batch mode, columns of RecordBatches of the same Schema are
+        concatenated into the columns of the DataFrame directly.
+
         Returns
         -------
         pandas.DataFrame
         '''
         import pandas as pd
-        rows = self.to_list()
+        if self._pipeline.batch_size is None:
+            rows = self.to_list()
+        else:
+            batches = list(iter_record_batches(self._iter_batches()))
+            schemas = {batch.schema for batch in batches}
+            if len(schemas) == 1:
+                schema, = schemas
+                return pd.DataFrame(
+                    {field: concat_columns([batch.columns[index]
+                                            for batch in batches])
+                     for index, field in enumerate(schema.fields)},
+                    columns=list(schema.fields))
+            rows = list(itt.chain.from_iterable(batches))
+
         fields = self._scan_fields(rows[:10])
         return pd.DataFrame(rows, columns=fields)
 
@@ -312,11 +374,7 @@ class StreamTable(Stream):
         StreamTable
         '''
 
-        return fnt.partial(
-            map,
-            lambda row:
-            row.evolve(**{field: func(row)
-                          for field, func in field_funcs.items()}))
+        return MapFieldsOp(field_funcs)
 
     @as_stream
     def select(self, *fields, **field_funcs):
@@ -339,12 +397,7 @@ class StreamTable(Stream):
         -------
         StreamTable
         '''
-        return fnt.partial(
-            map,
-            lambda row:
-            row.evolve(**{field: func(row) if callable(func) else func
-                          for field, func in field_funcs.items()})
-            .project(*fields, *field_funcs.keys()))
+        return MapFieldsOp(field_funcs, keep=fields + tuple(field_funcs))
 
     @as_stream
     def explode(self, field):
@@ -360,15 +413,7 @@ class StreamTable(Stream):
         | b      |      2 |
         | b      |      1 |
         '''
-        def _explode_row(row):
-            for field_elem in getattr(row, field):
-                yield row.evolve(**{field: field_elem})
-
-        def _flatmap_explodes(rows_iter):
-            for row in rows_iter:
-                yield from _explode_row(row)
-
-        return _flatmap_explodes
+        return ExplodeOp(field)
 
     @as_stream
     def where(self, *conds, **kwconds):
@@ -386,12 +431,81 @@ class StreamTable(Stream):
         StreamTable
 
         '''
-        return fnt.partial(
-            filter,
-            lambda row:
-            all(cond(row) for cond in conds) and
-            all(getattr(row, field) == value
-                for field, value in kwconds.items()))
+        return WhereOp(conds, kwconds)
+
+    def aggregate(self, **aggregators):
+        '''Compute multiple aggregations in one pass over the StreamTable
+        and get a Row of the results named by the keyword arguments.
+
+        In batch mode, each aggregator adds a whole column of its key per
+        RecordBatch.
+
+        >>> from carriage import X
+        >>> from carriage.aggregator import Mean, Sum
+        >>> stb = StreamTable.from_columns({'x': [3, 5, 4]})
+        >>> stb.aggregate(n=len, total=Sum(key=X.x), avg=Mean(key=X.x))
+        Row(n=3, total=12, avg=4.0)
+
+        Returns
+        -------
+        Row
+        '''
+        if self._pipeline.batch_size is None:
+            return super().aggregate(**aggregators)
+        return aggregate_columns(iter_record_batches(self._iter_batches()),
+                                 **aggregators)
+
+    def join(self, other, on, how='inner', method='hash', suffix='_right'):
+        '''Create a new StreamTable by joining Rows with Rows of another
+        iterable having the same values of the ``on`` fields.
+
+        Joined Rows are merged. Other fields of the right Row that clash
+        with the left Row are renamed with the suffix. An unmatched Row is
+        kept as it is if how says so.
+
+        >>> users = StreamTable([Row(id=1, name='joe'), Row(id=2, name='may')])
+        >>> orders = [Row(id=1, item='tea'), Row(id=1, item='pie')]
+        >>> users.join(orders, on='id', how='left').show()
+        |   id | name   | item   |
+        |------+--------+--------|
+        |    1 | joe    | tea    |
+        |    1 | joe    | pie    |
+        |    2 | may    |        |
+
+        See ``Stream.join`` for how and method.
+
+        Parameters
+        ----------
+        other : iterable of Rows
+        on : str or tuple of str
+            field names of the join key
+
+        Returns
+        -------
+        StreamTable
+        '''
+        if isinstance(on, str):
+            on = (on,)
+        on_set = set(on)
+        key = op.attrgetter(*on)
+
+        def merge_rows(joined):
+            left, right = joined.left, joined.right
+            if right is None:
+                return left
+            if left is None:
+                return right
+            merged = left.to_dict()
+            for field, value in zip(right.fields(), right):
+                if field in on_set:
+                    continue
+                if field in merged:
+                    field += suffix
+                merged[field] = value
+            return Row(**merged)
+
+        return (super().join(other, key=key, how=how, method=method)
+                .map(merge_rows))
 
     @classmethod
     def _scan_fields(cls, rows):
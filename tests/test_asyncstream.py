@@ -0,0 +1,125 @@
+import asyncio
+from asyncio import run
+
+import pytest
+
+from carriage import Array, AsyncStream, Nothing, Row, Some
+
+
+async def agen(n):
+    for elem in range(n):
+        await asyncio.sleep(0)
+        yield elem
+
+
+def test_init():
+    assert run(AsyncStream([1, 2, 3]).to_list()) == [1, 2, 3]
+    assert run(AsyncStream(agen(3)).to_list()) == [0, 1, 2]
+    assert run(AsyncStream.range(3).to_array()) == Array([0, 1, 2])
+
+
+def test_map():
+    async def double(n):
+        await asyncio.sleep(0)
+        return n * 2
+
+    assert run(AsyncStream(agen(3)).map(double).to_list()) == [0, 2, 4]
+    assert run(AsyncStream(agen(3)).map(lambda n: n + 1).to_list()) == [
+        1, 2, 3]
+    assert run(AsyncStream([(1, 2)]).starmap(lambda a, b: a + b)
+               .to_list()) == [3]
+    assert run(AsyncStream.range(3).flat_map(range).to_list()) == [0, 0, 1]
+    assert run(AsyncStream([[1], [2, 3]]).flatten().to_list()) == [1, 2, 3]
+
+
+def test_map_awaitables():
+    class Delayed:
+        def __init__(self, value):
+            self.value = value
+
+        def __await__(self):
+            yield from asyncio.sleep(0).__await__()
+            return self.value
+
+    assert run(AsyncStream.range(3).map(Delayed).to_list()) == [0, 1, 2]
+    assert run(AsyncStream.range(4).filter(
+        lambda n: Delayed(n % 2)).to_list()) == [1, 3]
+
+
+def test_map_concurrency():
+    running = Row(now=[0], peak=[0])
+
+    async def fetch(n):
+        running.now[0] += 1
+        running.peak[0] = max(running.peak[0], running.now[0])
+        await asyncio.sleep(0.001 * (5 - n % 5))
+        running.now[0] -= 1
+        return n
+
+    assert run(AsyncStream.range(20).map(fetch, concurrency=4)
+               .to_list()) == list(range(20))
+    assert running.peak[0] == 4
+
+    with pytest.raises(ValueError):
+        run(AsyncStream.range(3).map(fetch, concurrency=0).to_list())
+
+
+def test_filter_and_slice():
+    async def is_even(n):
+        return n % 2 == 0
+
+    assert run(AsyncStream.range(6).filter(is_even).to_list()) == [0, 2, 4]
+    assert run(AsyncStream.range(6).filter_false(is_even).to_list()) == [
+        1, 3, 5]
+    assert run(AsyncStream.range(10).take(3).to_list()) == [0, 1, 2]
+    assert run(AsyncStream.range(10).slice(2, 8, 3).to_list()) == [2, 5]
+    assert run(AsyncStream.range(5).drop(3).to_list()) == [3, 4]
+    assert run(AsyncStream.range(5).take_while(lambda n: n < 2)
+               .to_list()) == [0, 1]
+    assert run(AsyncStream.range(5).drop_while(lambda n: n < 2)
+               .to_list()) == [2, 3, 4]
+    with pytest.raises(ValueError):
+        AsyncStream.range(5).take(-1)
+
+
+def test_take_infinite():
+    async def count():
+        n = 0
+        while True:
+            yield n
+            n += 1
+
+    assert run(AsyncStream(count()).map(lambda n: n * 2, concurrency=3)
+               .take(4).to_list()) == [0, 2, 4, 6]
+
+
+def test_grouping():
+    assert run(AsyncStream.range(5).chunk(2).to_list()) == [
+        Row(f0=0, f1=1), Row(f0=2, f1=3), Row(f0=4)]
+    groups = run(AsyncStream([1, 1, 2, 1]).group_by_as_stream().to_list())
+    assert [(g.key, g.values.to_list()) for g in groups] == [
+        (1, [1, 1]), (2, [2]), (1, [1])]
+    assert run(AsyncStream([]).group_by_as_stream().to_list()) == []
+    assert run(AsyncStream([3, 1, 3]).distincted().to_list()) == [3, 1]
+
+
+def test_actions():
+    assert run(AsyncStream.range(4).len()) == 4
+    assert run(AsyncStream.range(4).sum()) == 6
+    assert run(AsyncStream(agen(0)).sum()) == 0
+    assert run(AsyncStream.range(1, 4).reduce(lambda a, b: a * b)) == 6
+    assert run(AsyncStream.range(4).to_set()) == {0, 1, 2, 3}
+    assert run(AsyncStream([(1, 2)]).to_dict()) == {1: 2}
+    assert run(AsyncStream.range(4, 6).first()) == 4
+    assert run(AsyncStream.range(4, 6).first_opt()) == Some(4)
+    assert run(AsyncStream([]).first_opt()) is Nothing
+    with pytest.raises(IndexError):
+        run(AsyncStream([]).first())
+
+    seen = []
+
+    async def collect(elem):
+        seen.append(elem)
+
+    run(AsyncStream.range(3).for_each(collect))
+    assert seen == [0, 1, 2]
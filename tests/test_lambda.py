@@ -1,3 +1,5 @@
+import pytest
+
 from carriage import Row, X
 
 
@@ -56,3 +58,42 @@ def test_multiple_X():
     assert (X.y % X.x)(Row(x=3, y=5)) == 2
     assert (divmod(X.y, X.x))(Row(x=3, y=5)) == (1, 2)
     assert (X**X)(3) == 27
+
+
+def test_evaluate_column():
+    import numpy as np
+    from carriage.columnar import RecordBatch
+    from carriage.lambda_ import BinaryOp, GetAttr
+
+    columns = {'x': [1, 2, 3], 'y': [4, 0, 6]}
+    batch = RecordBatch.from_columns(columns)
+    np_batch = RecordBatch.from_columns(
+        {field: np.array(column) for field, column in columns.items()})
+    exprs = [X.x, X.y > 3, X.x + X.y, 10 - X.x * 2, -X.x, abs(X.x - 2),
+             X.x.in_([1, 3]), (X.y > 3).not_, X.x ** 2, divmod(X.y, 4),
+             X[1] // X.x, X.to_dict.call()]
+    for expr in exprs:
+        expected = [expr(row) for row in batch]
+        assert list(expr.evaluate_column(batch)) == expected
+        assert list(expr.evaluate_column(np_batch)) == expected
+
+    assert isinstance((X.x + X.y).evaluate_column(np_batch), np.ndarray)
+    assert isinstance((X.x + X.y).evaluate_column(batch), list)
+    with pytest.raises(ZeroDivisionError):
+        (X.x / X.y).evaluate_column(batch)
+    with np.errstate(divide='ignore'):
+        assert list((X.x / X.y).evaluate_column(np_batch)) == [
+            0.25, np.inf, 0.5]
+    for expr in (X.x ** -1, X.x ** (X.y - 5), 2 ** -X.x):
+        for values in (np_batch, np_batch.rows()):
+            with pytest.raises(ValueError):
+                list(map(expr, values))
+            with pytest.raises(ValueError):
+                expr.evaluate_column(values)
+    assert list((X.x ** -1).evaluate_column(batch)) == [1, 0.5, 1 / 3]
+    assert (X + 1).evaluate_column([1, 2]) == [2, 3]
+
+    expr = (X.x + X.y)._pipeline.transformers[0].func
+    assert isinstance(expr, BinaryOp)
+    assert isinstance(expr.left._pipeline.transformers[0].func, GetAttr)
+    assert repr(X.x._pipeline.transformers[0].func) == "GetAttr('x')"
@@ -8,6 +8,7 @@ import pytest
 
 from carriage import Array, Nothing, Some, Stream
 from carriage.row import CurrNext, CurrPrev, Row, ValueIndex
+from carriage.pipeline import CompiledPipeline, SortedOp
 from carriage.stream import Pipeline, Transformer
 
 
@@ -43,8 +44,9 @@ def test_access():
     assert Stream.range(5, 10).get(5, 0) == 0
     assert Stream.range(5, 10).get(7, 0) == 0
     assert Stream.range(5, 10).get(6) is None
+    assert Stream.range(5, 10).get(-1) == 9
     with pytest.raises(ValueError):
-        assert Stream.range(5, 10).get(-1) is None
+        assert Stream(iter(range(5, 10))).get(-1) is None
     assert Stream.range(5, 10)[3] == 8
 
     with pytest.raises(ValueError):
@@ -285,3 +287,888 @@ def test_tuple_as_row():
     strm = Stream([(1, 2), (3, 4)])
     rows = strm.tuple_as_row(['x', 'y']).to_list()
     assert rows == [Row(x=1, y=2), Row(x=3, y=4)]
+
+
+def test_pipeline_fusion():
+    strm = (Stream.range(10)
+            .map(lambda x: x + 1)
+            .filter(lambda x: x % 2 == 0)
+            .map(lambda x: (x, -x))
+            .starmap(lambda a, b: (a, b))
+            .filter_false(lambda x: x[0] > 8)
+            .pluck(0))
+    assert all(trfmr.is_elementwise()
+               for trfmr in strm._pipeline.transformers)
+    assert strm.to_list() == [2, 4, 6, 8]
+    assert Stream([0, 1, None, 2]).filter(None).map(str).to_list() == [
+        '1', '2']
+    assert (Stream.range(3).map(lambda x: x * 2).tap(n=0)
+            .map(lambda x: x + 1).map(str).to_list()) == ['1', '3', '5']
+
+
+def test_pipeline_fusion_keeps_builtin_stages():
+    # Maps and filters of builtins, and single stages, are faster by the
+    # map and filter in C, so they're not fused
+    assert isinstance(iter(Stream([-1, 0]).map(abs).filter(bool)), filter)
+    assert isinstance(iter(Stream([-1, 0]).map(lambda x: -x)), map)
+    assert isinstance(
+        iter(Stream([{'x': '1'}]).pluck('x').map(int)), map)
+    assert isinstance(
+        iter(Stream([1]).map(lambda x: -x).map(str).map(lambda x: x)), map)
+
+    strm = Stream([1, 2, 3]).map(lambda x: x + 1).filter(lambda x: x % 2)
+    assert strm.to_list() == strm.to_list() == [3]
+    runners = strm._pipeline._runners
+    assert len(runners) == 1
+    strm.to_list()
+    assert strm._pipeline._runners is runners
+
+
+def test_compile():
+    def build(nums):
+        return (Stream(nums)
+                .flat_map(lambda x: [x] * x)
+                .map(lambda x: x * 10)
+                .filter_false(lambda x: x == 20)
+                .sorted(reverse=True)
+                .map(str)
+                .starmap(lambda *digits: digits)
+                .filter(None)
+                .flatten())
+
+    for nums in ([1, 2, 3], range(5), []):
+        assert build(nums).compile().to_list() == build(nums).to_list()
+
+    compiled = build([3]).compile()
+    assert compiled.to_list() == ['3', '0', '3', '0', '3', '0']
+    assert compiled.map(int).sum() == 9
+    assert isinstance(compiled.map(int)._pipeline, CompiledPipeline)
+    assert isinstance(compiled.in_batches(2)._pipeline, CompiledPipeline)
+    assert compiled.map(int).in_batches(2).sum() == 9
+    assert compiled[:2].to_list() == ['3', '0']
+    assert Stream([1, 2]).compile().to_list() == [1, 2]
+
+
+def square(n):
+    return n * n
+
+
+def test_par_map():
+    assert (Stream.range(100).par_map(square, workers=2, chunksize=7)
+            .to_list()) == [n * n for n in range(100)]
+    assert sorted(Stream.range(100)
+                  .par_map(square, workers=2, chunksize=7, ordered=False)
+                  ) == [n * n for n in range(100)]
+    assert (Stream.count(0).par_map(square, workers=2, chunksize=3)
+            .take(5).to_list()) == [0, 1, 4, 9, 16]
+    assert (Stream.range(4).par_flat_map(range, workers=2, chunksize=1)
+            .to_list()) == [0, 0, 1, 0, 1, 2]
+    with pytest.raises(TypeError):
+        Stream(['a']).par_map(square, workers=1).to_list()
+
+
+def test_map_threaded():
+    import threading
+
+    lock = threading.Lock()
+    running = Counter(now=0, peak=0)
+    # The first 4 calls only return once all of them are running
+    barrier = threading.Barrier(4)
+
+    def slow_square(n):
+        with lock:
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+        if n < 4:
+            barrier.wait(timeout=10)
+        with lock:
+            running['now'] -= 1
+        return n * n
+
+    assert (Stream.range(30).map_threaded(slow_square, max_workers=4)
+            .to_list()) == [n * n for n in range(30)]
+    assert running['peak'] == 4
+    assert sorted(Stream.range(30).map_threaded(
+        slow_square, max_workers=4, ordered=False)) == [
+            n * n for n in range(30)]
+
+    consumed = []
+    strm = Stream.count(0).tap_with(lambda i, e: consumed.append(e), n=1000)
+    assert (strm.map_threaded(square, max_workers=2, max_in_flight=3)
+            .take(5).to_list()) == [0, 1, 4, 9, 16]
+    assert len(consumed) <= 5 + 3
+
+
+def test_batch_mode():
+    def build(strm):
+        return (strm
+                .map(lambda x: x + 1)
+                .filter(lambda x: x % 3 != 0)
+                .map_batches(lambda xs: [x * 10 for x in xs])
+                .zip_index()
+                .pluck(0)
+                .sorted(reverse=True)
+                .flat_map(lambda x: [x, -x]))
+
+    expected = build(Stream.range(50)).to_list()
+    for size in (1, 4, 7, 1024):
+        batched = build(Stream.range(50).in_batches(size))
+        assert batched._pipeline.batch_size == size
+        assert batched.to_list() == expected
+        assert batched.sum() == sum(expected)
+        assert batched.value_counts() == Counter(expected)
+        assert batched.compile().to_list() == expected
+
+    assert Stream([]).in_batches(4).map(str).to_list() == []
+    assert Stream.range(3).in_batches(2).in_batches(None).sum() == 3
+    with pytest.raises(ValueError):
+        Stream.range(3).in_batches(0)
+
+
+def test_batch_mode_write_txt(tmpdir):
+    path = tmpdir.join('nums.txt')
+    Stream.range(5).in_batches(2).map(str).write_txt(str(path))
+    assert path.read() == '0\n1\n2\n3\n4\n'
+
+
+def test_profile(monkeypatch):
+    import time
+
+    # A fake clock advancing only in the filter stage
+    clock = [0.0]
+    monkeypatch.setattr(time, 'perf_counter', lambda: clock[0])
+
+    def slow_is_even(n):
+        clock[0] += 1.0
+        return n % 2 == 0
+
+    report = (Stream(iter(range(100)))
+              .map(lambda n: n + 1)
+              .filter(slow_is_even)
+              .sorted(reverse=True)
+              .take(10)
+              .profile()
+              .to_list())
+    assert [row.elems_in for row in report] == [None, 100, 100, 50, 10]
+    assert [row.elems_out for row in report] == [100, 100, 50, 10, 10]
+    assert report[2].selectivity == 0.5
+    assert report[2].stage.startswith('filter(')
+    assert [row.seconds for row in report] == [0, 0, 100, 0, 0]
+    assert report[2].seconds_per_elem == 1
+    assert Stream([]).map(str).profile().to_list()[1].selectivity is None
+
+
+def test_limit_push_down():
+    calls = []
+
+    def double(n):
+        calls.append(n)
+        return n * 2
+
+    big_list = list(range(10000))
+    strm = Stream(big_list).map(double).map(str)
+    assert strm.take(3).to_list() == ['0', '2', '4']
+    assert calls == [0, 1, 2]
+
+    del calls[:]
+    assert strm[5000] == '10000'
+    assert strm.get(20000, 'none') == 'none'
+    assert Stream(range(10**12)).map(double).get(10**11) == 2 * 10**11
+    assert strm.drop(9998).to_list() == ['19996', '19998']
+    assert strm.slice(2, 9, 3).to_list() == ['4', '10', '16']
+    assert calls == [5000, 10**11, 9998, 9999, 2, 5, 8]
+
+    source, pipeline = strm.take(3)._pipeline.plan(big_list)
+    assert source == [0, 1, 2] and len(pipeline) == 2
+    taken = strm.take(3)._pipeline
+    assert taken.plan(big_list)[1] is taken.plan(big_list[:5])[1]
+
+    # nothing to rewrite on iterators
+    taken = Stream(iter(big_list)).filter(bool).take(3)._pipeline
+    assert taken.plan(iter(big_list))[1] is taken
+
+    # not pushed through filters, or into iterators
+    strm = Stream(big_list).filter(lambda n: n % 3 == 0)
+    assert strm.take(3).to_list() == [0, 3, 6]
+    itr = iter(range(10))
+    assert Stream(itr).map(double).take(2).to_list() == [0, 2]
+    assert next(itr) == 2
+
+
+def test_sorted_take():
+    nums = [5, 3, 9, 1, 7, 3]
+    for key, reverse in [(None, False), (None, True), (lambda n: -n, False)]:
+        expected = sorted(nums, key=key, reverse=reverse)
+        strm = Stream(iter(nums)).sorted(key=key, reverse=reverse)
+        assert strm.take(3).to_list() == expected[:3]
+        nums_strm = Stream(nums).sorted(key=key, reverse=reverse)
+        assert nums_strm.map(str).take(4).to_list() == list(
+            map(str, expected[:4]))
+        assert nums_strm.slice(1, 4).to_list() == expected[1:4]
+        assert nums_strm.drop(2).to_list() == expected[2:]
+        assert nums_strm.first() == expected[0]
+
+    _, pipeline = Stream(nums).sorted().take(2)._pipeline.plan(nums)
+    assert not any(isinstance(trfmr.func, SortedOp)
+                   for trfmr in pipeline.transformers)
+
+
+def test_known_length_access():
+    calls = []
+
+    def double(n):
+        calls.append(n)
+        return n * 2
+
+    for source in ([5, 6, 7], (5, 6, 7), range(5, 8), Array([5, 6, 7])):
+        del calls[:]
+        strm = Stream(source).map(double).pluck_attr('real')
+        assert strm.len() == 3
+        assert strm[-1] == 14
+        assert strm[-3] == 10
+        assert strm.get(-2) == 12
+        assert strm.get(-4, 'none') == 'none'
+        assert strm.get_opt(-4) is Nothing
+        assert strm.last() == 14
+        assert strm.last_opt() == Some(14)
+        assert calls == [7, 5, 6, 7, 7]
+        with pytest.raises(IndexError):
+            strm[-4]
+
+    assert Stream([]).map(double).last_opt() is Nothing
+    with pytest.raises(IndexError):
+        Stream([]).map(double).last()
+
+    # length is not known
+    strm = Stream([5, 6, 7]).filter(lambda n: n > 5)
+    assert strm.len() == 2
+    assert strm.last() == 7
+    with pytest.raises(ValueError):
+        strm[-1]
+
+
+def test_pipeline_construction():
+    class ExpensiveRepr:
+        reprs = 0
+
+        def __contains__(self, elem):
+            return elem == 3
+
+        def __repr__(self):
+            ExpensiveRepr.reprs += 1
+            return 'ExpensiveRepr()'
+
+    strm = Stream.range(5).filter(ExpensiveRepr().__contains__)
+    for _ in range(3000):
+        strm = strm.map(op.pos)
+    assert len(strm._pipeline) == 3001
+    assert strm.to_list() == [3]
+    assert ExpensiveRepr.reprs == 0
+
+    assert str(strm._pipeline).startswith(
+        ' -> filter(<bound method test_pipeline_construction.<locals>.'
+        'ExpensiveRepr.__contains__ of ExpensiveRepr()>)')
+    assert ExpensiveRepr.reprs == 1
+
+    base = Stream.range(3).map(op.neg)
+    strm1, strm2 = base.map(str), base.map(abs)
+    assert strm1._pipeline.transformers[0] is base._pipeline.transformers[0]
+    assert strm1.to_list() == ['0', '-1', '-2']
+    assert strm2.to_list() == [0, 1, 2]
+    assert len(base._pipeline.extended(strm1._pipeline)) == 3
+    assert Pipeline().is_empty() and len(Pipeline()) == 0
+
+
+def test_aggregate():
+    from carriage.aggregator import (Count, CountDistinct, Max, Mean, Min,
+                                     Reduce, Sum)
+
+    consumed = []
+    strm = Stream([3, 5, 4, 3]).map(lambda n: consumed.append(n) or n)
+    result = strm.aggregate(total=Sum(), n=Count(), hi=Max(), lo=Min(),
+                            avg=Mean(), uniq=CountDistinct(),
+                            prod=Reduce(op.mul, 1))
+    assert result == Row(total=15, n=4, hi=5, lo=3, avg=3.75, uniq=3,
+                         prod=180)
+    assert consumed == [3, 5, 4, 3]
+
+    assert Stream(['a', 'bbb']).aggregate(
+        chars=Sum(key=len), longest=max) == Row(chars=4, longest='bbb')
+    assert Stream.range(10).in_batches(3).aggregate(
+        total=sum, n=len) == Row(total=45, n=10)
+    assert Stream([]).aggregate(
+        total=sum, avg=Mean(), hi=Max(default=0)) == Row(
+            total=0, avg=None, hi=0)
+
+    agg = Mean()
+    state1 = agg.add(agg.add(agg.create(), 1), 2)
+    state2 = agg.add(agg.create(), 6)
+    assert agg.result(agg.merge(state1, state2)) == 3
+
+    agg = Reduce(op.add, 10)
+    state1 = agg.add_batch(agg.create(), [1, 2])
+    state2 = agg.add(agg.add(agg.create(), 3), 4)
+    assert agg.result(agg.merge(state1, state2)) == 20
+    assert agg.result(agg.merge(agg.create(), agg.create())) == 10
+
+    with pytest.raises(TypeError):
+        Stream([1]).aggregate(x=print)
+
+
+def test_tee():
+    s1, s2, s3 = Stream.range(3).tee(3)
+    assert s1.to_list() == s2.to_list() == s3.to_list() == [0, 1, 2]
+
+
+def test_broadcast(tmpdir):
+    pulled = []
+
+    def source():
+        for n in range(10000):
+            pulled.append(n)
+            yield n
+
+    path = tmpdir / 'out.txt'
+    written, counts, head = Stream(source()).broadcast(
+        lambda s: s.map(str).write_txt(str(path)),
+        lambda s: s.map(lambda n: n % 3).value_counts(),
+        lambda s: s.take(3).to_list(),
+        chunksize=100, max_chunks_in_flight=2)
+    assert len(path.read_text('utf-8').splitlines()) == 10000
+    assert counts == {0: 3334, 1: 3333, 2: 3333}
+    assert head == [0, 1, 2]
+    assert len(pulled) == 10000
+
+    pulled.clear()
+    assert Stream(source()).broadcast(
+        Stream.first, lambda s: s.take(5).to_list(),
+        chunksize=10) == (0, [0, 1, 2, 3, 4])
+    assert len(pulled) < 10000
+
+    assert Stream.range(10).in_batches(3).broadcast(
+        Stream.sum, Stream.to_list) == (45, list(range(10)))
+
+    def failing_sink(strm):
+        raise RuntimeError('sink failed')
+
+    with pytest.raises(RuntimeError):
+        Stream.range(10000).broadcast(Stream.sum, failing_sink, chunksize=10)
+
+
+def test_external_sorted(monkeypatch):
+    import os
+    from carriage import spill
+
+    written = []
+    reading = Counter(now=0, peak=0)
+    write_run, read_run = spill._write_run, spill._read_run
+
+    def tracked_write_run(*args):
+        path = write_run(*args)
+        written.append(path)
+        return path
+
+    def tracked_read_run(path):
+        reading['now'] += 1
+        reading['peak'] = max(reading['peak'], reading['now'])
+        try:
+            yield from read_run(path)
+        finally:
+            reading['now'] -= 1
+
+    monkeypatch.setattr(spill, '_write_run', tracked_write_run)
+    monkeypatch.setattr(spill, '_read_run', tracked_read_run)
+
+    rows = [Row(n=n % 97, s=str(n)) for n in range(5000)]
+    strm = Stream(rows).sorted(key=lambda row: row.n, max_memory=10000)
+    assert strm.to_list() == sorted(rows, key=lambda row: row.n)
+    assert len(written) > 2
+    assert not any(map(os.path.exists, written))
+
+    written.clear()
+    assert (Stream.range(3000).sorted(reverse=True, max_memory=10000)
+            .to_list() == list(range(2999, -1, -1)))
+    assert Stream([2, 1]).sorted(max_memory=10000).to_list() == [1, 2]
+
+    head = iter(Stream.range(3000).sorted(max_memory=10000))
+    assert next(head) == 0
+    del head
+    written.clear()
+    assert Stream(rows).sorted(max_memory=10 ** 9).to_list() == sorted(rows)
+    assert written == []
+
+    # More runs than the fan-in are merged in several passes, keeping the
+    # sort stable and at most fan_in runs open at a time
+    assert reading['now'] == 0
+    reading['peak'] = 0
+    pairs = [(n % 7, n) for n in range(200)]
+    assert list(spill.external_sorted(
+        pairs, key=lambda pair: pair[0], max_memory=1, fan_in=3)) == sorted(
+            pairs, key=lambda pair: pair[0])
+    assert len(written) > 200 and reading['peak'] == 3
+    assert not any(map(os.path.exists, written))
+    with pytest.raises(ValueError):
+        list(spill.external_sorted([1], max_memory=1, fan_in=1))
+
+
+def test_cache(tmpdir):
+    calls = []
+
+    def parse(n):
+        calls.append(n)
+        return Row(n=n, s=str(n))
+
+    strm = Stream(iter(range(3000))).map(parse).cache(max_memory=10000)
+    assert len(calls) == 3000
+    assert strm.len() == 3000
+    assert strm.map(lambda row: row.n).sum() == sum(range(3000))
+    assert strm.take(2).to_list() == [Row(n=0, s='0'), Row(n=1, s='1')]
+    assert len(calls) == 3000
+    assert 0 < strm._iterable.spilled_count < 3000
+
+    path = tmpdir / 'segment'
+    strm = Stream.range(5).cache(path=str(path))
+    assert strm._iterable.spilled_count == 5
+    assert strm.to_list() == strm.to_list() == [0, 1, 2, 3, 4]
+    assert path.exists()
+
+    path.remove()
+    assert strm.len() == strm.map(str).len() == 5
+
+    strm = Stream.range(5).cache(max_memory=10000)
+    assert strm._iterable.spilled_count == 0
+    assert strm.to_list() == [0, 1, 2, 3, 4]
+
+    assert isinstance(Stream([1]).cache()._iterable, list)
+
+
+def test_group_by_agg():
+    from carriage.aggregator import Max, Mean, Sum
+
+    events = Stream([Row(user='a', amount=3), Row(user='b', amount=5),
+                     Row(user='a', amount=4)])
+    result = events.group_by_agg(
+        lambda row: row.user, n=len,
+        total=Sum(key=lambda row: row.amount),
+        avg=Mean(key=lambda row: row.amount),
+        top=Max(key=lambda row: row.amount))
+    assert result == {'a': Row(n=2, total=7, avg=3.5, top=4),
+                      'b': Row(n=1, total=5, avg=5.0, top=5)}
+    assert Stream.range(10).in_batches(4).group_by_agg(
+        lambda n: n % 2, total=sum) == {0: Row(total=20), 1: Row(total=25)}
+
+    lists = Stream.range(6).reduce_by_key(
+        lambda n: n % 2, [], lambda acc, n: acc + [n])
+    assert lists == {0: [0, 2, 4], 1: [1, 3, 5]}
+    appended = Stream.range(4).reduce_by_key(
+        lambda n: n % 2, [], lambda acc, n: acc.append(n) or acc)
+    assert appended == {0: [0, 2], 1: [1, 3]}
+    assert Array([3, 4]).reduce_by_key(
+        lambda n: n > 3, 0, op.add) == {False: 3, True: 4}
+
+
+@pytest.mark.parametrize('method', ['hash', 'merge'])
+@pytest.mark.parametrize('how', ['inner', 'left', 'right', 'outer'])
+def test_join(how, method):
+    left = [(1, 'a'), (2, 'b'), (2, 'c'), (4, 'd')]
+    right = [(2, 'x'), (3, 'y'), (4, 'z'), (4, 'w')]
+    key = op.itemgetter(0)
+
+    expected = {(2, (2, 'b'), (2, 'x')), (2, (2, 'c'), (2, 'x')),
+                (4, (4, 'd'), (4, 'z')), (4, (4, 'd'), (4, 'w'))}
+    if how in ('left', 'outer'):
+        expected.add((1, (1, 'a'), None))
+    if how in ('right', 'outer'):
+        expected.add((3, None, (3, 'y')))
+
+    joined = Stream(left).join(right, key=key, how=how, method=method)
+    assert Counter(map(tuple, joined)) == Counter(expected)
+
+    joined = Stream(left).join(Stream(right), key=key, how=how,
+                               method=method)
+    assert set(map(tuple, joined)) == expected
+
+
+def test_join_build_and_errors():
+    small = Stream.range(3)
+    large = Stream(iter(range(1, 100)))
+    assert small.join(large).map(lambda row: row.key).to_list() == [1, 2]
+    assert (Stream.range(100).join(range(98, 200)).to_list()
+            == [Row(key=98, left=98, right=98),
+                Row(key=99, left=99, right=99)])
+
+    # Output follows the streamed side, regardless of known lengths
+    left = Stream([5, 1, 3, 2])
+    keys = left.join([3, 5, 7], how='outer').map(lambda row: row.key)
+    assert keys.to_list() == [5, 1, 3, 2, 7]
+    keys = left.join(Stream.range(100), how='left').map(lambda row: row.key)
+    assert keys.to_list() == [5, 1, 3, 2]
+    keys = left.join([3, 5, 7], how='outer', build='left').map(
+        lambda row: row.key)
+    assert keys.to_list() == [3, 5, 7, 1, 2]
+
+    with pytest.raises(ValueError):
+        Stream.range(3).join([2, 1], method='merge').to_list()
+    with pytest.raises(ValueError):
+        Stream.range(3).join([1], how='cross')
+    with pytest.raises(ValueError):
+        Stream.range(3).join([1], method='nested')
+    with pytest.raises(ValueError):
+        Stream.range(3).join([1], build='both')
+
+
+def test_streamtable_join():
+    from carriage import StreamTable
+
+    users = StreamTable([Row(id=1, name='joe', city='a'),
+                         Row(id=2, name='may', city='b')])
+    orders = StreamTable([Row(id=1, item='tea', city='c'),
+                          Row(id=3, item='pie', city='d')])
+    joined = users.join(orders, on='id', how='outer', method='merge')
+    assert isinstance(joined, StreamTable)
+    assert joined.to_list() == [
+        Row(id=1, name='joe', city='a', item='tea', city_right='c'),
+        Row(id=2, name='may', city='b'),
+        Row(id=3, item='pie', city='d')]
+    assert users.join(orders, on=('id', 'city')).to_list() == []
+
+
+def test_partitioned_spilling():
+    words = Stream([f'w{n % 37}' for n in range(3000)])
+
+    unique = words.unique(partitions=4).to_list()
+    assert sorted(unique) == sorted(set(words))
+    distincted = words.distincted(lambda w: len(w), partitions=3).to_list()
+    assert sorted(map(len, distincted)) == [2, 3]
+
+    counts = words.value_counts_partitioned(5)
+    assert isinstance(counts, Stream)
+    assert dict(map(tuple, counts)) == words.value_counts()
+
+    groups = Stream.range(100).group_by_partitioned(lambda n: n % 7, 3)
+    assert {row.key: row.values for row in groups} == (
+        Stream.range(100).group_by_as_map(lambda n: n % 7))
+    assert groups.to_list() == groups.to_list()
+    assert 'group_by_partitioned(' in repr(groups)
+    assert 'value_counts_partitioned(5)' in repr(counts)
+
+    with pytest.raises(ValueError):
+        words.unique(partitions=0).to_list()
+
+
+def test_approx_sketches():
+    from carriage.aggregator import ApproxCountDistinct, ApproxValueCounts
+    from carriage.sketch import HeavyHitters, HyperLogLog
+
+    strm = Stream.range(200000).map(lambda n: f'user{n % 20000}')
+    estimate = strm.approx_count_distinct()
+    assert abs(estimate - 20000) / 20000 < 0.03
+
+    shards = [HyperLogLog().update(f'user{n}' for n in range(start, 20000, 4))
+              for start in range(4)]
+    merged = fnt.reduce(HyperLogLog.merge, shards)
+    assert merged.registers == HyperLogLog().update(
+        f'user{n}' for n in range(20000)).registers
+
+    skewed = Stream([n for n in range(50) for _ in range(n)] +
+                    list(range(1000, 3000)))
+    top = skewed.approx_value_counts(top_k=3, width=512)
+    assert list(top.keys()) == [49, 48, 47]
+    assert all(count >= real
+               for count, real in zip(top.values(), [49, 48, 47]))
+
+    left = HeavyHitters(top_k=2).update('aaabbc')
+    right = HeavyHitters(top_k=2).update('ccccbb')
+    assert left.merge(right).most_common() == [('c', 5), ('b', 4)]
+
+    result = Stream.range(1000).group_by_agg(
+        lambda n: n % 2, uniq=ApproxCountDistinct(precision=12),
+        top=ApproxValueCounts(top_k=1, key=lambda n: n % 10))
+    assert abs(result[0].uniq - 500) < 25
+    assert result[1].top == {1: 100}
+
+    with pytest.raises(ValueError):
+        HyperLogLog(10).merge(HyperLogLog(12))
+
+
+def test_stable_hash():
+    from fractions import Fraction
+    from carriage.sketch import HyperLogLog, stable_hash
+
+    assert stable_hash(1) == stable_hash(1.0) == stable_hash(True)
+    assert stable_hash(0.5) == stable_hash(Fraction(1, 2))
+    assert stable_hash((1, 'a')) == stable_hash(Row(x=1.0, y='a'))
+    assert stable_hash('1') != stable_hash(1)
+    assert stable_hash(('ab', 'c')) != stable_hash(('a', 'bc'))
+    assert HyperLogLog().update([1, 1.0, True]).count() == 1
+
+    from datetime import date, timedelta
+    from decimal import Decimal
+    days = [date(2019, 1, 1) + timedelta(n % 10) for n in range(100)]
+    assert Stream(days).approx_count_distinct() == 10
+    assert Stream(days).approx_value_counts(top_k=1) == {
+        date(2019, 1, 1): 10}
+    assert stable_hash(Decimal('0.5')) == stable_hash(0.5)
+    assert stable_hash(frozenset([1, 2])) == stable_hash(frozenset([2, 1.0]))
+    assert stable_hash((date(2019, 1, 1), 1)) == stable_hash(
+        (date(2019, 1, 1), 1.0))
+
+    with pytest.raises(TypeError):
+        stable_hash(object())
+    with pytest.raises(TypeError):
+        stable_hash(lambda: 0)
+    with pytest.raises(TypeError):
+        Stream([[1], [2]]).approx_count_distinct()
+
+
+def test_quantiles_and_histogram():
+    import random
+    from carriage.aggregator import ApproxQuantiles, aggregate
+    from carriage.sketch import Histogram, QuantileSketch
+
+    rand = random.Random(7)
+    latencies = [rand.expovariate(1 / 100) for _ in range(100000)]
+    ordered = sorted(latencies)
+    estimated = Stream(latencies).approx_quantiles([0.5, 0.9, 0.99])
+    for q, value in zip([0.5, 0.9, 0.99], estimated):
+        rank = ordered.index(value) / len(ordered)
+        assert abs(rank - q) < 0.02
+
+    shards = [QuantileSketch(seed=n).update(latencies[n::3])
+              for n in range(3)]
+    merged = fnt.reduce(QuantileSketch.merge, shards)
+    assert merged.count == len(latencies)
+    rank = ordered.index(merged.quantile(0.9)) / len(ordered)
+    assert abs(rank - 0.9) < 0.02
+    assert len(sum(merged.compactors, [])) < 1000
+
+    assert Stream([]).approx_quantiles([0.5]) is None
+    assert aggregate([], q=ApproxQuantiles([0.5])).q is None
+    with pytest.raises(ValueError):
+        QuantileSketch().quantiles([0.5])
+
+    hist = Stream(latencies).histogram(bins=4, bounds=(0, 400))
+    assert hist.map(lambda row: row.count).to_list() == [
+        sum(low <= lat < low + 100 for lat in latencies)
+        for low in (0, 100, 200, 300)]
+    approx = Stream(latencies).histogram(bins=4)
+    assert approx.map(lambda row: row.count).sum() == len(latencies)
+    assert approx.first().low == min(latencies)
+    assert Stream([]).histogram().to_list() == []
+
+    left = Histogram([0, 1, 2]).update([0, 1.5])
+    right = Histogram([0, 1, 2]).update([2, 3, -1])
+    merged_hist = left.merge(right)
+    assert merged_hist.bins() == [(0, 1, 1), (1, 2, 2)]
+    assert (merged_hist.under, merged_hist.over) == (1, 1)
+
+    constant = Stream([5, 5, 5]).histogram(bins=2)
+    assert all(row.low < row.high for row in constant)
+    assert constant.map(lambda row: row.count).sum() == 3
+    assert Stream([5, 5]).histogram(bins=1, bounds=(5, 5)).to_list() == [
+        Row(low=4.5, high=5.5, count=2)]
+    for edges in ([0, 2, 1], [0, 1, 1]):
+        with pytest.raises(ValueError):
+            Histogram(edges)
+    with pytest.raises(ValueError):
+        Stream([1]).histogram([3, 2])
+
+    with pytest.raises(ValueError):
+        QuantileSketch().quantile(0.5)
+
+
+def test_sampling():
+    strm = Stream.range(10000)
+    sample = strm.sample(100, seed=1)
+    assert sample.to_list() == sample.to_list()
+    assert len(set(sample.to_list())) == 100
+    assert all(0 <= elem < 10000 for elem in sample)
+    assert strm.sample(100, seed=2).to_list() != sample.to_list()
+
+    hits = Counter()
+    for seed in range(2000):
+        hits.update(Stream.range(10).sample(2, seed=seed))
+    assert all(300 < count < 500 for count in hits.values())
+
+    fraction = strm.sample_fraction(0.2, seed=1).to_list()
+    assert fraction == sorted(fraction)
+    assert 1700 < len(fraction) < 2300
+    assert strm.sample_fraction(0).to_list() == []
+    assert strm.sample_fraction(1).len() == 10000
+    with pytest.raises(ValueError):
+        strm.sample_fraction(1.5).to_list()
+
+    by_group = strm.sample_by(lambda n: n % 4, 10, seed=1).to_list()
+    assert Counter(n % 4 for n in by_group) == {0: 10, 1: 10, 2: 10, 3: 10}
+    assert Stream([1, 2, 2]).sample_by(
+        lambda n: n, 5).to_list() == [1, 2, 2]
+
+
+def test_row_schema():
+    import pickle
+    from carriage import Schema, StreamTable
+
+    rows = StreamTable.from_tuples([(1, 2), (3, 4)], fields=['x', 'y'])
+    row1, row2 = rows.to_list()
+    assert row1._schema is row2._schema is Schema(['x', 'y'])
+    assert Stream([{'x': 1}]).dict_as_row().first()._schema is Schema(('x',))
+    assert Stream.range(4).chunk(2).map(lambda row: row._schema).to_set() \
+        == {Schema(['f0', 'f1'])}
+
+    restored = pickle.loads(pickle.dumps(row1))
+    assert restored == row1 and list(restored.fields()) == ['x', 'y']
+    assert restored._schema is row1._schema
+    assert Row.from_values([1, 2], fields=['a', 'b', 'c']) == Row(a=1, b=2)
+    with pytest.raises(ValueError):
+        Schema(['a', 'a'])
+
+    assert row1.fields() == {'x', 'y'}
+    assert row1.fields() & {'y', 'z'} == {'y'}
+
+
+def test_row_duplicated_fields():
+    from carriage.row import namedrow
+
+    # The last value of a duplicated field is kept like keyword arguments
+    assert Row.from_values([1, 2, 3], fields=['x', 'y', 'x']) == Row(
+        x=3, y=2)
+    assert Row.from_values([1, 2, 3], fields=['x', 'y', 'x']).fields() == (
+        Row(x=3, y=2).fields())
+    assert Stream([(1, 2)]).tuple_as_row(['x', 'x']).to_list() == [Row(x=2)]
+    assert Stream([{'x': 1}]).dict_as_row(['x', 'x']).to_list() == [Row(x=1)]
+    assert namedrow('x', 'x')(1, 2) == Row(x=2)
+    assert namedrow('x', 'y', 'x')(x=1, y=2) == Row(x=1, y=2)
+
+
+def test_schema_interning_is_weak():
+    import gc
+    from carriage import Schema
+
+    rows = [Row.from_dict({f'field_{i}': i}) for i in range(100)]
+    assert Schema(('field_3',)) is rows[3]._schema
+    before = len(Schema._interned)
+    del rows
+    gc.collect()
+    assert len(Schema._interned) <= before - 100
+
+
+def test_row_attribute_access():
+    row = Row(x=1, count=2, fields=3)
+    assert (row.x, row.count, row.fields) == (1, 2, 3)
+    assert row.evolve(x=4) == Row(x=4, count=2, fields=3)
+    assert row.to_dict() == {'x': 1, 'count': 2, 'fields': 3}
+    assert isinstance(row, Row) and not hasattr(row, '__dict__')
+    assert type(row) is type(Row(x=5, count=6, fields=7))
+    assert type(row) is not type(Row(x=1))
+    with pytest.raises(AttributeError):
+        Row(x=1).y
+    with pytest.raises(TypeError):
+        row.x = 5
+
+
+def test_row_special_field_names():
+    row = Row(__len__=3, y=1)
+    assert len(row) == 2 and row.get('__len__') == 3 and row.y == 1
+    row = Row(_schema=1, __class__=2, __foo__=3, **{'first name': 4})
+    assert type(row).__name__ == 'Row' and row._schema.fields == (
+        '_schema', '__class__', '__foo__', 'first name')
+    assert row.__foo__ == 3 and getattr(row, 'first name') == 4
+    assert row.to_dict() == {'_schema': 1, '__class__': 2, '__foo__': 3,
+                             'first name': 4}
+    row = Row(count=1, index=2)
+    assert (row.count, row.index) == (1, 2)
+    assert callable(Row(x=1).count)
+
+
+def test_row_plans():
+    row = Row(x=1, y=2, z=3)
+    assert row.project('z', 'x', 'w') == Row(x=1, z=3)
+    assert list(row.project('z', 'x').fields()) == ['x', 'z']
+    assert row.project() == Row() and row.project('y') == Row(y=2)
+    assert list(row.without('x', 'w').fields()) == ['y', 'z']
+    assert row.evolve(y=5, u=6) == Row(x=1, y=5, z=3, u=6)
+    assert list(row.evolve(y=5, u=6).fields()) == ['x', 'y', 'z', 'u']
+    assert row.evolve() == row
+    assert row.merge(Row(z=4, w=5), Row(x=6)).to_dict() == {
+        'x': 6, 'y': 2, 'z': 4, 'w': 5}
+    assert row.rename_fields(x='y', y='v').to_dict() == {'y': 1, 'v': 2,
+                                                         'z': 3}
+    assert row.transform(x=lambda x: x * 10) == Row(x=10, y=2, z=3)
+    assert Row(y=2, x=1).project('x') == Row(x=1)
+
+
+def test_columnar_streamtable():
+    import array
+    import numpy as np
+
+    from carriage import StreamTable, X
+    from carriage.aggregator import Max, Mean, Sum
+    from carriage.columnar import RecordBatch
+
+    rows = [Row(x=x, y=x % 3, tags=list(range(x % 3))) for x in range(10)]
+    row_table = StreamTable(rows)
+    for table in [StreamTable(rows).in_batches(4),
+                  StreamTable.from_columns({
+                      'x': np.arange(10), 'y': array.array('q', [
+                          x % 3 for x in range(10)]),
+                      'tags': [list(range(x % 3)) for x in range(10)]},
+                      batch_size=4)]:
+        assert table.to_list() == row_table.to_list()
+        assert (table.where(X.x > 2, y=1).to_list() ==
+                row_table.where(X.x > 2, y=1).to_list())
+        assert (table.select('y', z=X.x * 2, c=0).to_list() ==
+                row_table.select('y', z=X.x * 2, c=0).to_list())
+        assert (table.map_fields(x=X.y, w=X.x).to_list() ==
+                row_table.map_fields(x=X.y, w=X.x).to_list())
+        assert (table.explode('tags').to_list() ==
+                row_table.explode('tags').to_list())
+        assert (table.where(y=5).explode('tags').to_list() == [])
+        for strm in (table, row_table):
+            with pytest.raises(AttributeError):
+                strm.where(z=1).to_list()
+        assert table.where(y=5, z=1).to_list() == []
+        aggs = dict(n=len, total=Sum(key=X.x), hi=Max(key=X.y),
+                    avg=Mean(key=X.x))
+        assert table.aggregate(**aggs) == row_table.aggregate(**aggs)
+        assert table.where(y=5).aggregate(**aggs) == Row(
+            n=0, total=0, hi=None, avg=None)
+        pd.testing.assert_frame_equal(
+            table.select('x', 'y').to_dataframe(),
+            row_table.select('x', 'y').to_dataframe(), check_dtype=False)
+
+    mixed = StreamTable([Row(x=1), Row(y=2), Row(y=3)]).in_batches(2)
+    assert mixed.map_fields(z=lambda row: row.get('x', 0) + 1).to_list() == [
+        Row(x=1, z=2), Row(y=2, z=1), Row(y=3, z=1)]
+
+    batch = RecordBatch.from_columns({'x': np.array([1, 2, 3])})
+    assert [b.column('x').tolist() for b in batch.iter_batches(2)] == [
+        [1, 2], [3]]
+    assert len(batch.filter([0, 1, 1])) == 2
+    assert len(RecordBatch.from_rows([Row(), Row()])) == 2
+    assert list(RecordBatch.from_rows([Row(), Row()])) == [Row(), Row()]
+    with pytest.raises(ValueError):
+        RecordBatch.from_columns({'x': [1, 2], 'y': [1]})
+
+
+def test_custom_aggregator_in_batches():
+    from carriage import StreamTable, X
+    from carriage.aggregator import Aggregator
+
+    class Cnt(Aggregator):
+        def create(self):
+            return 0
+
+        def add(self, state, elem):
+            if self.key is not None:
+                elem = self.key(elem)
+            return state + (elem is not None)
+
+        def merge(self, state, other_state):
+            return state + other_state
+
+    table = StreamTable.from_tuples([(1,), (None,), (3,)], fields=['x'])
+    expected = table.aggregate(n=Cnt(), m=Cnt(key=X.x))
+    assert expected == Row(n=3, m=2)
+    assert table.in_batches(2).aggregate(n=Cnt(), m=Cnt(key=X.x)) == expected
+    assert StreamTable.from_columns(
+        {'x': [1, None, 3]}).aggregate(n=Cnt(), m=Cnt(key=X.x)) == expected